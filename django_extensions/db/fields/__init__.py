@@ -4,8 +4,10 @@ Django Extensions additional model fields
 Some fields might require additional dependencies to be installed.
 """
 
+import math
 import re
 import string
+import time
 
 try:
     import uuid
@@ -23,19 +25,29 @@ except ImportError:
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
 from django.db.models import DateTimeField, CharField, SlugField, Q, UniqueConstraint
 from django.db.models.constants import LOOKUP_SEP
 from django.template.defaultfilters import slugify
 from django.utils.crypto import get_random_string
 from django.utils.encoding import force_str
+from django.utils.hashable import make_hashable
 
 
 MAX_UNIQUE_QUERY_ATTEMPTS = getattr(
     settings, "EXTENSIONS_MAX_UNIQUE_QUERY_ATTEMPTS", 100
 )
+UNIQUE_QUERY_BATCH_SIZE = getattr(settings, "EXTENSIONS_UNIQUE_QUERY_BATCH_SIZE", 100)
 
 
 class UniqueFieldMixin:
+    # number of candidates checked per query in find_unique, fields using the
+    # mixin opt into batched probing by raising it or by setting it to None and
+    # overriding get_unique_query_batch_size
+    unique_query_batch_size = 1
+    # maximum number of candidates passed to a single ``__in`` lookup
+    bulk_query_chunk_size = 500
+
     def check_is_bool(self, attrname):
         if not isinstance(getattr(self, attrname), bool):
             raise ValueError("'{}' argument must be True or False".format(attrname))
@@ -54,13 +66,12 @@ class UniqueFieldMixin:
                 return model._default_manager.all()
         return model_cls._default_manager.all()
 
-    def find_unique(self, model_instance, field, iterator, *args):
-        # exclude the current model instance from the queryset used in finding
-        # next valid hash
-        queryset = self.get_queryset(model_instance.__class__, field)
-        if model_instance.pk:
-            queryset = queryset.exclude(pk=model_instance.pk)
-
+    def get_unique_lookups(self, model_instance):
+        """
+        Return the kwargs and Q object restricting the uniqueness check of
+        this field to the unique_together and UniqueConstraint scope of
+        model_instance.
+        """
         # form a kwarg dict used to implement any unique_together constraints
         kwargs = {}
         for params in model_instance._meta.unique_together:
@@ -84,14 +95,202 @@ class UniqueFieldMixin:
                     }
                     query &= Q(**condition)
 
-        new = next(iterator)
-        kwargs[self.attname] = new
-        while not new or queryset.filter(query, **kwargs):
+        return kwargs, query
+
+    def find_unique(self, model_instance, field, iterator, *args):
+        # exclude the current model instance from the queryset used in finding
+        # next valid hash
+        queryset = self.get_queryset(model_instance.__class__, field)
+        if model_instance.pk:
+            queryset = queryset.exclude(pk=model_instance.pk)
+
+        kwargs, query = self.get_unique_lookups(model_instance)
+
+        if self.unique_query_batch_size == 1:
             new = next(iterator)
             kwargs[self.attname] = new
+            while not new or queryset.filter(query, **kwargs):
+                new = next(iterator)
+                kwargs[self.attname] = new
+            setattr(model_instance, self.attname, new)
+            return new
+
+        kwargs.pop(self.attname, None)
+        new = self.find_unique_in_batches(
+            queryset.filter(query, **kwargs), iterator, model_instance
+        )
         setattr(model_instance, self.attname, new)
         return new
 
+    @staticmethod
+    def take_candidates(iterator, count):
+        """
+        Take up to count candidates from iterator.
+
+        Return the candidates and the exception which ended the iterator, if
+        it got exhausted.
+        """
+        candidates = []
+        while len(candidates) < count:
+            try:
+                candidate = next(iterator)
+            except (StopIteration, RuntimeError) as e:
+                return candidates, e
+            if candidate and candidate not in candidates:
+                candidates.append(candidate)
+        return candidates, None
+
+    def is_unique_case_insensitive(self, queryset):
+        """
+        Return whether values differing only in case collide because the
+        column collation ignores case.
+        """
+        collation = (getattr(self, "db_collation", None) or "").lower()
+        if collation:
+            return "_ci" in collation or collation == "nocase"
+        return connections[queryset.db].vendor == "mysql"
+
+    def get_unique_value_key(self, queryset):
+        """Return a function mapping values to the key they collide on."""
+        if self.is_unique_case_insensitive(queryset):
+            return lambda value: force_str(value).lower()
+        return force_str
+
+    def get_taken_values(self, queryset, candidates, model_instance=None):
+        """
+        Return the keys of the candidates already present in queryset, the
+        unique scope of model_instance.
+
+        See get_unique_value_key(), values are only compared
+        case-insensitively when the database would consider them duplicates.
+        """
+        key = self.get_unique_value_key(queryset)
+        taken = set()
+        candidates = list(candidates)
+        chunk_size = self.bulk_query_chunk_size
+        for i in range(0, len(candidates), chunk_size):
+            lookup = {"%s__in" % self.attname: candidates[i : i + chunk_size]}
+            taken.update(
+                key(value)
+                for value in queryset.filter(**lookup).values_list(
+                    self.attname, flat=True
+                )
+            )
+        return taken
+
+    def get_unique_query_batch_size(self, model_instance):
+        """Return the number of candidates to check with a single query."""
+        return self.unique_query_batch_size or 1
+
+    def find_unique_in_batches(self, queryset, iterator, model_instance):
+        """
+        Probe candidates from iterator a batch at a time with a single
+        ``__in`` query per batch and return the first candidate not taken.
+        """
+        while True:
+            batch_size = self.get_unique_query_batch_size(model_instance)
+            candidates, exhausted = self.take_candidates(iterator, batch_size)
+            if candidates:
+                key = self.get_unique_value_key(queryset)
+                taken = self.get_taken_values(queryset, candidates, model_instance)
+                for candidate in candidates:
+                    if key(candidate) not in taken:
+                        return candidate
+
+            if exhausted is not None:
+                raise exhausted
+
+    def find_unique_bulk(
+        self, instances, get_iterator, get_key=id, extra=0, initial_extra=0
+    ):
+        """
+        Bulk counterpart of find_unique, set a unique value on every instance.
+
+        Instances with the same unique scope and the same get_key() share one
+        candidate iterator created by get_iterator(). Every round takes enough
+        candidates for all pending instances (plus initial_extra per iterator
+        in the first round and extra afterwards) and checks them against the
+        database with a single ``__in`` query per scope, collisions within the
+        batch are resolved in memory.
+        """
+        scopes = {}
+        for instance in instances:
+            kwargs, query = self.get_unique_lookups(instance)
+            kwargs.pop(self.attname, None)
+            scope = scopes.setdefault(
+                (make_hashable(kwargs), query), (kwargs, query, {})
+            )
+            entries = scope[2]
+            key = get_key(instance)
+            if key not in entries:
+                entries[key] = (get_iterator(instance), [])
+            entries[key][1].append(instance)
+
+        for kwargs, query, entries in scopes.values():
+            scope_instance = next(iter(entries.values()))[1][0]
+            model_cls = scope_instance.__class__
+            field = model_cls._meta.get_field(self.attname)
+            queryset = self.get_queryset(model_cls, field).filter(query, **kwargs)
+            pks = [i.pk for _, pending in entries.values() for i in pending if i.pk]
+            if pks:
+                queryset = queryset.exclude(pk__in=pks)
+
+            key = self.get_unique_value_key(queryset)
+            taken = set()
+            checked = set()
+            pending_entries = list(entries.values())
+            extra_candidates = initial_extra
+            while pending_entries:
+                windows = [
+                    self.take_candidates(iterator, len(pending) + extra_candidates)
+                    for iterator, pending in pending_entries
+                ]
+                unchecked = {
+                    candidate
+                    for candidates, _ in windows
+                    for candidate in candidates
+                    if candidate not in checked
+                }
+                taken |= self.get_taken_values(queryset, unchecked, scope_instance)
+                checked |= unchecked
+
+                still_pending = []
+                for (iterator, pending), (candidates, exhausted) in zip(
+                    pending_entries, windows
+                ):
+                    candidates = iter(candidates)
+                    while pending:
+                        candidate = next(candidates, None)
+                        if candidate is None:
+                            break
+                        if key(candidate) in taken:
+                            continue
+                        taken.add(key(candidate))
+                        instance = pending.pop(0)
+                        setattr(instance, self.attname, candidate)
+                        self.mark_bulk_prepared(instance)
+                    if pending:
+                        if exhausted is not None:
+                            raise exhausted
+                        still_pending.append((iterator, pending))
+                pending_entries = still_pending
+                extra_candidates = extra
+
+    def mark_bulk_prepared(self, model_instance):
+        """
+        Remember that the value of this field has been set by prepare_bulk so
+        that the next pre_save() keeps it instead of generating a new one.
+        """
+        prepared = model_instance.__dict__.setdefault("_bulk_prepared_fields", set())
+        prepared.add(self.attname)
+
+    def pop_bulk_prepared(self, model_instance):
+        prepared = model_instance.__dict__.get("_bulk_prepared_fields", ())
+        if self.attname in prepared:
+            prepared.discard(self.attname)
+            return True
+        return False
+
 
 class AutoSlugField(UniqueFieldMixin, SlugField):
     """
@@ -121,6 +320,11 @@ class AutoSlugField(UniqueFieldMixin, SlugField):
         Defines the function which will be used to "slugify" a content
         (default: :py:func:`~django.template.defaultfilters.slugify` )
 
+    unique_query_batch_size
+        Number of candidate slugs checked for uniqueness with a single query,
+        set to 1 to check one candidate per query
+        (default: EXTENSIONS_UNIQUE_QUERY_BATCH_SIZE or 100)
+
     It is possible to provide custom "slugify" function with
     the ``slugify_function`` function in a model class.
 
@@ -180,6 +384,9 @@ class AutoSlugField(UniqueFieldMixin, SlugField):
         self.max_unique_query_attempts = kwargs.pop(
             "max_unique_query_attempts", MAX_UNIQUE_QUERY_ATTEMPTS
         )
+        self.unique_query_batch_size = kwargs.pop(
+            "unique_query_batch_size", UNIQUE_QUERY_BATCH_SIZE
+        )
         super().__init__(*args, **kwargs)
 
     def _slug_strip(self, value):
@@ -216,7 +423,7 @@ class AutoSlugField(UniqueFieldMixin, SlugField):
             % (original_slug, self.max_unique_query_attempts)
         )
 
-    def create_slug(self, model_instance, add):
+    def use_existing_slug(self, model_instance, add):
         slug = getattr(model_instance, self.attname)
         use_existing_slug = False
         if slug and not self.overwrite:
@@ -227,9 +434,9 @@ class AutoSlugField(UniqueFieldMixin, SlugField):
         if self.overwrite_on_add and add:
             use_existing_slug = False
 
-        if use_existing_slug:
-            return slug
+        return use_existing_slug
 
+    def get_original_slug(self, model_instance):
         # get fields to populate from and slug field to set
         populate_from = self._populate_from
         if not isinstance(populate_from, (list, tuple)):
@@ -240,30 +447,64 @@ class AutoSlugField(UniqueFieldMixin, SlugField):
             model_instance, "slugify_function", self.slugify_function
         )
 
-        # slugify the original field content and set next step to 2
+        # slugify the original field content
         slug_for_field = lambda lookup_value: self.slugify_func(
             self.get_slug_fields(model_instance, lookup_value),
             slugify_function=slugify_function,
         )
         slug = self.separator.join(map(slug_for_field, populate_from))
-        start = 2
 
         # strip slug depending on max_length attribute of the slug field
         # and clean-up
         self.slug_len = slug_field.max_length
         if self.slug_len:
             slug = slug[: self.slug_len]
-        slug = self._slug_strip(slug)
-        original_slug = slug
+        return self._slug_strip(slug)
+
+    def create_slug(self, model_instance, add):
+        if self.use_existing_slug(model_instance, add):
+            return getattr(model_instance, self.attname)
+
+        slug_field = model_instance._meta.get_field(self.attname)
+        original_slug = self.get_original_slug(model_instance)
+        # set next step to 2
+        start = 2
 
         if self.allow_duplicates:
-            setattr(model_instance, self.attname, slug)
-            return slug
+            setattr(model_instance, self.attname, original_slug)
+            return original_slug
 
         return self.find_unique(
             model_instance, slug_field, self.slug_generator(original_slug, start)
         )
 
+    def prepare_bulk(self, instances):
+        """
+        Populate the slugs of a batch of new instances, e.g. before
+        ``bulk_create()``, using a constant number of queries per batch.
+
+        Instances sharing the same original slug get consecutive free
+        suffixes, exactly as if they had been saved one after the other.
+        """
+        original_slugs = {}
+        for model_instance in instances:
+            if self.use_existing_slug(model_instance, True):
+                continue
+            original_slug = self.get_original_slug(model_instance)
+            if self.allow_duplicates:
+                setattr(model_instance, self.attname, original_slug)
+                self.mark_bulk_prepared(model_instance)
+            else:
+                original_slugs[id(model_instance)] = (model_instance, original_slug)
+
+        if original_slugs:
+            self.find_unique_bulk(
+                [model_instance for model_instance, _ in original_slugs.values()],
+                lambda i: self.slug_generator(original_slugs[id(i)][1], 2),
+                get_key=lambda i: original_slugs[id(i)][1],
+                extra=self.unique_query_batch_size,
+            )
+
     def get_slug_fields(self, model_instance, lookup_value):
         if callable(lookup_value):
             # A function has been provided
@@ -286,6 +527,8 @@ class AutoSlugField(UniqueFieldMixin, SlugField):
         return attr
 
     def pre_save(self, model_instance, add):
+        if self.pop_bulk_prepared(model_instance):
+            return force_str(getattr(model_instance, self.attname))
         value = force_str(self.create_slug(model_instance, add))
         return value
 
@@ -337,8 +580,20 @@ class RandomCharField(UniqueFieldMixin, CharField):
 
     keep_default
         If set to True, keeps the default initialization value (default: False)
+
+    unique_query_batch_size
+        Number of random candidates checked for uniqueness with a single query
+        (default: None, derived from the estimated share of used values)
     """
 
+    # acceptable probability that all candidates checked by a single query
+    # are already taken
+    unique_query_miss_probability = 0.001
+    # seconds before the row count used to estimate the share of used values
+    # is refreshed, and number of unique scopes whose row count is cached
+    occupancy_cache_timeout = 60
+    occupancy_cache_size = 1000
+
     def __init__(self, *args, **kwargs):
         kwargs.setdefault("blank", True)
         kwargs.setdefault("editable", False)
@@ -366,6 +621,8 @@ class RandomCharField(UniqueFieldMixin, CharField):
         self.max_unique_query_attempts = kwargs.pop(
             "max_unique_query_attempts", MAX_UNIQUE_QUERY_ATTEMPTS
         )
+        self.unique_query_batch_size = kwargs.pop("unique_query_batch_size", None)
+        self._occupancy = {}
 
         # Set unique=False unless it's been set manually.
         if "unique" not in kwargs:
@@ -387,12 +644,75 @@ class RandomCharField(UniqueFieldMixin, CharField):
                 return True
         return False
 
-    def pre_save(self, model_instance, add):
-        if (not add or self.keep_default) and getattr(
-            model_instance, self.attname
-        ) != "":
-            return getattr(model_instance, self.attname)
+    def get_occupancy_scope(self, model_instance):
+        """
+        Return the rows sharing the unique scope of model_instance and the key
+        their count is cached under.
+
+        Models inheriting the field share it, so the key holds the model the
+        rows are counted on along with the unique_together and
+        UniqueConstraint values of the scope.
+        """
+        kwargs, query = self.get_unique_lookups(model_instance)
+        kwargs.pop(self.attname, None)
+        model_cls = model_instance.__class__
+        field = model_cls._meta.get_field(self.attname)
+        queryset = self.get_queryset(model_cls, field).filter(query, **kwargs)
+        return queryset, (queryset.model._meta.label, make_hashable(kwargs), query)
+
+    def estimate_occupancy(self, model_instance):
+        """
+        Return the estimated share of possible values already in use within
+        the unique scope of model_instance, counting its rows at most once per
+        occupancy_cache_timeout.
+        """
+        queryset, key = self.get_occupancy_scope(model_instance)
+        now = time.monotonic()
+        cached = self._occupancy.get(key)
+        if cached is None or now - cached[0] > self.occupancy_cache_timeout:
+            self._occupancy.pop(key, None)
+            while len(self._occupancy) >= self.occupancy_cache_size:
+                self._occupancy.pop(next(iter(self._occupancy)), None)
+            cached = self._occupancy[key] = (now, queryset.count())
+        keyspace = len(set(self.get_population())) ** self.length
+        return cached[1] / keyspace
+
+    def get_unique_query_batch_size(self, model_instance):
+        """
+        Return the number of candidates to check with a single query.
 
+        Unless set explicitly it is scaled with the share of used values, so
+        that all candidates of a batch are taken with a probability of at most
+        unique_query_miss_probability. Until a collision has been seen the
+        scope is not counted and candidates are checked one at a time.
+        """
+        if self.unique_query_batch_size:
+            return self.unique_query_batch_size
+        if self.get_occupancy_scope(model_instance)[1] not in self._occupancy:
+            return 1
+
+        occupancy = self.estimate_occupancy(model_instance)
+        if occupancy <= 0:
+            return 1
+        if occupancy >= 1:
+            return self.max_unique_query_attempts
+        batch_size = math.ceil(
+            math.log(self.unique_query_miss_probability) / math.log(occupancy)
+        )
+        return max(1, min(batch_size, self.max_unique_query_attempts))
+
+    def get_taken_values(self, queryset, candidates, model_instance=None):
+        taken = super().get_taken_values(queryset, candidates, model_instance)
+        if (
+            taken
+            and self.unique_query_batch_size is None
+            and model_instance is not None
+        ):
+            # start (or refresh) estimating the occupancy once values collide
+            self.estimate_occupancy(model_instance)
+        return taken
+
+    def get_population(self):
         population = ""
         if self.include_alpha:
             if self.lowercase:
@@ -408,7 +728,18 @@ class RandomCharField(UniqueFieldMixin, CharField):
         if self.include_punctuation:
             population += string.punctuation
 
-        random_chars = self.random_char_generator(population)
+        return population
+
+    def pre_save(self, model_instance, add):
+        if self.pop_bulk_prepared(model_instance):
+            return getattr(model_instance, self.attname)
+
+        if (not add or self.keep_default) and getattr(
+            model_instance, self.attname
+        ) != "":
+            return getattr(model_instance, self.attname)
+
+        random_chars = self.random_char_generator(self.get_population())
         if not self.unique and not self.in_unique_together(model_instance):
             new = next(random_chars)
             setattr(model_instance, self.attname, new)
@@ -420,6 +751,33 @@ class RandomCharField(UniqueFieldMixin, CharField):
             random_chars,
         )
 
+    def prepare_bulk(self, instances):
+        """
+        Populate the random values of a batch of new instances, e.g. before
+        ``bulk_create()``, checking uniqueness against the database and the
+        rest of the batch with one query per round.
+        """
+        population = self.get_population()
+        unique_instances = []
+        for model_instance in instances:
+            if self.keep_default and getattr(model_instance, self.attname) != "":
+                continue
+            if self.unique or self.in_unique_together(model_instance):
+                unique_instances.append(model_instance)
+            else:
+                value = next(self.random_char_generator(population))
+                setattr(model_instance, self.attname, value)
+                self.mark_bulk_prepared(model_instance)
+
+        if unique_instances:
+            extra = self.get_unique_query_batch_size(unique_instances[0]) - 1
+            self.find_unique_bulk(
+                unique_instances,
+                lambda i: self.random_char_generator(population),
+                extra=extra,
+                initial_extra=extra,
+            )
+
     def internal_type(self):
         return "CharField"
 
@@ -576,6 +934,17 @@ class UUIDFieldMixin:
 
         return value
 
+    def prepare_bulk(self, instances):
+        """
+        Populate the UUIDs of a batch of new instances, e.g. before
+        ``bulk_create()``.
+        """
+        if not self.auto:
+            return
+        for model_instance in instances:
+            if not getattr(model_instance, self.attname):
+                setattr(model_instance, self.attname, force_str(self.create_uuid()))
+
     def formfield(self, form_class=None, choices_form_class=None, **kwargs):
         if self.auto:
             return None
@@ -66,6 +66,50 @@ class TitleSlugDescriptionModel(TitleDescriptionModel):
         abstract = True
 
 
+class PrepareBulkQuerySet(models.query.QuerySet):
+    """
+    PrepareBulkQuerySet
+
+    Query set whose bulk_create() populates AutoSlugField, RandomCharField
+    and UUID fields for the whole batch before inserting it
+    """
+
+    def prepare_bulk(self, objs):
+        """Populate the generated fields of objs, returns objs"""
+        objs = list(objs)
+        for field in self.model._meta.concrete_fields:
+            prepare_bulk = getattr(field, "prepare_bulk", None)
+            if prepare_bulk is not None:
+                prepare_bulk(objs)
+        return objs
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Populate the generated fields of objs and insert them"""
+        return super().bulk_create(self.prepare_bulk(objs), *args, **kwargs)
+
+
+class PrepareBulkManager(models.Manager):
+    """
+    PrepareBulkManager
+
+    Manager populating generated fields on bulk creation:
+        SomeModel.objects.bulk_create(objs), proxy to PrepareBulkQuerySet
+    """
+
+    def get_queryset(self):
+        """Use PrepareBulkQuerySet for all results"""
+        return PrepareBulkQuerySet(model=self.model, using=self._db)
+
+    def prepare_bulk(self, objs):
+        """
+        Populate the generated fields of objs without saving them:
+
+        SomeModel.objects.prepare_bulk(objs), proxy to
+        PrepareBulkQuerySet.prepare_bulk
+        """
+        return self.get_queryset().prepare_bulk(objs)
+
+
 class ActivatorQuerySet(models.query.QuerySet):
     """
     ActivatorQuerySet
@@ -0,0 +1,279 @@
+"""
+anonymize_data.py
+
+    Anonymize model data in place as declared by the ANONYMIZE_DATA setting.
+    Useful for scrubbing a copy of a production database before using it for
+    testing or development. As such, this command is only available when
+    setting.DEBUG is True.
+
+"""
+
+import random
+import re
+from typing import List
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, CharField, F, TextField, Value, When
+from django.db.models.functions import Concat, Left, SHA256
+from django.utils.crypto import salted_hmac
+
+from django_extensions.management.utils import (
+    add_parallel_argument,
+    compile_template,
+    map_in_threads,
+    signalcommand,
+)
+
+DEFAULT_CHUNK_SIZE = 1000
+STRATEGIES = ("constant", "template", "hash", "shuffle", "null")
+# %(name) followed by any conversion, or an escaped %%
+TEMPLATE_FIELD_RE = re.compile(r"%(?:%|\((\w+)\))")
+
+
+def parse_strategy(spec):
+    """
+    Return (name, argument) for a strategy given either as its name or as a
+    (name, argument) tuple.
+    """
+    if isinstance(spec, str):
+        return spec, None
+    try:
+        name, argument = spec
+    except (TypeError, ValueError):
+        return None, None
+    return name, argument
+
+
+def get_template_fields(template):
+    """Return the names of the fields used by a %-format template."""
+    return {name for name in TEMPLATE_FIELD_RE.findall(template) if name}
+
+
+class ModelAnonymizer:
+    """
+    Anonymize the fields of one model.
+
+    Strategies that can be expressed in SQL (constant, null, hash and most
+    templates) are applied with an UPDATE, the others (shuffle and templates
+    using other formatting) with bulk_update(). Both run over chunks of rows
+    delimited by primary key ranges. Shuffled fields are the exception: their
+    values are shuffled over the whole table and so held in memory at once.
+    """
+
+    def __init__(self, model, strategies, salt):
+        self.model = model
+        self.label = model._meta.label
+        self.updates = {}
+        self.templates = {}
+        self.shuffled = []
+        field_names = [field.attname for field in model._meta.concrete_fields]
+        field_names.append("pk")
+
+        fields = {}
+        for name in strategies:
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise CommandError("%s has no field named '%s'" % (self.label, name))
+            if not field.concrete or field.primary_key or field.many_to_many:
+                raise CommandError("%s.%s cannot be anonymized" % (self.label, name))
+            fields[name] = field
+        anonymized = {field.attname for field in fields.values()} | set(fields)
+
+        for name, spec in strategies.items():
+            field = fields[name]
+
+            strategy, argument = parse_strategy(spec)
+            if strategy not in STRATEGIES:
+                raise CommandError(
+                    "Unknown strategy for %s.%s: %r" % (self.label, name, spec)
+                )
+            if strategy == "constant":
+                self.updates[field.attname] = Value(argument, output_field=field)
+            elif strategy == "null":
+                if not field.null:
+                    raise CommandError("%s.%s is not nullable" % (self.label, name))
+                self.updates[field.attname] = Value(None, output_field=field)
+            elif strategy == "hash":
+                if not isinstance(field, (CharField, TextField)):
+                    raise CommandError(
+                        "%s.%s: only text fields can be hashed" % (self.label, name)
+                    )
+                self.updates[field.attname] = self.get_hash_expression(field, salt)
+            elif strategy == "template":
+                if not isinstance(argument, str):
+                    raise CommandError(
+                        "%s.%s: template strategy requires a template"
+                        % (self.label, name)
+                    )
+                used = get_template_fields(argument)
+                unknown = used - set(field_names)
+                if unknown:
+                    raise CommandError(
+                        "%s.%s: unknown template fields: %s"
+                        % (self.label, name, ", ".join(sorted(unknown)))
+                    )
+                # every strategy is applied at once and would see the
+                # original, not the anonymized, values
+                leaked = used & anonymized
+                if leaked:
+                    raise CommandError(
+                        "%s.%s: template uses anonymized fields: %s"
+                        % (self.label, name, ", ".join(sorted(leaked)))
+                    )
+                expression = compile_template(argument, field_names)
+                if expression is not None:
+                    self.updates[field.attname] = expression
+                else:
+                    self.templates[field.attname] = argument
+            else:
+                self.shuffled.append(field.attname)
+
+    def get_hash_expression(self, field, salt):
+        expression = SHA256(Concat(Value(salt), F(field.attname)))
+        if field.max_length and field.max_length < 64:
+            expression = Left(expression, field.max_length)
+        return Case(
+            When(**{"%s__isnull" % field.attname: True}, then=Value(None)),
+            default=expression,
+            output_field=field,
+        )
+
+    def anonymize(self, using, chunk_size, verbosity=1):
+        """Anonymize all rows and return their number."""
+        queryset = self.model._base_manager.using(using).order_by("pk")
+        python_fields = self.shuffled + list(self.templates)
+        shuffled = self.get_shuffled_values(queryset)
+        count = 0
+        last_pk = None
+        while True:
+            remaining = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            pks = list(remaining.values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                break
+            chunk = queryset.filter(pk__gte=pks[0], pk__lte=pks[-1])
+            with transaction.atomic(using=using):
+                if python_fields:
+                    self.update_objects(chunk, python_fields, chunk_size, shuffled)
+                if self.updates:
+                    chunk.update(**self.updates)
+            count += len(pks)
+            last_pk = pks[-1]
+            if verbosity > 1:
+                print("%s: anonymized %d rows" % (self.label, count))
+        return count
+
+    def get_shuffled_values(self, queryset):
+        """
+        Return {pk: {attname: value}} with the values of the shuffled fields
+        shuffled over the whole table, not just within a chunk.
+        """
+        if not self.shuffled:
+            return {}
+        rows = list(queryset.values_list("pk", *self.shuffled).iterator())
+        values = {pk: {} for pk, *_ in rows}
+        for index, attname in enumerate(self.shuffled, 1):
+            column = [row[index] for row in rows]
+            random.shuffle(column)
+            for (pk, *_), value in zip(rows, column):
+                values[pk][attname] = value
+        return values
+
+    def update_objects(self, chunk, python_fields, chunk_size, shuffled):
+        objs = list(chunk)
+        for obj in objs:
+            # rows created since the values were read keep theirs
+            for attname, value in shuffled.get(obj.pk, {}).items():
+                setattr(obj, attname, value)
+        for attname, template in self.templates.items():
+            for obj in objs:
+                context = obj.__dict__.copy()
+                context["pk"] = obj.pk
+                setattr(obj, attname, template % context)
+        chunk.model._base_manager.using(chunk.db).bulk_update(
+            objs, fields=python_fields, batch_size=chunk_size
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "DEBUG only: anonymize model fields in place as declared by the "
+        "ANONYMIZE_DATA setting."
+    )
+    requires_system_checks: List[str] = []
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="Only anonymize these models (app_label.ModelName).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help=(
+                'Nominates a database to anonymize. Defaults to the "default" database.'
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            dest="chunk_size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Number of rows updated per query. Defaults to %d."
+            % (DEFAULT_CHUNK_SIZE,),
+        )
+        add_parallel_argument(parser, "Anonymize tables")
+        parser.add_argument(
+            "--salt",
+            dest="salt",
+            default=None,
+            help="Salt used by the hash strategy. Defaults to a value derived "
+            "from settings.SECRET_KEY.",
+        )
+
+    @signalcommand
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            raise CommandError("Only available in debug mode")
+
+        self.using = options["database"]
+        self.chunk_size = options["chunk_size"]
+        self.verbosity = options["verbosity"]
+        if self.chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer")
+
+        config = getattr(settings, "ANONYMIZE_DATA", {})
+        if not config:
+            raise CommandError("No fields to anonymize, set ANONYMIZE_DATA")
+        labels = options["models"] or list(config)
+        salt = options["salt"]
+        if salt is None:
+            # the salt is sent to the database, never send SECRET_KEY itself
+            salt = salted_hmac("django_extensions.anonymize_data", "salt").hexdigest()
+
+        anonymizers = []
+        for label in labels:
+            if label not in config:
+                raise CommandError("%s is not configured in ANONYMIZE_DATA" % label)
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError) as e:
+                raise CommandError(str(e))
+            anonymizers.append(ModelAnonymizer(model, config[label], salt))
+
+        workers = min(options["parallel"] or 1, len(anonymizers))
+        counts = map_in_threads(self.anonymize, anonymizers, workers, self.using)
+        results = zip(anonymizers, counts)
+
+        if self.verbosity > 0:
+            for anonymizer, count in results:
+                print("Anonymized %d rows of %s" % (count, anonymizer.label))
+
+    def anonymize(self, anonymizer):
+        return anonymizer.anonymize(self.using, self.chunk_size, self.verbosity)
@@ -29,6 +29,7 @@ Improvements:
 """
 
 import datetime
+import itertools
 import sys
 
 from django.apps import apps
@@ -44,12 +45,15 @@ from django.db.models import (
     FileField,
     ForeignKey,
 )
+from django.db.models import prefetch_related_objects
 from django.db.models.deletion import Collector
 from django.utils import timezone
 from django.utils.encoding import force_str, smart_str
 
 from django_extensions.management.utils import signalcommand
 
+DEFAULT_CHUNK_SIZE = 2000
+
 
 def orm_item_locator(orm_obj):
     """
@@ -112,6 +116,40 @@ class Command(BaseCommand):
             default=True,
             help="Include Autofields (like pk fields)",
         )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            dest="stream",
+            default=False,
+            help=(
+                "Write the script chunk by chunk while iterating the objects "
+                "instead of building it in memory first"
+            ),
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            dest="bulk",
+            default=False,
+            help=(
+                "Generate a script which creates objects and many to many "
+                "relations in batches with bulk_create()"
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch_size",
+            default=None,
+            help="Batch size used by the generated script with --bulk",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            dest="chunk_size",
+            default=DEFAULT_CHUNK_SIZE,
+            help="Number of objects fetched from the database at a time",
+        )
 
     @signalcommand
     def handle(self, *args, **options):
@@ -133,8 +171,12 @@ class Command(BaseCommand):
             stderr=self.stderr,
             options=options,
         )
-        self.stdout.write(str(script))
-        self.stdout.write("\n")
+        if options["stream"]:
+            for text in script.iter_lines(chunk_size=options["chunk_size"]):
+                self.stdout.write(text, ending="")
+        else:
+            self.stdout.write(str(script))
+            self.stdout.write("\n")
 
 
 def get_models(app_labels):
@@ -230,6 +272,7 @@ class ModelCode(Code):
         self.context = context
         self.options = options
         self.instances = []
+        self.has_many_to_many = bool(self.get_many_to_many_fields())
 
     def get_imports(self):
         """
@@ -246,29 +289,100 @@ class ModelCode(Code):
         Each list is a block, each string is a statement.
         """
         code = []
+        for chunk in self.iter_lines():
+            code += chunk
+        return code
 
-        for counter, item in enumerate(self.model._default_manager.all()):
-            instance = InstanceCode(
-                instance=item,
-                id=counter + 1,
-                context=self.context,
-                stdout=self.stdout,
-                stderr=self.stderr,
-                options=self.options,
-            )
-            self.instances.append(instance)
-            if instance.waiting_list:
-                code += instance.lines
+    lines = property(get_lines)
+
+    def get_prefetch_lookups(self):
+        """
+        Return the foreign key and many to many fields to fetch in bulk,
+        instead of following them for every instance.
+        """
+        lookups = [
+            field.name
+            for field in self.model._meta.fields
+            if isinstance(field, ForeignKey)
+        ]
+        lookups += [field.name for field in self.get_many_to_many_fields()]
+        return lookups
+
+    def get_many_to_many_fields(self):
+        """Return the many to many fields whose relations are written out."""
+        fields = []
+        for field in self.model._meta.many_to_many:
+            through = getattr(field.remote_field, "through", None)
+            if through is None or through._meta.auto_created:
+                fields.append(field)
+        return fields
+
+    def add_pending(self, pending, instance):
+        """
+        Append instance to pending if it still waits for other objects.
+
+        Instances of models with many to many fields are processed again even
+        when nothing is left, which writes an empty block for each of them.
+        Those are only counted, by an integer in place of a run of instances.
+        """
+        if isinstance(instance, int):
+            count = instance
+        elif instance.waiting_list or instance.many_to_many_waiting_list:
+            pending.append(instance)
+            return
+        elif self.has_many_to_many:
+            count = 1
+        else:
+            return
+        if pending and isinstance(pending[-1], int):
+            pending[-1] += count
+        else:
+            pending.append(count)
+
+    def iter_lines(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yield the code body in chunks of at most chunk_size instances.
+
+        Objects are fetched with QuerySet.iterator(), only instances which
+        still have fields or many to many relations waiting for other objects
+        are kept around (in self.instances) to be processed again later, see
+        add_pending().
+        Related objects are fetched in bulk for every chunk.
+        """
+        pending = []
+        lookups = self.get_prefetch_lookups()
+
+        counter = 0
+        queryset = self.model._default_manager.all()
+        for items in iter_chunks(queryset.iterator(chunk_size=chunk_size), chunk_size):
+            prefetch_related_objects(items, *lookups)
+            code = []
+            for item in items:
+                counter += 1
+                instance = InstanceCode(
+                    instance=item,
+                    id=counter,
+                    context=self.context,
+                    stdout=self.stdout,
+                    stderr=self.stderr,
+                    options=self.options,
+                )
+                if instance.waiting_list:
+                    code += instance.lines
+                self.add_pending(pending, instance)
+            yield code
 
+        code = []
         # After each instance has been processed, try again.
         # This allows self referencing fields to work.
-        for instance in self.instances:
-            if instance.waiting_list:
+        for instance in pending:
+            if not isinstance(instance, int) and instance.waiting_list:
                 code += instance.lines
+        yield code
 
-        return code
-
-    lines = property(get_lines)
+        self.instances = []
+        for instance in pending:
+            self.add_pending(self.instances, instance)
 
 
 class InstanceCode(Code):
@@ -301,9 +415,9 @@ class InstanceCode(Code):
                     continue
             except AttributeError:
                 pass
-            self.many_to_many_waiting_list[field] = list(
-                getattr(self.instance, field.name).all()
-            )
+            rel_items = list(getattr(self.instance, field.name).all())
+            if rel_items:
+                self.many_to_many_waiting_list[field] = rel_items
 
     def get_lines(self, force=False):
         """
@@ -336,9 +450,10 @@ class InstanceCode(Code):
         # Print the save command for our new object
         # e.g. model_name_35.save()
         if code_lines:
+            save_method = "queue_save" if self.options.get("bulk") else "save_or_locate"
             code_lines.append(
-                "%s = importer.save_or_locate(%s)\n"
-                % (self.variable_name, self.variable_name)
+                "%s = importer.%s(%s)\n"
+                % (self.variable_name, save_method, self.variable_name)
             )
 
         code_lines += self.get_many_to_many_lines(force=force)
@@ -368,15 +483,24 @@ class InstanceCode(Code):
         if [self.model in p for p in sub_objects_parents].count(True) == 1:
             # since this instance isn't explicitly created, it's variable name
             # can't be referenced in the script, so record None in context dict
-            pk_name = self.instance._meta.pk.name
-            key = "%s_%s" % (self.model.__name__, getattr(self.instance, pk_name))
-            self.context[key] = None
+            if self.is_referenced():
+                pk_name = self.instance._meta.pk.name
+                key = "%s_%s" % (self.model.__name__, getattr(self.instance, pk_name))
+                self.context[key] = None
             self.skip_me = True
         else:
             self.skip_me = False
 
         return self.skip_me
 
+    def is_referenced(self):
+        """
+        Whether other objects may refer to this one, only then its variable
+        name has to be kept in the context.
+        """
+        referenced_models = self.context.get("__referenced_models")
+        return referenced_models is None or self.model.__name__ in referenced_models
+
     def instantiate(self):
         """Write lines for instantiation"""
         # e.g. model_name_35 = Model()
@@ -387,9 +511,10 @@ class InstanceCode(Code):
             self.instantiated = True
 
             # Store our variable name for future foreign key references
-            pk_name = self.instance._meta.pk.name
-            key = "%s_%s" % (self.model.__name__, getattr(self.instance, pk_name))
-            self.context[key] = self.variable_name
+            if self.is_referenced():
+                pk_name = self.instance._meta.pk.name
+                key = "%s_%s" % (self.model.__name__, getattr(self.instance, pk_name))
+                self.context[key] = self.variable_name
 
         return code_lines
 
@@ -424,12 +549,22 @@ class InstanceCode(Code):
 
         return code_lines
 
+    def get_add_line(self, field, value):
+        """Return the line adding value to a many to many relation."""
+        if self.options.get("bulk"):
+            return 'importer.queue_many_to_many(%s, "%s", %s)' % (
+                self.variable_name,
+                field.name,
+                value,
+            )
+        return "%s.%s.add(%s)" % (self.variable_name, field.name, value)
+
     def get_many_to_many_lines(self, force=False):
         """Generate lines that define many to many relations for this instance."""
 
         lines = []
 
-        for field, rel_items in self.many_to_many_waiting_list.items():
+        for field, rel_items in list(self.many_to_many_waiting_list.items()):
             for rel_item in list(rel_items):
                 try:
                     pk_name = rel_item._meta.pk.name
@@ -438,9 +573,7 @@ class InstanceCode(Code):
                         getattr(rel_item, pk_name),
                     )
                     value = "%s" % self.context[key]
-                    lines.append(
-                        "%s.%s.add(%s)" % (self.variable_name, field.name, value)
-                    )
+                    lines.append(self.get_add_line(field, value))
                     self.many_to_many_waiting_list[field].remove(rel_item)
                 except KeyError:
                     if force:
@@ -448,11 +581,10 @@ class InstanceCode(Code):
                         self.context["__extra_imports"][rel_item._meta.object_name] = (
                             rel_item.__module__
                         )
-                        lines.append(
-                            "%s.%s.add( %s )"
-                            % (self.variable_name, field.name, item_locator)
-                        )
+                        lines.append(self.get_add_line(field, " %s " % item_locator))
                         self.many_to_many_waiting_list[field].remove(rel_item)
+            if not self.many_to_many_waiting_list[field]:
+                del self.many_to_many_waiting_list[field]
 
         if lines:
             lines.append("")
@@ -473,6 +605,7 @@ class Script(Code):
         self.context = context
 
         self.context["__available_models"] = set(models)
+        self.context["__referenced_models"] = get_referenced_models(models)
         self.context["__extra_imports"] = {}
 
         self.options = options
@@ -565,7 +698,9 @@ class Script(Code):
             self.stderr.write(msg)
             code.append("    # " + msg)
             for instance in model.instances:
-                if instance.waiting_list or instance.many_to_many_waiting_list:
+                if isinstance(instance, int):
+                    code += [[]] * instance
+                elif instance.waiting_list or instance.many_to_many_waiting_list:
                     code.append(instance.get_lines(force=True))
 
         code.insert(1, "    # Initial Imports")
@@ -573,10 +708,77 @@ class Script(Code):
         for key, value in self.context["__extra_imports"].items():
             code.insert(2, "    from %s import %s" % (value, key))
 
+        code[1:1] = self.get_bulk_setup_lines()
+        if self.options and self.options.get("bulk"):
+            code.append("    importer.flush()")
+
         return code
 
+    def get_bulk_setup_lines(self):
+        if self.options and self.options.get("bulk") and self.options.get("batch_size"):
+            return ["    importer.batch_size = %d" % self.options["batch_size"]]
+        return []
+
     lines = property(get_lines)
 
+    def iter_lines(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yield the script as text, chunk by chunk.
+
+        The output matches str(self) except that imports of objects which are
+        not exported are written right before their first use instead of at
+        the top of import_data().
+        """
+        written_imports = set()
+
+        def flatten_chunk(chunk):
+            text = ""
+            for key, value in self.context["__extra_imports"].items():
+                if key not in written_imports:
+                    written_imports.add(key)
+                    text += "    from %s import %s\n" % (value, key)
+            return text + flatten_blocks(chunk, num_indents=0) + "\n"
+
+        yield self.FILE_HEADER.strip() + "\n"
+        for line in self.get_bulk_setup_lines():
+            yield line + "\n"
+        yield "    # Initial Imports\n\n"
+
+        # Queue and process the required models
+        for model_class in self._queue_models(self.models, context=self.context):
+            msg = "Processing model: %s.%s\n" % (
+                model_class.model.__module__,
+                model_class.model.__name__,
+            )
+            self.stderr.write(msg)
+            yield "    # " + msg + "\n"
+            yield flatten_blocks(model_class.import_lines, num_indents=0) + "\n"
+            yield "\n"
+            empty = True
+            for chunk in model_class.iter_lines(chunk_size=chunk_size):
+                if chunk:
+                    empty = False
+                    yield flatten_chunk(chunk)
+            if empty:
+                yield "\n"
+
+        # Process left over foreign keys from cyclic models
+        for model in self.models:
+            msg = "Re-processing model: %s.%s\n" % (
+                model.model.__module__,
+                model.model.__name__,
+            )
+            self.stderr.write(msg)
+            yield "    # " + msg + "\n"
+            for instance in model.instances:
+                if isinstance(instance, int):
+                    yield "\n" * instance
+                elif instance.waiting_list or instance.many_to_many_waiting_list:
+                    yield flatten_chunk(instance.get_lines(force=True))
+
+        if self.options and self.options.get("bulk"):
+            yield "    importer.flush()\n"
+
     # A user-friendly file header
     FILE_HEADER = """
 
@@ -608,10 +810,17 @@ class Script(Code):
 # you must make sure ./some_folder/__init__.py exists
 # and run  ./manage.py runscript some_folder.some_script
 import os, sys
-from django.db import transaction
+from django.db import connection, transaction
 
 class BasicImportHelper:
 
+    # Scripts generated with --bulk queue new objects with queue_save() and
+    # create them in batches with bulk_create(), which neither calls save()
+    # nor sends signals. Set bulk to False in your ImportHelper to save every
+    # object through save_or_locate() instead.
+    bulk = True
+    batch_size = 1000
+
     def pre_import(self):
         pass
 
@@ -678,6 +887,86 @@ class BasicImportHelper:
             raise
         return the_obj
 
+    def get_queue(self):
+        if not hasattr(self, "_queue"):
+            self._queue = {}
+            self._many_to_many_queue = []
+        return self._queue
+
+    def has_unsaved_related(self, the_obj):
+        for field in the_obj._meta.concrete_fields:
+            if field.is_relation and field.is_cached(the_obj):
+                related_obj = getattr(the_obj, field.name)
+                if related_obj is not None and related_obj.pk is None:
+                    return True
+        return False
+
+    def can_bulk_create(self, the_obj):
+        return (
+            self.bulk
+            and the_obj._state.adding
+            and not the_obj._meta.parents
+            and connection.features.can_return_rows_from_bulk_insert
+        )
+
+    def queue_save(self, the_obj):
+        # Queue a new object to be created by flush(), objects which cannot
+        # be bulk created are handed to save_or_locate() right away.
+        queue = self.get_queue()
+        # an object saved again is queued after the objects it now refers to
+        queue.get(the_obj.__class__, {}).pop(id(the_obj), None)
+        if self.has_unsaved_related(the_obj):
+            self.flush()
+        if not self.can_bulk_create(the_obj):
+            return self.save_or_locate(the_obj)
+
+        queue.setdefault(the_obj.__class__, {})[id(the_obj)] = the_obj
+        if sum(len(objs) for objs in queue.values()) >= self.batch_size:
+            self.flush()
+        return the_obj
+
+    def queue_many_to_many(self, the_obj, field_name, related_obj):
+        # Queue a many to many relation, the rows of the through tables are
+        # created in bulk by flush().
+        self.get_queue()
+        if not self.bulk:
+            getattr(the_obj, field_name).add(related_obj)
+            return
+        self._many_to_many_queue.append((the_obj, field_name, related_obj))
+        if len(self._many_to_many_queue) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Create queued objects in the order they were first queued in, then
+        # the rows for the queued many to many relations.
+        queue = self.get_queue()
+        while queue:
+            model = next(iter(queue))
+            objs = list(queue.pop(model).values())
+            model._base_manager.bulk_create(objs, batch_size=self.batch_size)
+
+        through_rows = {}
+        for the_obj, field_name, related_obj in self._many_to_many_queue:
+            field = the_obj._meta.get_field(field_name)
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name())
+            target = through._meta.get_field(field.m2m_reverse_field_name())
+            pairs = [(the_obj, related_obj)]
+            if field.remote_field.symmetrical:
+                pairs.append((related_obj, the_obj))
+            for source_obj, target_obj in pairs:
+                key = (
+                    getattr(source_obj, source.target_field.attname),
+                    getattr(target_obj, target.target_field.attname),
+                )
+                rows = through_rows.setdefault(through, {})
+                rows[key] = through(**{source.attname: key[0], target.attname: key[1]})
+        self._many_to_many_queue = []
+        for through, rows in through_rows.items():
+            through._base_manager.bulk_create(
+                list(rows.values()), batch_size=self.batch_size, ignore_conflicts=True
+            )
+
 
 importer = None
 try:
@@ -736,6 +1025,16 @@ def flatten_blocks(lines, num_indents=-1):
     return "\n".join([flatten_blocks(line, num_indents + 1) for line in lines])
 
 
+def iter_chunks(iterable, size):
+    """Yield lists of at most size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def get_attribute_value(item, field, context, force=False, skip_autofield=True):
     """Get a string version of the given attribute's value, like repr() might."""
     # Find the value of the field, catching any database issues
@@ -760,6 +1059,17 @@ def get_attribute_value(item, field, context, force=False, skip_autofield=True):
     elif isinstance(field, FileField):
         return repr(force_str(value))
 
+    # ForeignKey pointing to a missing object, the prefetched value is None
+    elif (
+        isinstance(field, ForeignKey)
+        and value is None
+        and getattr(item, field.attname) is not None
+    ):
+        raise SkipValue(
+            "Could not find object for %s.%s, ignoring.\n"
+            % (item.__class__.__name__, field.name)
+        )
+
     # ForeignKey fields, link directly using our stored python variable name
     elif isinstance(field, ForeignKey) and value is not None:
         # Special case for contenttype foreign keys: no need to output any
@@ -807,6 +1117,19 @@ def make_clean_dict(the_dict):
     return the_dict
 
 
+def get_referenced_models(models):
+    """
+    Return the names of the models which can be referred to by a foreign key
+    or many to many field of one of the given models.
+    """
+    referenced_models = set()
+    for model in models:
+        for field in model._meta.fields + model._meta.many_to_many:
+            if field.remote_field:
+                referenced_models.add(field.remote_field.model.__name__)
+    return referenced_models
+
+
 def check_dependencies(model, model_queue, avaliable_models):
     """Check that all the dependencies for this model are already in the queue."""
     # A list of allowed links: existing fields, itself and the special case ContentType
@@ -1,5 +1,7 @@
-import sys
 import csv
+import gzip
+import io
+import sys
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -9,6 +11,8 @@ from django.core.management.base import BaseCommand, CommandError
 from django_extensions.management.utils import signalcommand
 
 
+DEFAULT_CHUNK_SIZE = 2000
+
 FORMATS = [
     "address",
     "emails",
@@ -39,6 +43,22 @@ def full_name(**kwargs):
     return ""
 
 
+class OutputWriter:
+    """Write to a command's stdout without appending line endings."""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def write(self, text):
+        self.stdout.write(text, ending="")
+
+    def flush(self):
+        self.stdout.flush()
+
+    def close(self):
+        self.flush()
+
+
 class Command(BaseCommand):
     help = "Export user email address list in one of a number of formats."
     args = "[output file]"
@@ -71,6 +91,34 @@ class Command(BaseCommand):
             default=FORMATS[0],
             help="output format. May be one of %s." % ", ".join(FORMATS),
         )
+        parser.add_argument(
+            "--chunk-size",
+            action="store",
+            type=int,
+            dest="chunk_size",
+            default=DEFAULT_CHUNK_SIZE,
+            help=(
+                "Number of users fetched from the database at a time, output "
+                "is flushed after each chunk. Defaults to %d." % DEFAULT_CHUNK_SIZE
+            ),
+        )
+        parser.add_argument(
+            "--gzip",
+            "-z",
+            action="store_true",
+            dest="gzip",
+            default=False,
+            help=(
+                "Compress the output with gzip, implied when the output file "
+                "name ends with .gz"
+            ),
+        )
+        parser.add_argument(
+            "filename",
+            nargs="?",
+            default=None,
+            help="File to save to, defaults to stdout",
+        )
 
     def full_name(self, **kwargs):
         return getattr(settings, "EXPORT_EMAILS_FULL_NAME_FUNC", full_name)(**kwargs)
@@ -103,33 +151,70 @@ class Command(BaseCommand):
         qs = UserModel.objects.all().order_by(*order_by)
         if group:
             qs = qs.filter(groups__name=group).distinct()
+        chunk_size = options["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer")
         qs = qs.values(*fields)
-        getattr(self, options["format"])(qs)
+
+        filename = options["filename"]
+        use_gzip = options["gzip"] or bool(filename and filename.endswith(".gz"))
+        self.out = self.open_output(filename, use_gzip)
+        try:
+            getattr(self, options["format"])(
+                self.iter_flushed(qs.iterator(chunk_size=chunk_size), chunk_size)
+            )
+        finally:
+            self.out.close()
+
+    def open_output(self, filename, use_gzip):
+        """Return a text stream writing to filename or stdout."""
+        if filename:
+            if use_gzip:
+                return gzip.open(filename, "wt", encoding=self.encoding, newline="")
+            return open(filename, "w", encoding=self.encoding, newline="")
+        if use_gzip:
+            # Closing the wrapper must not close stdout itself.
+            stdout = getattr(sys.stdout, "buffer", sys.stdout)
+            compressed = gzip.GzipFile(fileobj=stdout, mode="wb")
+            return io.TextIOWrapper(compressed, encoding=self.encoding, newline="")
+        return OutputWriter(self.stdout)
+
+    def iter_flushed(self, rows, chunk_size):
+        """Yield rows, flushing the output after every chunk_size rows."""
+        for count, row in enumerate(rows, 1):
+            yield row
+            if count % chunk_size == 0:
+                self.out.flush()
 
     def address(self, qs):
         """
         Single entry per line in the format of:
             "full name" <my@address.com>;
         """
-        self.stdout.write(
-            "\n".join(
-                '"%s" <%s>;' % (self.full_name(**ent), ent.get("email", ""))
-                for ent in qs
+        separator = ""
+        for ent in qs:
+            self.out.write(
+                '%s"%s" <%s>;'
+                % (separator, self.full_name(**ent), ent.get("email", ""))
             )
-        )
-        self.stdout.write("\n")
+            separator = "\n"
+        self.out.write("\n\n")
 
     def emails(self, qs):
         """
         Single entry with email only in the format of:
             my@address.com,
         """
-        self.stdout.write(",\n".join(ent["email"] for ent in qs if ent.get("email")))
-        self.stdout.write("\n")
+        separator = ""
+        for ent in qs:
+            if ent.get("email"):
+                self.out.write(separator + ent["email"])
+                separator = ",\n"
+        self.out.write("\n\n")
 
     def google(self, qs):
         """CSV format suitable for importing into google GMail"""
-        csvf = csv.writer(sys.stdout)
+        csvf = csv.writer(self.out)
         csvf.writerow(["Name", "Email"])
         for ent in qs:
             csvf.writerow([self.full_name(**ent), ent.get("email", "")])
@@ -139,7 +224,7 @@ class Command(BaseCommand):
         CSV format suitable for importing into linkedin Groups.
         perfect for pre-approving members of a linkedin group.
         """
-        csvf = csv.writer(sys.stdout)
+        csvf = csv.writer(self.out)
         csvf.writerow(["First Name", "Last Name", "Email"])
         for ent in qs:
             csvf.writerow(
@@ -152,7 +237,7 @@ class Command(BaseCommand):
 
     def outlook(self, qs):
         """CSV format suitable for importing into outlook"""
-        csvf = csv.writer(sys.stdout)
+        csvf = csv.writer(self.out)
         columns = [
             "Name",
             "E-mail Address",
@@ -192,7 +277,7 @@ class Command(BaseCommand):
             )
             sys.exit(1)
 
-        out = sys.stdout
+        out = self.out
         for ent in qs:
             card = vobject.vCard()
             card.add("fn").value = self.full_name(**ent)
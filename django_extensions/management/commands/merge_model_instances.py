@@ -1,9 +1,32 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
 from django.apps import apps
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.core.management import BaseCommand
-from django.db import transaction
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management import BaseCommand, CommandError
+from django.db import router, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+
+from django_extensions.management.utils import (
+    add_parallel_argument,
+    map_in_threads,
+    signalcommand,
+)
+
+DEFAULT_BATCH_SIZE = 500
 
-from django_extensions.management.utils import signalcommand
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def get_model_to_deduplicate():
@@ -88,6 +111,293 @@ def get_generic_fields():
     return generic_fields
 
 
+class ModelMerger:
+    """
+    Merge duplicate instances of a model with set based queries.
+
+    Duplicates are grouped as (primary_pk, [alias_pks]), references to the
+    aliases are repointed to the primary instance with one UPDATE per relation
+    for a whole batch of groups, after which the aliases are deleted at once.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.reverse_fks = []
+        self.reverse_one_to_ones = []
+        self.through_fks = []
+        self.forward_fields = []
+
+        for field in model._meta.get_fields(include_hidden=True):
+            if field.auto_created and not field.concrete:
+                if field.many_to_many or field.parent_link:
+                    # many-to-many are handled through the FKs of their
+                    # through model, child models cannot be repointed.
+                    continue
+                related_model = field.related_model
+                if related_model._meta.auto_created:
+                    # FK of an automatically created many-to-many through model
+                    other = next(
+                        f
+                        for f in related_model._meta.concrete_fields
+                        if f.is_relation and f is not field.remote_field
+                    )
+                    self.through_fks.append((field.remote_field, other))
+                elif field.one_to_one:
+                    self.reverse_one_to_ones.append(field.remote_field)
+                else:
+                    self.reverse_fks.append(field.remote_field)
+            elif field.concrete and (field.many_to_one or field.one_to_one):
+                if not field.primary_key:
+                    self.forward_fields.append(field)
+
+        self.generic_fields = [
+            field for field in get_generic_fields() if not field.model._meta.abstract
+        ]
+
+    def find_duplicates(self, field_names):
+        """Yield the field values shared by more than one instance."""
+        queryset = (
+            self.model._default_manager.values(*field_names)
+            .annotate(duplicates_count=Count("pk"))
+            .filter(duplicates_count__gt=1)
+            .order_by()
+        )
+        for values in queryset.iterator():
+            del values["duplicates_count"]
+            yield values
+
+    def get_groups(self, duplicates, field_names, first_or_last):
+        """Return (primary_pk, [alias_pks]) for each set of duplicated values."""
+        if not duplicates:
+            return []
+        ordering = list(self.model._meta.ordering or ["pk"])
+        queryset = (
+            self.model._default_manager.filter(
+                reduce(or_, (Q(**values) for values in duplicates))
+            )
+            .order_by(*ordering)
+            .values_list("pk", *field_names)
+        )
+        members = {}
+        for row in queryset:
+            members.setdefault(row[1:], []).append(row[0])
+
+        groups = []
+        for pks in members.values():
+            if len(pks) < 2:
+                continue
+            if first_or_last == "last":
+                groups.append((pks[-1], pks[:-1]))
+            else:
+                groups.append((pks[0], pks[1:]))
+        return groups
+
+    def repoint(self, model, field, groups, pks=None):
+        """
+        Point field at the primary instance of each group instead of its
+        aliases, with a single UPDATE. Return the number of updated rows.
+        """
+        aliases = [alias for _, group_aliases in groups for alias in group_aliases]
+        if not aliases:
+            return 0
+        queryset = model._base_manager.filter(**{"%s__in" % field.attname: aliases})
+        if pks is not None:
+            queryset = queryset.filter(pk__in=pks)
+        return queryset.update(
+            **{
+                field.attname: Case(
+                    *[
+                        When(
+                            **{"%s__in" % field.attname: group_aliases},
+                            then=Value(primary),
+                        )
+                        for primary, group_aliases in groups
+                    ],
+                    default=F(field.attname),
+                    output_field=field,
+                )
+            }
+        )
+
+    def merge_through_fk(self, field, other, groups):
+        """
+        Repoint the rows of an automatically created many-to-many through
+        model, dropping rows that would duplicate a relation of the primary
+        instance.
+        """
+        through = field.model
+        instance_pks = [pk for primary, aliases in groups for pk in [primary, *aliases]]
+        primary_of = {
+            pk: primary for primary, aliases in groups for pk in [primary, *aliases]
+        }
+        rows = (
+            through._base_manager.filter(**{"%s__in" % field.attname: instance_pks})
+            .order_by("pk")
+            .values_list("pk", field.attname, other.attname)
+        )
+        rows = sorted(rows, key=lambda row: row[1] != primary_of[row[1]])
+        seen = set()
+        duplicates = []
+        for pk, instance_pk, other_pk in rows:
+            key = (primary_of[instance_pk], other_pk)
+            if key in seen:
+                duplicates.append(pk)
+            else:
+                seen.add(key)
+        if duplicates:
+            through._base_manager.filter(pk__in=duplicates).delete()
+        return self.repoint(through, field, groups)
+
+    def merge_reverse_one_to_one(self, field, groups):
+        """
+        Give the related object of the first alias having one to primary
+        instances that have none. The others are left to be deleted, or
+        unlinked, with their alias.
+        """
+        instance_pks = [pk for primary, aliases in groups for pk in [primary, *aliases]]
+        related = dict(
+            (instance_pk, pk)
+            for pk, instance_pk in field.model._base_manager.filter(
+                **{"%s__in" % field.attname: instance_pks}
+            ).values_list("pk", field.attname)
+        )
+        moved = []
+        for primary, aliases in groups:
+            if primary in related:
+                continue
+            for alias in aliases:
+                if alias in related:
+                    moved.append((primary, [alias], related[alias]))
+                    break
+        if not moved:
+            return 0
+        return self.repoint(
+            field.model,
+            field,
+            [(primary, aliases) for primary, aliases, _ in moved],
+            pks=[pk for _, _, pk in moved],
+        )
+
+    def merge_generic_fk(self, field, groups):
+        from django.contrib.contenttypes.models import ContentType
+
+        content_type = ContentType.objects.get_for_model(self.model)
+        fk_field = field.model._meta.get_field(field.fk_field)
+        queryset = field.model._base_manager.filter(**{field.ct_field: content_type})
+        count = 0
+        for primary, aliases in groups:
+            count += queryset.filter(**{"%s__in" % fk_field.attname: aliases}).update(
+                **{fk_field.attname: primary}
+            )
+        return count
+
+    def get_forward_updates(self, groups):
+        """
+        Return the forward relations to copy from the aliases to each primary
+        instance that has none, and the objects one-to-one related to the
+        aliases that are to be deleted.
+        """
+        if not self.forward_fields:
+            return {}, {}
+        instance_pks = [pk for primary, aliases in groups for pk in [primary, *aliases]]
+        attnames = [field.attname for field in self.forward_fields]
+        values = {
+            row[0]: row[1:]
+            for row in self.model._base_manager.filter(pk__in=instance_pks).values_list(
+                "pk", *attnames
+            )
+        }
+        updates = {}
+        to_delete = {}
+        for primary, aliases in groups:
+            current = list(values[primary])
+            for alias in aliases:
+                for index, field in enumerate(self.forward_fields):
+                    value = values[alias][index]
+                    if value is None:
+                        continue
+                    if current[index] is None:
+                        current[index] = value
+                        updates.setdefault(primary, {})[field.attname] = value
+                    elif field.one_to_one and value != current[index]:
+                        to_delete.setdefault(field.related_model, []).append(value)
+        return updates, to_delete
+
+    def plan(self, groups):
+        """
+        Return a Counter of the rows merge() would rewrite per relation,
+        without changing anything.
+        """
+        planned = Counter()
+        aliases = [alias for _, group_aliases in groups for alias in group_aliases]
+        if not aliases:
+            return planned
+        fields = [field for field, _ in self.through_fks]
+        fields += self.reverse_fks + self.reverse_one_to_ones
+        for field in fields:
+            label = "%s.%s" % (field.model._meta.label, field.name)
+            planned[label] += field.model._base_manager.filter(
+                **{"%s__in" % field.attname: aliases}
+            ).count()
+        if self.generic_fields:
+            from django.contrib.contenttypes.models import ContentType
+
+            content_type = ContentType.objects.get_for_model(self.model)
+            for field in self.generic_fields:
+                label = "%s.%s" % (field.model._meta.label, field.name)
+                fk_field = field.model._meta.get_field(field.fk_field)
+                planned[label] += field.model._base_manager.filter(
+                    **{
+                        field.ct_field: content_type,
+                        "%s__in" % fk_field.attname: aliases,
+                    }
+                ).count()
+        updates, to_delete = self.get_forward_updates(groups)
+        if updates:
+            planned[self.model._meta.label] += len(updates)
+        for related_model, pks in to_delete.items():
+            planned["%s (deleted)" % related_model._meta.label] += len(pks)
+        planned["%s (deleted)" % self.model._meta.label] += len(aliases)
+        return planned
+
+    def merge(self, groups, stdout=None, verbosity=1):
+        """
+        Merge each group of duplicates into its primary instance.
+        Return the number of deleted instances.
+        """
+        if not groups:
+            return 0
+        for field, other in self.through_fks:
+            self.merge_through_fk(field, other, groups)
+        for field in self.reverse_fks:
+            self.repoint(field.model, field, groups)
+        for field in self.reverse_one_to_ones:
+            self.merge_reverse_one_to_one(field, groups)
+        for field in self.generic_fields:
+            self.merge_generic_fk(field, groups)
+        updates, to_delete = self.get_forward_updates(groups)
+
+        aliases = [alias for _, group_aliases in groups for alias in group_aliases]
+        _, deleted = self.model._base_manager.filter(pk__in=aliases).delete()
+        deleted_count = deleted.get(self.model._meta.label, 0)
+        if stdout and verbosity > 1:
+            for alias in aliases:
+                stdout.write(
+                    "Deleted {} with id {}\n".format(self.model.__name__, alias)
+                )
+
+        for related_model, pks in to_delete.items():
+            related_model._base_manager.filter(pk__in=pks).delete()
+            if stdout and verbosity > 1:
+                for pk in pks:
+                    stdout.write(
+                        "Deleted {} with id {}\n".format(related_model.__name__, pk)
+                    )
+        for primary, values in updates.items():
+            self.model._base_manager.filter(pk=primary).update(**values)
+        return deleted_count
+
+
 class Command(BaseCommand):
     help = """
         Removes duplicate model instances based on a specified
@@ -102,133 +412,115 @@ class Command(BaseCommand):
         https://gist.github.com/edelvalle/01886b6f79ba0c4dce66
     """
 
-    @signalcommand
-    def handle(self, *args, **options):
-        model = get_model_to_deduplicate()
-        field_names = get_field_names(model)
-        first_or_last = keep_first_or_last_instance()
-        total_deleted_objects_count = 0
-        for instance in model.objects.all():
-            kwargs = {}
-            for field_name in field_names:
-                instance_field_value = instance.__getattribute__(field_name)
-                kwargs.update({field_name: instance_field_value})
-            try:
-                model.objects.get(**kwargs)
-            except model.MultipleObjectsReturned:
-                instances = model.objects.filter(**kwargs)
-                if first_or_last == "first":
-                    primary_object = instances.first()
-                    alias_objects = instances.exclude(pk=primary_object.pk)
-                elif first_or_last == "last":
-                    primary_object = instances.last()
-                    alias_objects = instances.exclude(pk=primary_object.pk)
-
-                primary_object, deleted_objects, deleted_objects_count = (
-                    self.merge_model_instances(primary_object, alias_objects)
-                )
-                total_deleted_objects_count += deleted_objects_count
-
-        print(
-            "Successfully deleted {} model instances.".format(
-                total_deleted_objects_count
-            )
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--model",
+            dest="model",
+            default=None,
+            help="Model to de-duplicate (app_label.ModelName), prompted if omitted",
         )
-
-    @transaction.atomic()
-    def merge_model_instances(self, primary_object, alias_objects):
-        """
-        Merge several model instances into one, the `primary_object`.
-        Use this function to merge model objects and migrate all of the related
-        fields from the alias objects the primary object.
-        """
-        generic_fields = get_generic_fields()
-
-        # get related fields
-        related_fields = list(
-            filter(lambda x: x.is_relation is True, primary_object._meta.get_fields())
+        parser.add_argument(
+            "--fields",
+            dest="fields",
+            default=None,
+            help=(
+                "Fields to de-duplicate on (use comma separation for multiple "
+                "fields), prompted if omitted"
+            ),
         )
-
-        many_to_many_fields = list(
-            filter(lambda x: x.many_to_many is True, related_fields)
+        parser.add_argument(
+            "--keep",
+            dest="keep",
+            choices=["first", "last"],
+            default=None,
+            help="Keep the first or last duplicate instance, prompted if omitted",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="Report the rows that would be rewritten without changing anything",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch_size",
+            default=DEFAULT_BATCH_SIZE,
+            help=(
+                "Number of duplicate groups merged per transaction. "
+                "Defaults to %d." % DEFAULT_BATCH_SIZE
+            ),
+        )
+        add_parallel_argument(
+            parser, "Merge batches of duplicate groups, each in its own transaction,"
         )
 
-        related_fields = list(filter(lambda x: x.many_to_many is False, related_fields))
-
-        # Loop through all alias objects and migrate their references to the
-        # primary object
-        deleted_objects = []
-        deleted_objects_count = 0
-        for alias_object in alias_objects:
-            # Migrate all foreign key references from alias object to primary
-            # object.
-            for many_to_many_field in many_to_many_fields:
-                alias_varname = many_to_many_field.name
-                related_objects = getattr(alias_object, alias_varname)
-                for obj in related_objects.all():
-                    try:
-                        # Handle regular M2M relationships.
-                        getattr(alias_object, alias_varname).remove(obj)
-                        getattr(primary_object, alias_varname).add(obj)
-                    except AttributeError:
-                        # Handle M2M relationships with a 'through' model.
-                        # This does not delete the 'through model.
-                        # TODO: Allow the user to delete a duplicate 'through' model.
-                        through_model = getattr(alias_object, alias_varname).through
-                        kwargs = {
-                            many_to_many_field.m2m_reverse_field_name(): obj,
-                            many_to_many_field.m2m_field_name(): alias_object,
-                        }
-                        through_model_instances = through_model.objects.filter(**kwargs)
-                        for instance in through_model_instances:
-                            # Re-attach the through model to the primary_object
-                            setattr(
-                                instance,
-                                many_to_many_field.m2m_field_name(),
-                                primary_object,
-                            )
-                            instance.save()
-                            # TODO: Here, try to delete duplicate instances that are
-                            # disallowed by a unique_together constraint
-
-            for related_field in related_fields:
-                if related_field.one_to_many:
-                    alias_varname = related_field.get_accessor_name()
-                    related_objects = getattr(alias_object, alias_varname)
-                    for obj in related_objects.all():
-                        field_name = related_field.field.name
-                        setattr(obj, field_name, primary_object)
-                        obj.save()
-                elif related_field.one_to_one or related_field.many_to_one:
-                    alias_varname = related_field.name
-                    related_object = getattr(alias_object, alias_varname)
-                    primary_related_object = getattr(primary_object, alias_varname)
-                    if primary_related_object is None:
-                        setattr(primary_object, alias_varname, related_object)
-                        primary_object.save()
-                    elif related_field.one_to_one:
-                        self.stdout.write(
-                            "Deleted {} with id {}\n".format(
-                                related_object, related_object.id
-                            )
-                        )
-                        related_object.delete()
-
-            for field in generic_fields:
-                filter_kwargs = {}
-                filter_kwargs[field.fk_field] = alias_object._get_pk_val()
-                filter_kwargs[field.ct_field] = field.get_content_type(alias_object)
-                related_objects = field.model.objects.filter(**filter_kwargs)
-                for generic_related_object in related_objects:
-                    setattr(generic_related_object, field.name, primary_object)
-                    generic_related_object.save()
-
-            if alias_object.id:
-                deleted_objects += [alias_object]
-                self.stdout.write(
-                    "Deleted {} with id {}\n".format(alias_object, alias_object.id)
+    def get_model(self, label):
+        if label is None:
+            return get_model_to_deduplicate()
+        try:
+            return apps.get_model(label)
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+    def get_field_names(self, model, fields):
+        if fields is None:
+            return get_field_names(model)
+        field_names = [name.strip() for name in fields.split(",") if name.strip()]
+        if not field_names:
+            raise CommandError("No fields to de-duplicate on")
+        for name in field_names:
+            try:
+                model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise CommandError(
+                    "%s has no field named '%s'" % (model._meta.label, name)
                 )
-                alias_object.delete()
-                deleted_objects_count += 1
+        return field_names
+
+    @signalcommand
+    def handle(self, *args, **options):
+        model = self.get_model(options["model"])
+        field_names = self.get_field_names(model, options["fields"])
+        first_or_last = options["keep"] or keep_first_or_last_instance()
+        self.verbosity = options["verbosity"]
+        self.dry_run = options["dry_run"]
+        self.field_names = field_names
+        self.first_or_last = first_or_last
+        self.using = router.db_for_write(model)
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer")
 
-        return primary_object, deleted_objects, deleted_objects_count
+        self.merger = ModelMerger(model)
+        batches = iter_batches(self.merger.find_duplicates(field_names), batch_size)
+        workers = options["parallel"] or 1
+        if workers > 1:
+            # Duplicates are fetched up front, the main thread's connection
+            # must not be shared with the workers.
+            batches = list(batches)
+        results = map_in_threads(self.merge_batch, batches, workers, self.using)
+
+        if self.dry_run:
+            planned = sum(results, Counter())
+            deleted = planned.pop("%s (deleted)" % model._meta.label, 0)
+            for label, count in sorted(planned.items()):
+                if label.endswith(" (deleted)"):
+                    print("Would delete {} rows of {}".format(count, label[:-10]))
+                else:
+                    print("Would rewrite {} rows of {}".format(count, label))
+            print("Would delete {} model instances.".format(deleted))
+        else:
+            print("Successfully deleted {} model instances.".format(sum(results)))
+
+    def merge_batch(self, duplicates):
+        """Merge a batch of duplicate groups in its own transaction."""
+        with transaction.atomic(using=self.using):
+            groups = self.merger.get_groups(
+                duplicates, self.field_names, self.first_or_last
+            )
+            if self.dry_run:
+                return self.merger.plan(groups)
+            return self.merger.merge(groups, self.stdout, self.verbosity)
@@ -9,18 +9,345 @@ Credits for kcachegrind support taken from lsprofcalltree.py go to:
  Johan Dahlin
 """
 
+import atexit
+import cProfile
+import hashlib
+import itertools
+import json
+import marshal
+import math
+import os
+import pstats
+import queue
+import re
+import signal
 import sys
-from datetime import datetime
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from functools import partial
 
 from django.conf import settings
 from django.contrib.staticfiles.handlers import StaticFilesHandler
+from django.core.handlers.wsgi import get_path_info
 from django.core.management.base import BaseCommand, CommandError
 from django.core.servers.basehttp import get_internal_wsgi_application
+from django.db import connections
+from django.urls import Resolver404, resolve
 
 from django_extensions.management.utils import signalcommand
 
 USE_STATICFILES = "django.contrib.staticfiles" in settings.INSTALLED_APPS
 
+DEFAULT_PROF_FILE = "{path}.{duration:06d}ms.{time}"
+DEFAULT_SAMPLING_HZ = 100
+SAMPLING_FILES = {
+    "collapsed": "profile.collapsed",
+    "speedscope": "profile.speedscope.json",
+}
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+UNRESOLVED_PATTERN = "<unresolved>"
+DEFAULT_SUMMARY_TOP = 20
+SUMMARY_FILE = "summary.txt"
+DEFAULT_WRITER_QUEUE_SIZE = 100
+DROP_POLICIES = ("newest", "oldest")
+DEFAULT_MEMORY_TOP = 10
+
+
+def get_url_pattern(path_info):
+    """
+    Return the URL pattern path_info resolves to, or the view name when the
+    pattern is unknown, so that /orders/1/ and /orders/2/ end up together.
+    """
+    try:
+        match = resolve(path_info)
+    except Resolver404:
+        return UNRESOLVED_PATTERN
+    if match.route is None:
+        return match.view_name
+    return "/" + match.route
+
+
+def frame_name(code):
+    return "%s (%s:%d)" % (code.co_name, code.co_filename, code.co_firstlineno)
+
+
+def pattern_filename(pattern):
+    """
+    Return a file name for the profile aggregated under URL pattern, a short
+    hash of the pattern tells apart patterns with the same readable part.
+    """
+    return "%s.%s.prof" % (
+        re.sub(r"[^\w-]+", ".", pattern).strip(".") or "root",
+        hashlib.sha1(pattern.encode()).hexdigest()[:8],
+    )
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """Write path through a temporary file, readers never see partial files."""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=".%s." % os.path.basename(path)
+    )
+    try:
+        with open(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class RequestMetrics:
+    """
+    SQL queries executed by the current thread and, while tracemalloc is
+    tracing, memory allocated during record().
+
+    tracemalloc traces, and resets the peak of, the whole process, so memory
+    figures are only meaningful while a single request is served at a time.
+    """
+
+    def __init__(self, sql=True, memory=False):
+        self.sql = sql
+        self.memory = memory
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.memory_peak = None
+        self.allocations = []
+
+    @property
+    def enabled(self):
+        return self.sql or self.memory
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_ms += (time.perf_counter() - start) * 1000.0
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            if self.sql:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+            memory = self.memory and tracemalloc.is_tracing()
+            if memory:
+                before = self.take_snapshot()
+                tracemalloc.reset_peak()
+                size_before = tracemalloc.get_traced_memory()[0]
+            try:
+                yield self
+            finally:
+                if memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    self.memory_peak = max(peak - size_before, 0)
+                    self.add_allocations(before)
+
+    def add_allocations(self, before):
+        """Keep the sites which allocated most since the before snapshot."""
+        for stat in self.take_snapshot().compare_to(before, "lineno"):
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            site = "%s:%d" % (frame.filename, frame.lineno)
+            self.allocations.append((site, stat.size_diff))
+            if len(self.allocations) == DEFAULT_MEMORY_TOP:
+                break
+
+    def as_dict(self):
+        data = {}
+        if self.sql:
+            data["sql"] = {"queries": self.queries, "time_ms": self.sql_ms}
+        if self.memory_peak is not None:
+            data["memory"] = {
+                "peak": self.memory_peak,
+                "top": [
+                    {"site": site, "size": size} for site, size in self.allocations
+                ],
+            }
+        return data
+
+
+class LatencyHistogram:
+    """
+    Request durations counted in logarithmic buckets, each one GROWTH times
+    as wide as the previous, so percentiles stay within a few percent of the
+    exact value in constant memory.
+    """
+
+    GROWTH = 1.05
+    MIN_MS = 0.01
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, duration_ms):
+        ratio = max(duration_ms, self.MIN_MS) / self.MIN_MS
+        self.buckets[math.ceil(math.log(ratio, self.GROWTH))] += 1
+        self.count += 1
+        self.max = max(self.max, duration_ms)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(percent / 100.0 * self.count)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                break
+        return min(self.MIN_MS * self.GROWTH**bucket, self.max)
+
+
+class ProfileAggregator:
+    """
+    cProfile statistics and latency histograms aggregated per URL pattern,
+    so a whole load test run can be analysed instead of single requests.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.profiled = Counter()
+        self.latencies = defaultdict(LatencyHistogram)
+        self.measured = defaultdict(Counter)
+        self.memory_peaks = {}
+        self.allocations = defaultdict(Counter)
+
+    def add(self, key, duration_ms):
+        with self.lock:
+            self.latencies[key].add(duration_ms)
+
+    def add_metrics(self, key, metrics):
+        with self.lock:
+            self.measured[key]["requests"] += 1
+            if metrics.sql:
+                self.measured[key].update(
+                    queries=metrics.queries, time_ms=metrics.sql_ms
+                )
+            if metrics.memory_peak is not None:
+                self.memory_peaks[key] = max(
+                    self.memory_peaks.get(key, 0), metrics.memory_peak
+                )
+                self.allocations[key].update(dict(metrics.allocations))
+
+    def add_profile(self, key, profiler, metrics=None):
+        if metrics is not None:
+            self.add_metrics(key, metrics)
+        stats = pstats.Stats(profiler)
+        with self.lock:
+            self.profiled[key] += 1
+            if key in self.stats:
+                self.stats[key].add(stats)
+            else:
+                self.stats[key] = stats
+
+    def get_stats(self):
+        """Return a copy of the raw pstats data per URL pattern."""
+        with self.lock:
+            return {key: dict(stats.stats) for key, stats in self.stats.items()}
+
+    def dump_stats(self, prof_path):
+        for key, data in self.get_stats().items():
+            path = os.path.join(prof_path, pattern_filename(key))
+            with atomic_write(path, "wb") as f:
+                marshal.dump(data, f)
+
+    def write_summary(self, out_file, top=DEFAULT_SUMMARY_TOP):
+        """
+        Write the latency percentiles, SQL queries and memory peak of every
+        URL pattern followed by its top hottest functions by internal time
+        and allocation sites.
+        """
+        with self.lock:
+            profiled = dict(self.profiled)
+            measured = {key: dict(counts) for key, counts in self.measured.items()}
+            memory_peaks = dict(self.memory_peaks)
+            allocations = {
+                key: sites.most_common(top) for key, sites in self.allocations.items()
+            }
+            latencies = sorted(
+                self.latencies.items(), key=lambda item: item[1].count, reverse=True
+            )
+            rows = [
+                (
+                    key,
+                    histogram.count,
+                    histogram.percentile(50),
+                    histogram.percentile(95),
+                    histogram.percentile(99),
+                    histogram.max,
+                )
+                for key, histogram in latencies
+            ]
+        out_file.write(
+            "%-40s %8s %10s %10s %10s %10s\n"
+            % ("URL pattern", "count", "p50 ms", "p95 ms", "p99 ms", "max ms")
+        )
+        for row in rows:
+            out_file.write("%-40s %8d %10.1f %10.1f %10.1f %10.1f\n" % row)
+
+        if measured:
+            out_file.write(
+                "\n%-40s %8s %10s %10s %10s\n"
+                % ("URL pattern", "measured", "queries", "sql ms", "peak KB")
+            )
+            for key, *_ in rows:
+                if key not in measured:
+                    continue
+                counts = measured[key]
+                out_file.write(
+                    "%-40s %8d %10.1f %10.1f %10s\n"
+                    % (
+                        key,
+                        counts["requests"],
+                        counts.get("queries", 0) / counts["requests"],
+                        counts.get("time_ms", 0) / counts["requests"],
+                        "%.1f" % (memory_peaks[key] / 1024.0)
+                        if key in memory_peaks
+                        else "-",
+                    )
+                )
+
+        stats = self.get_stats()
+        for key, count, *_ in rows:
+            if key not in stats and key not in allocations:
+                continue
+            out_file.write(
+                "\n%s: %d requests, %d profiled\n" % (key, count, profiled.get(key, 0))
+            )
+            if key in stats:
+                functions = sorted(
+                    stats[key].items(), key=lambda item: item[1][2], reverse=True
+                )
+                out_file.write(
+                    "%10s %10s %10s  %s\n"
+                    % ("ncalls", "tottime", "cumtime", "function")
+                )
+                for func, (cc, nc, tt, ct, callers) in functions[:top]:
+                    out_file.write(
+                        "%10d %10.3f %10.3f  %s\n"
+                        % (nc, tt, ct, pstats.func_std_string(func))
+                    )
+            if key in allocations:
+                out_file.write("%10s  %s\n" % ("alloc KB", "allocation site"))
+                for site, size in allocations[key]:
+                    out_file.write("%10.1f  %s\n" % (size / 1024.0, site))
+
 
 class KCacheGrind:
     def __init__(self, profiler):
@@ -87,6 +414,379 @@ class KCacheGrind:
         out_file.write("%d %d\n" % (lineno, totaltime))
 
 
+class StackSampler(threading.Thread):
+    """
+    Statistical profiler sampling the stacks of the threads serving requests
+    hz times per second.
+
+    Samples are counted per URL pattern and call stack. Unlike cProfile the
+    profiled code is not traced, so its timings are hardly affected.
+    """
+
+    def __init__(self, hz=DEFAULT_SAMPLING_HZ):
+        super().__init__(name="django-extensions-stack-sampler", daemon=True)
+        self.interval = 1.0 / hz
+        self.active = {}
+        self.samples = defaultdict(Counter)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        if self.ident is not None:
+            self.join()
+
+    def begin(self, key):
+        """Sample the calling thread, below the calling frame, under key."""
+        self.active[threading.get_ident()] = (key, sys._getframe(1))
+
+    def end(self):
+        self.active.pop(threading.get_ident(), None)
+
+    def sample(self):
+        frames = sys._current_frames()
+        for thread_id, (key, top) in list(self.active.items()):
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None and frame is not top:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            # the thread finished its request since active was copied
+            if frame is None or not stack:
+                continue
+            stack.reverse()
+            with self.lock:
+                self.samples[key][tuple(stack)] += 1
+
+    def get_samples(self):
+        with self.lock:
+            return {key: Counter(stacks) for key, stacks in self.samples.items()}
+
+    def write_collapsed(self, out_file):
+        """Write the samples in the collapsed stack format of flamegraph.pl."""
+        for key, stacks in sorted(self.get_samples().items()):
+            for stack, count in stacks.most_common():
+                names = [key] + [frame_name(code) for code in stack]
+                out_file.write("%s %d\n" % (";".join(names), count))
+
+    def write_speedscope(self, out_file):
+        """Write the samples as speedscope profiles, one per URL pattern."""
+        frames = []
+        indexes = {}
+        profiles = []
+        for key, stacks in sorted(self.get_samples().items()):
+            samples = []
+            weights = []
+            for stack, count in stacks.most_common():
+                sample = []
+                for code in stack:
+                    if code not in indexes:
+                        indexes[code] = len(frames)
+                        frames.append(
+                            {
+                                "name": code.co_name,
+                                "file": code.co_filename,
+                                "line": code.co_firstlineno,
+                            }
+                        )
+                    sample.append(indexes[code])
+                samples.append(sample)
+                weights.append(count * self.interval)
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": key,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            )
+        json.dump(
+            {
+                "$schema": SPEEDSCOPE_SCHEMA,
+                "shared": {"frames": frames},
+                "profiles": profiles,
+                "name": "runprofileserver",
+                "exporter": "django-extensions",
+            },
+            out_file,
+        )
+
+    def dump(self, path, output_format="collapsed"):
+        with atomic_write(path) as f:
+            if output_format == "speedscope":
+                self.write_speedscope(f)
+            else:
+                self.write_collapsed(f)
+
+
+class ProfileDumper(threading.Thread):
+    """
+    Background thread calling dump every interval seconds, if given, and
+    whenever request() is called.
+
+    request() only sets an event, so it is safe to call from a signal handler
+    interrupting a thread which holds the locks dump needs.
+    """
+
+    def __init__(self, dump, interval=None):
+        super().__init__(name="django-extensions-profile-dumper", daemon=True)
+        self.dump = dump
+        self.interval = interval or None
+        self.requested = threading.Event()
+        self.stopped = threading.Event()
+
+    def request(self):
+        self.requested.set()
+
+    def run(self):
+        while True:
+            self.requested.wait(self.interval)
+            self.requested.clear()
+            if self.stopped.is_set():
+                return
+            try:
+                self.dump()
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self):
+        self.stopped.set()
+        self.requested.set()
+        if self.ident is not None:
+            self.join()
+
+
+class ProfileWriter(threading.Thread):
+    """
+    Background thread running the jobs which convert and write profiles, so
+    the measured requests do not wait for disk I/O.
+
+    At most queue_size jobs wait in the queue. When it is full either the
+    submitted job ("newest") or the oldest waiting one ("oldest") is dropped.
+    """
+
+    def __init__(self, queue_size=DEFAULT_WRITER_QUEUE_SIZE, drop_policy="newest"):
+        super().__init__(name="django-extensions-profile-writer", daemon=True)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.drop_policy = drop_policy
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+
+    def submit(self, job):
+        """Queue job, return False if it was dropped."""
+        with self.lock:
+            self.submitted += 1
+            try:
+                self.queue.put_nowait(job)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                if self.drop_policy == "newest":
+                    return False
+            # only this thread, holding the lock, adds jobs to the queue
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(job)
+            return True
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                job()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait until all queued jobs are done."""
+        if self.ident is not None:
+            self.queue.join()
+
+
+class ProfilerHandler:
+    """
+    WSGI handler profiling the requests served by application.
+
+    Every request is profiled with cProfile into its own file in prof_path,
+    unless a StackSampler is given which then samples the requests instead.
+    With an aggregator the profiles and durations are added to it per URL
+    pattern rather than written to a file. Given a ProfileWriter, writing and
+    merging profiles is left to its thread instead of the request's.
+
+    Only requests matching path_re and sending header are profiled, and of
+    those only one out of every. Profiles of requests faster than
+    min_duration milliseconds are discarded. The latency of the requests
+    which are not profiled is still added to the aggregator.
+
+    With trace_sql or trace_memory the RequestMetrics of the requests are
+    written next to their profile or added to the aggregator.
+    """
+
+    def __init__(
+        self,
+        application,
+        prof_path,
+        prof_file=DEFAULT_PROF_FILE,
+        use_lsprof=False,
+        no_media=False,
+        sampler=None,
+        aggregator=None,
+        writer=None,
+        every=1,
+        path_re=None,
+        header=None,
+        min_duration=0,
+        trace_sql=False,
+        trace_memory=False,
+    ):
+        self.application = application
+        self.prof_path = prof_path
+        self.prof_file = prof_file
+        self.use_lsprof = use_lsprof
+        self.exclude_paths = tuple(self.get_exclude_paths()) if no_media else ()
+        self.sampler = sampler
+        self.aggregator = aggregator
+        self.writer = writer
+        self.every = every
+        self.counter = itertools.count()
+        self.path_re = path_re
+        self.header = None
+        if header:
+            self.header = "HTTP_%s" % header.upper().replace("-", "_")
+        self.min_duration = min_duration
+        self.trace_sql = trace_sql
+        self.trace_memory = trace_memory
+
+    def get_exclude_paths(self):
+        exclude_paths = []
+        media_url = getattr(settings, "MEDIA_URL", None)
+        if media_url:
+            exclude_paths.append(media_url)
+        static_url = getattr(settings, "STATIC_URL", None)
+        if static_url:
+            exclude_paths.append(static_url)
+        return exclude_paths
+
+    def should_profile(self, path_info, environ):
+        if self.exclude_paths and path_info.startswith(self.exclude_paths):
+            return False
+        if self.path_re is not None and not self.path_re.search(path_info):
+            return False
+        if self.header is not None and self.header not in environ:
+            return False
+        return self.every == 1 or next(self.counter) % self.every == 0
+
+    def __call__(self, environ, start_response):
+        path_info = environ["PATH_INFO"]
+        if self.exclude_paths and path_info.startswith(self.exclude_paths):
+            return self.application(environ, start_response)
+        if not self.should_profile(path_info, environ):
+            return self.measure(environ, start_response)
+        if self.sampler is not None:
+            return self.sample(environ, start_response)
+        return self.profile(path_info, environ, start_response)
+
+    def measure(self, environ, start_response):
+        if self.aggregator is None:
+            return self.application(environ, start_response)
+        key = get_url_pattern(get_path_info(environ))
+        start = time.perf_counter()
+        try:
+            return self.application(environ, start_response)
+        finally:
+            self.aggregator.add(key, (time.perf_counter() - start) * 1000.0)
+
+    def sample(self, environ, start_response):
+        key = get_url_pattern(get_path_info(environ))
+        metrics = RequestMetrics(self.trace_sql, self.trace_memory)
+        try:
+            with metrics.record():
+                start = time.perf_counter()
+                self.sampler.begin(key)
+                try:
+                    return self.application(environ, start_response)
+                finally:
+                    self.sampler.end()
+                    elapms = (time.perf_counter() - start) * 1000.0
+        finally:
+            if self.aggregator is not None:
+                self.aggregator.add(key, elapms)
+                if metrics.enabled:
+                    self.aggregator.add_metrics(key, metrics)
+
+    def profile(self, path_info, environ, start_response):
+        key = None
+        if self.aggregator is not None:
+            key = get_url_pattern(get_path_info(environ))
+        metrics = RequestMetrics(self.trace_sql, self.trace_memory)
+        prof = cProfile.Profile()
+        try:
+            # memory snapshots are taken outside of the measured time
+            with metrics.record():
+                start = time.perf_counter()
+                try:
+                    return prof.runcall(self.application, environ, start_response)
+                finally:
+                    # seeing how long the request took is important!
+                    elapms = (time.perf_counter() - start) * 1000.0
+        finally:
+            if not metrics.enabled:
+                metrics = None
+            if key is not None:
+                self.aggregator.add(key, elapms)
+            # profiles of fast requests are dropped before any conversion
+            if elapms >= self.min_duration and key is not None:
+                self.submit(partial(self.aggregator.add_profile, key, prof, metrics))
+            elif elapms >= self.min_duration:
+                self.submit(
+                    partial(
+                        self.save_profile,
+                        prof,
+                        path_info,
+                        elapms,
+                        time.time(),
+                        metrics,
+                    )
+                )
+
+    def submit(self, job):
+        if self.writer is None:
+            job()
+        else:
+            self.writer.submit(job)
+
+    def save_profile(self, prof, path_info, elapms, timestamp, metrics=None):
+        path_name = path_info.strip("/").replace("/", ".") or "root"
+        profname = "%s.%d.prof" % (path_name, timestamp)
+        profname = os.path.join(self.prof_path, profname)
+        if self.use_lsprof:
+            kg = KCacheGrind(prof)
+            with open(profname, "w") as f:
+                kg.output(f)
+        else:
+            prof.dump_stats(profname)
+        profname2 = self.prof_file.format(
+            path=path_name, duration=int(elapms), time=int(timestamp)
+        )
+        os.rename(profname, os.path.join(self.prof_path, "%s.prof" % profname2))
+        if metrics is not None:
+            with open(os.path.join(self.prof_path, "%s.json" % profname2), "w") as f:
+                json.dump(metrics.as_dict(), f, indent=2)
+
+
 class Command(BaseCommand):
     help = "Starts a lightweight Web server with profiling enabled."
     args = "[optional port number, or ipaddr:port]"
@@ -119,7 +819,7 @@ class Command(BaseCommand):
         parser.add_argument(
             "--prof-file",
             dest="prof_file",
-            default="{path}.{duration:06d}ms.{time}",
+            default=DEFAULT_PROF_FILE,
             help='Set filename format, default if "{path}.{duration:06d}ms.{time}".',
         )
         parser.add_argument(
@@ -137,6 +837,114 @@ class Command(BaseCommand):
             help="Create kcachegrind compatible lsprof files, this requires "
             "and automatically enables cProfile.",
         )
+        parser.add_argument(
+            "--sampling",
+            action="store_true",
+            dest="sampling",
+            default=False,
+            help="Sample the stacks of the requests instead of profiling them "
+            "with cProfile, aggregated per URL pattern into a single file.",
+        )
+        parser.add_argument(
+            "--sampling-hz",
+            type=int,
+            dest="sampling_hz",
+            default=DEFAULT_SAMPLING_HZ,
+            help="Number of stack samples taken per second, defaults to %d."
+            % DEFAULT_SAMPLING_HZ,
+        )
+        parser.add_argument(
+            "--sampling-format",
+            dest="sampling_format",
+            choices=sorted(SAMPLING_FILES),
+            default="collapsed",
+            help="Write the samples in the collapsed stack format of "
+            "flamegraph.pl (default) or as a speedscope file.",
+        )
+        parser.add_argument(
+            "--aggregate",
+            action="store_true",
+            dest="aggregate",
+            default=False,
+            help="Merge the profiles of all requests per URL pattern instead of "
+            "writing one file per request, and keep their latency percentiles.",
+        )
+        parser.add_argument(
+            "--summary-interval",
+            type=int,
+            dest="summary_interval",
+            default=0,
+            help="With --aggregate or --sampling also write the profiles and "
+            "summary every this many seconds, not only on exit.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            dest="top",
+            default=DEFAULT_SUMMARY_TOP,
+            help="Number of functions listed per URL pattern in the summary, "
+            "defaults to %d." % DEFAULT_SUMMARY_TOP,
+        )
+        parser.add_argument(
+            "--writer-queue-size",
+            type=int,
+            dest="writer_queue_size",
+            default=DEFAULT_WRITER_QUEUE_SIZE,
+            help="Number of profiles waiting to be written in the background "
+            "before profiles are dropped, defaults to %d." % DEFAULT_WRITER_QUEUE_SIZE,
+        )
+        parser.add_argument(
+            "--drop-policy",
+            dest="drop_policy",
+            choices=DROP_POLICIES,
+            default="newest",
+            help="Drop the newest (default) or the oldest waiting profile when "
+            "the writer queue is full.",
+        )
+        parser.add_argument(
+            "--profile-every",
+            type=int,
+            dest="profile_every",
+            default=1,
+            help="Only profile one out of this many requests.",
+        )
+        parser.add_argument(
+            "--only-path",
+            dest="only_path",
+            default=None,
+            help="Only profile requests whose path matches this regular expression.",
+        )
+        parser.add_argument(
+            "--only-header",
+            dest="only_header",
+            default=None,
+            help="Only profile requests sending this HTTP header, e.g. X-Profile.",
+        )
+        parser.add_argument(
+            "--min-duration",
+            type=float,
+            dest="min_duration",
+            default=0,
+            help="Discard the profiles of requests faster than this many milliseconds.",
+        )
+        parser.add_argument(
+            "--sql",
+            action="store_true",
+            dest="trace_sql",
+            default=False,
+            help="Count the SQL queries of the profiled requests and their "
+            "time, written next to the profiles and into the summary.",
+        )
+        parser.add_argument(
+            "--trace-memory",
+            action="store_true",
+            dest="trace_memory",
+            default=False,
+            help="Trace memory allocations with tracemalloc and write the peak "
+            "and top allocation sites of the profiled requests next to the "
+            "profiles and into the summary. Requires --nothreading and slows down "
+            "the server considerably.",
+        )
 
         if USE_STATICFILES:
             parser.add_argument(
@@ -181,68 +989,83 @@ class Command(BaseCommand):
         no_media = options["no_media"]
         quit_command = (sys.platform == "win32") and "CTRL-BREAK" or "CONTROL-C"
 
-        def inner_run():
-            import os
-            import time
-
-            import cProfile
-
-            USE_LSPROF = options["use_lsprof"]
-
-            prof_path = options["prof_path"]
+        self.prof_path = options["prof_path"]
+        self.top = options["top"]
+        self.serving = False
+        self.sampler = None
+        self.aggregator = None
+        self.writer = None
+        self.dumper = None
+        if options["profile_every"] < 1:
+            raise CommandError("--profile-every must be a positive integer")
+        path_re = None
+        if options["only_path"]:
+            try:
+                path_re = re.compile(options["only_path"])
+            except re.error as e:
+                raise CommandError("Invalid --only-path regular expression: %s" % e)
+        if options["trace_memory"] and options["use_threading"]:
+            raise CommandError(
+                "--trace-memory requires --nothreading, the memory peak of "
+                "requests served at the same time cannot be told apart"
+            )
+        if options["sampling"] and options["min_duration"]:
+            raise CommandError("--min-duration cannot be used with --sampling")
+        if options["sampling"]:
+            if options["use_lsprof"]:
+                raise CommandError("--kcachegrind cannot be used with --sampling")
+            if options["sampling_hz"] < 1:
+                raise CommandError("--sampling-hz must be a positive integer")
+            self.sampler = StackSampler(options["sampling_hz"])
+            self.sampling_format = options["sampling_format"]
+            self.sampling_file = os.path.join(
+                self.prof_path, SAMPLING_FILES[self.sampling_format]
+            )
+        if options["aggregate"] or options["sampling"]:
+            if options["use_lsprof"]:
+                raise CommandError("--kcachegrind cannot be used with --aggregate")
+            if options["summary_interval"] < 0:
+                raise CommandError("--summary-interval cannot be negative")
+            self.aggregator = ProfileAggregator()
+            atexit.register(self.dump_profiles)
+            # signal handlers can only be installed from the main thread
+            self.dump_signal = (
+                hasattr(signal, "SIGUSR1")
+                and threading.current_thread() is threading.main_thread()
+            )
+            if self.dump_signal or options["summary_interval"]:
+                self.dumper = ProfileDumper(
+                    self.write_profiles, options["summary_interval"]
+                )
+            if self.dump_signal:
+                signal.signal(signal.SIGUSR1, self.request_dump)
+        if not options["sampling"]:
+            if options["writer_queue_size"] < 1:
+                raise CommandError("--writer-queue-size must be a positive integer")
+            self.writer = ProfileWriter(
+                options["writer_queue_size"], options["drop_policy"]
+            )
+            if self.aggregator is None:
+                atexit.register(self.dump_profiles)
 
+        def inner_run():
             prof_file = options["prof_file"]
             if not prof_file.format(path="1", duration=2, time=3):
-                prof_file = "{path}.{duration:06d}ms.{time}"
+                prof_file = DEFAULT_PROF_FILE
                 print(
                     "Filename format is wrong. "
                     "Default format used: '{path}.{duration:06d}ms.{time}'."
                 )
 
-            def get_exclude_paths():
-                exclude_paths = []
-                media_url = getattr(settings, "MEDIA_URL", None)
-                if media_url:
-                    exclude_paths.append(media_url)
-                static_url = getattr(settings, "STATIC_URL", None)
-                if static_url:
-                    exclude_paths.append(static_url)
-                return exclude_paths
-
-            def make_profiler_handler(inner_handler):
-                def handler(environ, start_response):
-                    path_info = environ["PATH_INFO"]
-                    # when using something like a dynamic site middleware is could be
-                    # necessary to refetch the exclude_paths every time since they could
-                    # change per site.
-                    if no_media and any(
-                        path_info.startswith(p) for p in get_exclude_paths()
-                    ):
-                        return inner_handler(environ, start_response)
-                    path_name = path_info.strip("/").replace("/", ".") or "root"
-                    profname = "%s.%d.prof" % (path_name, time.time())
-                    profname = os.path.join(prof_path, profname)
-                    prof = cProfile.Profile()
-                    start = datetime.now()
-                    try:
-                        return prof.runcall(inner_handler, environ, start_response)
-                    finally:
-                        # seeing how long the request took is important!
-                        elap = datetime.now() - start
-                        elapms = elap.seconds * 1000.0 + elap.microseconds / 1000.0
-                        if USE_LSPROF:
-                            kg = KCacheGrind(prof)
-                            with open(profname, "w") as f:
-                                kg.output(f)
-                        else:
-                            prof.dump_stats(profname)
-                        profname2 = prof_file.format(
-                            path=path_name, duration=int(elapms), time=int(time.time())
-                        )
-                        profname2 = os.path.join(prof_path, "%s.prof" % profname2)
-                        os.rename(profname, profname2)
-
-                return handler
+            self.serving = True
+            if self.sampler is not None:
+                self.sampler.start()
+            if self.writer is not None:
+                self.writer.start()
+            if options["trace_memory"] and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if self.dumper is not None:
+                self.dumper.start()
 
             print("Performing system checks...")
             self.check(display_num_errors=True)
@@ -253,6 +1076,11 @@ class Command(BaseCommand):
             )
             print("Development server is running at http://%s:%s/" % (addr, port))
             print("Quit the server with %s." % quit_command)
+            if self.aggregator is not None:
+                print(
+                    "Profiles are written to %s on exit%s."
+                    % (self.prof_path, self.dump_signal and " or SIGUSR1" or "")
+                )
             try:
                 handler = get_internal_wsgi_application()
                 if USE_STATICFILES:
@@ -260,7 +1088,22 @@ class Command(BaseCommand):
                     insecure_serving = options["insecure_serving"]
                     if use_static_handler and (settings.DEBUG or insecure_serving):
                         handler = StaticFilesHandler(handler)
-                handler = make_profiler_handler(handler)
+                handler = ProfilerHandler(
+                    handler,
+                    self.prof_path,
+                    prof_file,
+                    use_lsprof=options["use_lsprof"],
+                    no_media=no_media,
+                    sampler=self.sampler,
+                    aggregator=self.aggregator,
+                    writer=self.writer,
+                    every=options["profile_every"],
+                    path_re=path_re,
+                    header=options["only_header"],
+                    min_duration=options["min_duration"],
+                    trace_sql=options["trace_sql"],
+                    trace_memory=options["trace_memory"],
+                )
                 run(addr, int(port), handler, threading=options["use_threading"])
             except socket.error as e:
                 # Use helpful error messages instead of ugly tracebacks.
@@ -292,3 +1135,34 @@ class Command(BaseCommand):
                 autoreload.main(inner_run)
         else:
             inner_run()
+
+    def write_profiles(self):
+        if self.writer is not None:
+            self.writer.flush()
+        if self.sampler is not None:
+            self.sampler.dump(self.sampling_file, self.sampling_format)
+        self.aggregator.dump_stats(self.prof_path)
+        with atomic_write(os.path.join(self.prof_path, SUMMARY_FILE)) as f:
+            self.aggregator.write_summary(f, self.top)
+
+    def request_dump(self, *args):
+        # Runs as signal handler, possibly while this thread holds the locks
+        # of the aggregator, the dumper thread does the actual work.
+        self.dumper.request()
+
+    def dump_profiles(self):
+        # The reloader process never serves requests and has nothing to dump.
+        if not self.serving:
+            return
+        if self.dumper is not None:
+            self.dumper.stop()
+        if self.writer is not None:
+            self.writer.flush()
+            if self.writer.dropped:
+                print(
+                    "Dropped %d of %d profiles, the writer queue was full."
+                    % (self.writer.dropped, self.writer.submitted)
+                )
+        if self.aggregator is not None:
+            self.write_profiles()
+            print("Wrote profiles and %s to %s" % (SUMMARY_FILE, self.prof_path))
@@ -55,7 +55,10 @@ from django_extensions.management.utils import (
     setup_logger,
     signalcommand,
 )
-from django_extensions.management.debug_cursor import monkey_patch_cursordebugwrapper
+from django_extensions.management.debug_cursor import (
+    PRINT_SQL_MODES,
+    monkey_patch_cursordebugwrapper,
+)
 
 
 runserver_plus_started = Signal()
@@ -264,6 +267,24 @@ class Command(BaseCommand):
             default=False,
             help="Show location in code where SQL query generated from",
         )
+        parser.add_argument(
+            "--print-sql-mode",
+            choices=PRINT_SQL_MODES,
+            default=None,
+            help=(
+                "How SQL queries are printed: inline as they're executed, captured "
+                "and printed from a background thread, or as a summary on exit."
+            ),
+        )
+        parser.add_argument(
+            "--detect-n-plus-one",
+            action="store_true",
+            default=None,
+            help=(
+                "Together with --print-sql, report queries repeated from the same "
+                "line of code as potential N+1 queries."
+            ),
+        )
         cert_group = parser.add_mutually_exclusive_group()
         cert_group.add_argument(
             "--cert",
@@ -511,6 +532,8 @@ class Command(BaseCommand):
         with monkey_patch_cursordebugwrapper(
             print_sql=print_sql,
             print_sql_location=options["print_sql_location"],
+            print_sql_mode=options["print_sql_mode"],
+            detect_n_plus_one=options["detect_n_plus_one"],
             truncate=truncate,
             logger=logger.info,
             confprefix="RUNSERVER_PLUS",
@@ -13,9 +13,11 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand, CommandError
 
-from django_extensions.management.utils import signalcommand
+from django_extensions.management.utils import compile_template, signalcommand
 
 DEFAULT_FAKE_EMAIL = "%(username)s@example.com"
+DEFAULT_CHUNK_SIZE = 1000
+EMAIL_FIELDS = ("username", "first_name", "last_name")
 
 
 class Command(BaseCommand):
@@ -80,6 +82,16 @@ class Command(BaseCommand):
                 "(use comma separation for multiple groups)"
             ),
         )
+        parser.add_argument(
+            "--chunk-size",
+            dest="chunk_size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=(
+                "Number of users updated per query when the email format "
+                "cannot be expressed in SQL. Defaults to %d." % DEFAULT_CHUNK_SIZE
+            ),
+        )
 
     @signalcommand
     def handle(self, *args, **options):
@@ -95,6 +107,10 @@ class Command(BaseCommand):
         exclude_groups = options["exclude_groups"]
         no_admin = options["no_admin"]
         no_staff = options["no_staff"]
+        chunk_size = options["chunk_size"]
+        verbosity = options["verbosity"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer")
 
         User = get_user_model()
         users = User.objects.all()
@@ -102,27 +118,61 @@ class Command(BaseCommand):
             users = users.exclude(is_superuser=True)
         if no_staff:
             users = users.exclude(is_staff=True)
+        # Group filters are applied as subqueries on the membership table so
+        # users belonging to several groups are only updated once, and the
+        # UPDATE does not read from its own table (rejected by MySQL).
         if exclude_groups:
             groups = Group.objects.filter(name__in=exclude_groups.split(","))
             if groups:
-                users = users.exclude(groups__in=groups)
+                users = users.exclude(pk__in=self.get_members(User, groups))
             else:
                 raise CommandError("No groups matches filter: %s" % exclude_groups)
         if include_groups:
             groups = Group.objects.filter(name__in=include_groups.split(","))
             if groups:
-                users = users.filter(groups__in=groups)
+                users = users.filter(pk__in=self.get_members(User, groups))
             else:
                 raise CommandError("No groups matches filter: %s" % include_groups)
         if exclude_regexp:
             users = users.exclude(username__regex=exclude_regexp)
         if include_regexp:
             users = users.filter(username__regex=include_regexp)
-        for user in users:
+
+        expression = compile_template(email, EMAIL_FIELDS)
+        if expression is not None:
+            count = users.update(email=expression)
+        else:
+            count = self.update_in_chunks(users, email, chunk_size, verbosity)
+        print("Changed %d emails" % count)
+
+    def get_members(self, User, groups):
+        field = User._meta.get_field("groups")
+        memberships = field.remote_field.through.objects.filter(
+            **{"%s__in" % field.m2m_reverse_field_name(): groups}
+        )
+        return memberships.values(field.m2m_field_name())
+
+    def update_in_chunks(self, users, email, chunk_size, verbosity):
+        total = users.count()
+        count = 0
+        chunk = []
+        users = users.only("pk", *EMAIL_FIELDS).order_by("pk")
+        for user in users.iterator(chunk_size=chunk_size):
             user.email = email % {
                 "username": user.username,
                 "first_name": user.first_name,
                 "last_name": user.last_name,
             }
-            user.save()
-        print("Changed %d emails" % users.count())
+            chunk.append(user)
+            if len(chunk) == chunk_size:
+                count += self.update_chunk(users, chunk, count, total, verbosity)
+                chunk = []
+        if chunk:
+            count += self.update_chunk(users, chunk, count, total, verbosity)
+        return count
+
+    def update_chunk(self, users, chunk, count, total, verbosity):
+        users.model._default_manager.bulk_update(chunk, fields=["email"])
+        if verbosity > 0:
+            print("Changed %d/%d emails" % (count + len(chunk), total))
+        return len(chunk)
@@ -11,7 +11,10 @@ from django.utils.datastructures import OrderedSet
 
 from django_extensions.management.shells import import_objects
 from django_extensions.management.utils import signalcommand
-from django_extensions.management.debug_cursor import monkey_patch_cursordebugwrapper
+from django_extensions.management.debug_cursor import (
+    PRINT_SQL_MODES,
+    monkey_patch_cursordebugwrapper,
+)
 
 
 def use_vi_mode():
@@ -116,6 +119,24 @@ class Command(BaseCommand):
             default=False,
             help="Show location in code where SQL query generated from",
         )
+        parser.add_argument(
+            "--print-sql-mode",
+            choices=PRINT_SQL_MODES,
+            default=None,
+            help=(
+                "How SQL queries are printed: inline as they're executed, captured "
+                "and printed from a background thread, or as a summary on exit."
+            ),
+        )
+        parser.add_argument(
+            "--detect-n-plus-one",
+            action="store_true",
+            default=None,
+            help=(
+                "Together with --print-sql, report queries repeated from the same "
+                "line of code as potential N+1 queries."
+            ),
+        )
         parser.add_argument(
             "--dont-load",
             action="append",
@@ -620,6 +641,8 @@ for k, m in shells.import_objects({}, no_style()).items():
             print_sql=options["print_sql"] or print_sql,
             truncate=truncate,
             print_sql_location=options["print_sql_location"],
+            print_sql_mode=options["print_sql_mode"],
+            detect_n_plus_one=options["detect_n_plus_one"],
             confprefix="SHELL_PLUS",
         ):
             SETTINGS_SHELL_PLUS = getattr(settings, "SHELL_PLUS", None)
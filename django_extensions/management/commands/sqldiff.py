@@ -20,9 +20,14 @@ KNOWN ISSUES:
      positives or false negatives.
 """
 
+import functools
+import hashlib
 import importlib
+import json
+import os
 import sys
 import argparse
+from collections import namedtuple
 from typing import Dict, Union, Callable, Optional  # NOQA
 from django.apps import apps
 from django.core.management import BaseCommand, CommandError
@@ -33,10 +38,16 @@ from django.db.models import UniqueConstraint
 from django.db.models.fields import AutoField, IntegerField
 from django.db.models.options import normalize_together
 
-from django_extensions.management.utils import signalcommand
+from django_extensions.management.utils import (
+    add_parallel_argument,
+    map_in_threads,
+    signalcommand,
+)
 
 ORDERING_FIELD: IntegerField = IntegerField("_order", null=True)
 
+SCHEMA_SNAPSHOT_VERSION = 1
+
 
 def flatten(lst, ltypes=(list, tuple)):
     ltype = type(lst)
@@ -54,6 +65,12 @@ def flatten(lst, ltypes=(list, tuple)):
     return ltype(lst)
 
 
+@functools.lru_cache(maxsize=None)
+def snapshot_field_info(fields):
+    """Return a FieldInfo like namedtuple for rows of a schema snapshot"""
+    return namedtuple("FieldInfo", fields)
+
+
 def all_local_fields(meta):
     all_fields = []
     if meta.proxy:
@@ -252,6 +269,11 @@ class SQLDiff:
         self.new_db_fields = set()
         self.null = {}
         self.unsigned = set()
+        self.offline = False
+        self.schema_snapshot = None
+        self.schema_signature = None
+        self.table_signatures = {}
+        self.introspected = {}
 
         self.DIFF_SQL = {
             "error": self.SQL_ERROR,
@@ -281,6 +303,7 @@ class SQLDiff:
             table_info.name
             for table_info in self.introspection.get_table_list(self.cursor)
         ]
+        self.stale_tables = self.get_stale_tables()
 
         if self.can_detect_notnull_differ:
             self.load_null()
@@ -288,6 +311,202 @@ class SQLDiff:
         if self.can_detect_unsigned_differ:
             self.load_unsigned()
 
+    def load_offline(self):
+        """Load the database schema from the schema snapshot file"""
+        snapshot = self.read_schema_snapshot()
+        if snapshot is None:
+            raise CommandError(
+                "Schema snapshot %s does not exist." % self.options["snapshot"]
+            )
+        if snapshot["engine"] != connection.vendor:
+            raise CommandError(
+                "Schema snapshot %s was taken from a %s database, not %s."
+                % (self.options["snapshot"], snapshot["engine"], connection.vendor)
+            )
+        self.offline = True
+        self.schema_snapshot = snapshot
+        self.cursor = None
+        self.db_tables = snapshot["db_tables"]
+        self.django_tables = [
+            table_name
+            for table_name in self.introspection.django_table_names()
+            if not self.options["only_existing"] or table_name in self.db_tables
+        ]
+        self.stale_tables = []
+        self.load_snapshot_extra(snapshot["extra"])
+
+    def read_schema_snapshot(self):
+        path = self.options.get("snapshot")
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SCHEMA_SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def write_schema_snapshot(self):
+        """
+        Write the introspected tables to the schema snapshot file
+
+        Every table entry holds the catalog signature it was introspected
+        at and a hash of its content. Entries of tables which were not
+        introspected this time, e.g. of other apps, are kept from the existing
+        snapshot unless they are known to be stale.
+        """
+        null = {}
+        for (tablespace, table_name, column), value in sorted(self.null.items()):
+            null.setdefault(table_name, []).append([tablespace, column, value])
+        unsigned = {}
+        for tablespace, table_name, column in sorted(self.unsigned):
+            unsigned.setdefault(table_name, []).append([tablespace, column])
+
+        table_extras = self.dump_table_extras()
+
+        tables = {}
+        previous = self.read_schema_snapshot()
+        if previous and previous["engine"] == connection.vendor:
+            for table_name, entry in previous["tables"].items():
+                signature = self.table_signatures.get(table_name)
+                if (
+                    table_name in self.db_tables
+                    and self.is_snapshot_entry_valid(entry)
+                    and (signature is None or signature == entry["signature"])
+                ):
+                    tables[table_name] = entry
+
+        for table_name, (constraints, description, error) in sorted(
+            self.introspected.items()
+        ):
+            if error is not None:
+                continue
+            entry = {
+                "constraints": constraints,
+                "description": {
+                    "fields": list(description[0]._fields) if description else [],
+                    "rows": [list(row) for row in description],
+                },
+                "null": null.get(table_name, []),
+                "unsigned": unsigned.get(table_name, []),
+                "extra": table_extras.get(table_name, {}),
+            }
+            entry = json.loads(json.dumps(entry, default=str))
+            entry["hash"] = self.get_snapshot_entry_hash(entry)
+            entry["signature"] = self.table_signatures.get(table_name)
+            tables[table_name] = entry
+
+        snapshot = {
+            "version": SCHEMA_SNAPSHOT_VERSION,
+            "engine": connection.vendor,
+            "signature": self.schema_signature,
+            "db_tables": self.db_tables,
+            "extra": self.dump_snapshot_extra(),
+            "tables": tables,
+        }
+        with open(self.options["snapshot"], "w") as f:
+            json.dump(snapshot, f, sort_keys=True, separators=(",", ":"))
+
+    def get_snapshot_entry_hash(self, entry):
+        content = {
+            key: value
+            for key, value in entry.items()
+            if key not in ("hash", "signature")
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def is_snapshot_entry_valid(self, entry):
+        """
+        Return whether a schema snapshot table entry still matches its hash,
+        entries which were edited or corrupted are never trusted
+        """
+        return entry.get("hash") == self.get_snapshot_entry_hash(entry)
+
+    def get_schema_signature(self):
+        """
+        Return a signature changing whenever the schema of any table changes
+        or None when the backend does not support it
+        """
+        return None
+
+    def get_table_signatures(self):
+        """
+        Return a dict mapping table names to a signature changing whenever
+        the schema of that table changes or None when not supported
+        """
+        return None
+
+    def get_stale_tables(self):
+        """
+        Return the tables which need to be introspected from the database
+
+        Without --incremental that is every table, otherwise only the tables
+        missing from the schema snapshot or whose signature changed.
+        """
+        if not self.options.get("snapshot"):
+            return self.db_tables
+
+        if self.options.get("incremental"):
+            snapshot = self.read_schema_snapshot()
+            if snapshot and snapshot["engine"] == connection.vendor:
+                self.schema_snapshot = snapshot
+
+        self.schema_signature = self.get_schema_signature()
+        snapshot = self.schema_snapshot
+        if (
+            snapshot
+            and self.schema_signature is not None
+            and self.schema_signature == snapshot["signature"]
+        ):
+            # nothing changed since the snapshot was taken
+            self.table_signatures = {
+                table_name: entry["signature"]
+                for table_name, entry in snapshot["tables"].items()
+            }
+        else:
+            self.table_signatures = self.get_table_signatures() or {}
+
+        if not snapshot:
+            return self.db_tables
+        return [
+            table_name
+            for table_name in self.db_tables
+            if table_name not in snapshot["tables"]
+            or not self.is_snapshot_entry_valid(snapshot["tables"][table_name])
+            or self.table_signatures.get(table_name) is None
+            or snapshot["tables"][table_name]["signature"]
+            != self.table_signatures[table_name]
+        ]
+
+    def load_snapshot_table(self, table_name, entry):
+        """
+        Restore a table from the schema snapshot and return it in the format
+        of introspect_table()
+        """
+        for tablespace, column, value in entry["null"]:
+            self.null.setdefault((tablespace, table_name, column), value)
+        for tablespace, column in entry["unsigned"]:
+            self.unsigned.add((tablespace, table_name, column))
+        self.load_table_extra(table_name, entry["extra"])
+
+        fields = tuple(entry["description"]["fields"])
+        field_info = snapshot_field_info(fields)
+        table_description = [field_info(*row) for row in entry["description"]["rows"]]
+        return entry["constraints"], table_description, None
+
+    def dump_snapshot_extra(self):
+        """Return backend specific, database wide, schema snapshot data"""
+        return {}
+
+    def load_snapshot_extra(self, extra):
+        pass
+
+    def dump_table_extras(self):
+        """Return a dict mapping table names to backend specific snapshot data"""
+        return {}
+
+    def load_table_extra(self, table_name, extra):
+        pass
+
     def load_null(self):
         raise NotImplementedError(
             (
@@ -798,6 +1017,63 @@ class SQLDiff:
     def get_constraints(self, cursor, table_name, introspection):
         return {}
 
+    def introspect_table(self, cursor, table_name, introspection):
+        """
+        Return (table_constraints, table_description, error) for table_name
+
+        error is set, and table_description is None, when the table could not
+        be described.
+        """
+        if hasattr(introspection, "get_constraints"):
+            table_constraints = introspection.get_constraints(cursor, table_name)
+        else:
+            table_constraints = self.get_constraints(cursor, table_name, introspection)
+
+        try:
+            table_description = introspection.get_table_description(cursor, table_name)
+        except Exception as e:
+            transaction.rollback()  # reset transaction
+            return table_constraints, None, e
+        return table_constraints, table_description, None
+
+    def introspect_tables(self, table_names):
+        """
+        Introspect table_names and return a dict mapping each table name to
+        the result of introspect_table()
+
+        With the parallel option set the tables are spread over that many
+        worker threads, each using its own database connection.
+        """
+        workers = min(self.options.get("parallel") or 1, len(table_names))
+        if workers <= 1:
+            return {
+                table_name: self.introspect_table(
+                    self.cursor, table_name, self.introspection
+                )
+                for table_name in table_names
+            }
+
+        introspected = {}
+        partitions = [table_names[i::workers] for i in range(workers)]
+        for result in map_in_threads(self.introspect_partition, partitions, workers):
+            introspected.update(result)
+        return introspected
+
+    def introspect_partition(self, table_names):
+        with connection.cursor() as cursor:
+            return {
+                table_name: self.introspect_table(
+                    cursor, table_name, connection.introspection
+                )
+                for table_name in table_names
+            }
+
+    def get_app_models_to_diff(self):
+        for app_model in self.app_models:
+            if not self.options["include_proxy_models"] and app_model._meta.proxy:
+                continue
+            yield app_model
+
     def find_differences(self):
         if self.options["all_applications"]:
             self.add_app_model_marker(None, None)
@@ -808,15 +1084,52 @@ class SQLDiff:
                 ):
                     self.add_difference("table-missing-in-model", table)
 
+        app_models = list(self.get_app_models_to_diff())
+        table_names = list(
+            dict.fromkeys(
+                app_model._meta.db_table
+                for app_model in app_models
+                if app_model._meta.db_table in self.db_tables
+            )
+        )
+        snapshot_tables = self.schema_snapshot["tables"] if self.schema_snapshot else {}
+        stale_tables = set(self.stale_tables)
+        introspected = {}
+        if self.offline:
+            for table_name in table_names:
+                if table_name not in snapshot_tables:
+                    introspected[table_name] = (
+                        {},
+                        None,
+                        CommandError("table missing from schema snapshot"),
+                    )
+                elif not self.is_snapshot_entry_valid(snapshot_tables[table_name]):
+                    introspected[table_name] = (
+                        {},
+                        None,
+                        CommandError("table does not match its schema snapshot hash"),
+                    )
+        else:
+            introspected = self.introspect_tables(
+                [
+                    table_name
+                    for table_name in table_names
+                    if table_name in stale_tables or table_name not in snapshot_tables
+                ]
+            )
+        for table_name in table_names:
+            if table_name not in introspected:
+                introspected[table_name] = self.load_snapshot_table(
+                    table_name, snapshot_tables[table_name]
+                )
+        self.introspected = introspected
+
         cur_app_label = None
-        for app_model in self.app_models:
+        for app_model in app_models:
             meta = app_model._meta
             table_name = meta.db_table
             app_label = meta.app_label
 
-            if not self.options["include_proxy_models"] and meta.proxy:
-                continue
-
             if cur_app_label != app_label:
                 # Marker indicating start of difference scan for this table_name
                 self.add_app_model_marker(app_label, app_model.__name__)
@@ -826,14 +1139,7 @@ class SQLDiff:
                 self.add_difference("table-missing-in-db", table_name)
                 continue
 
-            if hasattr(self.introspection, "get_constraints"):
-                table_constraints = self.introspection.get_constraints(
-                    self.cursor, table_name
-                )
-            else:
-                table_constraints = self.get_constraints(
-                    self.cursor, table_name, self.introspection
-                )
+            table_constraints, table_description, error = introspected[table_name]
 
             fieldmap = dict(
                 [
@@ -846,15 +1152,10 @@ class SQLDiff:
             if meta.order_with_respect_to:
                 fieldmap["_order"] = ORDERING_FIELD
 
-            try:
-                table_description = self.introspection.get_table_description(
-                    self.cursor, table_name
-                )
-            except Exception as e:
+            if error is not None:
                 self.add_difference(
-                    "error", "unable to introspect table: %s" % str(e).strip()
+                    "error", "unable to introspect table: %s" % str(error).strip()
                 )
-                transaction.rollback()  # reset transaction
                 continue
 
             # map table_constraints into table_indexes
@@ -1039,12 +1340,27 @@ class MySQLDiff(SQLDiff):
         self.auto_increment = set()
         self.load_auto_increment()
 
+    def load_offline(self):
+        self.auto_increment = set()
+        super().load_offline()
+
+    def dump_table_extras(self):
+        extras = {}
+        for table_name, column in sorted(self.auto_increment):
+            extra = extras.setdefault(table_name, {"auto_increment": []})
+            extra["auto_increment"].append(column)
+        return extras
+
+    def load_table_extra(self, table_name, extra):
+        for column in extra.get("auto_increment", []):
+            self.auto_increment.add((table_name, column))
+
     def format_field_names(self, field_names):
         return [f.lower() for f in field_names]
 
     def load_null(self):
         tablespace = "public"
-        for table_name in self.db_tables:
+        for table_name in self.stale_tables:
             result = self.sql_to_dict(
                 """
                 SELECT column_name, is_nullable
@@ -1059,7 +1375,7 @@ class MySQLDiff(SQLDiff):
 
     def load_unsigned(self):
         tablespace = "public"
-        for table_name in self.db_tables:
+        for table_name in self.stale_tables:
             result = self.sql_to_dict(
                 """
                 SELECT column_name
@@ -1074,7 +1390,7 @@ class MySQLDiff(SQLDiff):
                 self.unsigned.add(key)
 
     def load_auto_increment(self):
-        for table_name in self.db_tables:
+        for table_name in self.stale_tables:
             result = self.sql_to_dict(
                 """
                 SELECT column_name
@@ -1250,8 +1566,27 @@ class SqliteSQLDiff(SQLDiff):
     can_detect_notnull_differ = True
     can_detect_unsigned_differ = False
 
+    def get_schema_signature(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA schema_version")
+            return cursor.fetchone()[0]
+
+    def get_table_signatures(self):
+        schema = {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tbl_name, type, name, sql FROM sqlite_master "
+                "ORDER BY tbl_name, type, name"
+            )
+            for table_name, *definition in cursor.fetchall():
+                schema.setdefault(table_name, []).append(definition)
+        return {
+            table_name: hashlib.sha256(json.dumps(definition).encode()).hexdigest()
+            for table_name, definition in schema.items()
+        }
+
     def load_null(self):
-        for table_name in self.db_tables:
+        for table_name in self.stale_tables:
             # sqlite does not support tablespaces
             tablespace = "public"
             # index, column_name, column_type, nullable, default_value
@@ -1355,6 +1690,130 @@ class PostgresqlSQLDiff(SQLDiff):
         INNER JOIN pg_namespace ON pg_namespace.oid=pg_class.relnamespace;
     """
 
+    # Catalog snapshot, these load the state of all visible tables at once so
+    # the per-table diff does not need any further queries.
+    SQL_LOAD_SNAPSHOT_COLUMNS = """
+        SELECT
+            c.relname,
+            a.attname,
+            CASE WHEN t.typtype = 'd' THEN t.typbasetype ELSE a.atttypid END,
+            t.typlen,
+            CASE WHEN t.typtype = 'd' THEN t.typtypmod ELSE a.atttypmod END,
+            NOT (a.attnotnull OR (t.typtype = 'd' AND t.typnotnull)),
+            pg_get_expr(ad.adbin, ad.adrelid),
+            CASE WHEN collname = 'default' THEN NULL ELSE collname END,
+            a.attidentity != '',
+            col_description(a.attrelid, a.attnum),
+            format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef ad ON a.attrelid = ad.adrelid AND a.attnum = ad.adnum
+        LEFT JOIN pg_collation co ON a.attcollation = co.oid
+        JOIN pg_type t ON a.atttypid = t.oid
+        JOIN pg_class c ON a.attrelid = c.oid
+        JOIN pg_namespace n ON c.relnamespace = n.oid
+        WHERE c.relkind IN ('f', 'm', 'p', 'r', 'v')
+            AND n.nspname NOT IN ('pg_catalog', 'pg_toast')
+            AND pg_catalog.pg_table_is_visible(c.oid)
+            AND c.relname = ANY(%s)
+            AND a.attnum > 0
+            AND NOT a.attisdropped
+        ORDER BY c.relname, a.attnum;
+    """
+    SQL_LOAD_SNAPSHOT_CONSTRAINTS = """
+        SELECT
+            cl.relname,
+            c.conname,
+            array(
+                SELECT attname
+                FROM unnest(c.conkey) WITH ORDINALITY cols(colid, arridx)
+                JOIN pg_attribute AS ca ON cols.colid = ca.attnum
+                WHERE ca.attrelid = c.conrelid
+                ORDER BY cols.arridx
+            ),
+            c.contype,
+            (SELECT fkc.relname || '.' || fka.attname
+            FROM pg_attribute AS fka
+            JOIN pg_class AS fkc ON fka.attrelid = fkc.oid
+            WHERE fka.attrelid = c.confrelid AND fka.attnum = c.confkey[1]),
+            cl.reloptions
+        FROM pg_constraint AS c
+        JOIN pg_class AS cl ON c.conrelid = cl.oid
+        WHERE pg_catalog.pg_table_is_visible(cl.oid) AND cl.relname = ANY(%s)
+        ORDER BY cl.relname, c.conname;
+    """
+    SQL_LOAD_SNAPSHOT_INDEXES = """
+        SELECT
+            tablename,
+            indexname,
+            array_agg(attname ORDER BY arridx),
+            indisunique,
+            indisprimary,
+            array_agg(ordering ORDER BY arridx),
+            amname,
+            exprdef,
+            s2.attoptions
+        FROM (
+            SELECT
+                c.relname as tablename, c2.relname as indexname, idx.*,
+                attr.attname, am.amname,
+                CASE
+                    WHEN idx.indexprs IS NOT NULL THEN
+                        pg_get_indexdef(idx.indexrelid)
+                END AS exprdef,
+                CASE am.amname
+                    WHEN 'btree' THEN
+                        CASE (option & 1)
+                            WHEN 1 THEN 'DESC' ELSE 'ASC'
+                        END
+                END as ordering,
+                c2.reloptions as attoptions
+            FROM (
+                SELECT *
+                FROM
+                    pg_index i,
+                    unnest(i.indkey, i.indoption)
+                        WITH ORDINALITY koi(key, option, arridx)
+            ) idx
+            LEFT JOIN pg_class c ON idx.indrelid = c.oid
+            LEFT JOIN pg_class c2 ON idx.indexrelid = c2.oid
+            LEFT JOIN pg_am am ON c2.relam = am.oid
+            LEFT JOIN
+                pg_attribute attr ON attr.attrelid = c.oid AND attr.attnum = idx.key
+            WHERE pg_catalog.pg_table_is_visible(c.oid) AND c.relname = ANY(%s)
+        ) s2
+        GROUP BY tablename, indexname, indisunique, indisprimary, amname, exprdef,
+            attoptions
+        ORDER BY tablename, indexname;
+    """
+    SQL_LOAD_SNAPSHOT_ARRAY_TYPES = """
+        SELECT typelem, typname FROM pg_type
+        WHERE typcategory = 'A' AND typelem != 0 ORDER BY oid;
+    """
+    SQL_LOAD_TABLE_SIGNATURES = """
+        SELECT c.relname, md5(concat_ws('|',
+            c.relfilenode,
+            (SELECT string_agg(
+                a.attname || ':' || a.atttypid || ':' || a.atttypmod || ':'
+                || a.attnotnull || ':' || coalesce(pg_get_expr(ad.adbin, ad.adrelid), ''),
+                ',' ORDER BY a.attnum)
+            FROM pg_attribute a
+            LEFT JOIN pg_attrdef ad ON a.attrelid = ad.adrelid AND a.attnum = ad.adnum
+            WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped),
+            (SELECT string_agg(
+                con.conname || ':' || pg_get_constraintdef(con.oid), ',' ORDER BY con.conname)
+            FROM pg_constraint con
+            WHERE con.conrelid = c.oid),
+            (SELECT string_agg(pg_get_indexdef(i.indexrelid), ',' ORDER BY i.indexrelid)
+            FROM pg_index i
+            WHERE i.indrelid = c.oid)
+        ))
+        FROM pg_class c
+        JOIN pg_namespace n ON c.relnamespace = n.oid
+        WHERE c.relkind IN ('f', 'm', 'p', 'r', 'v')
+            AND n.nspname NOT IN ('pg_catalog', 'pg_toast')
+            AND pg_catalog.pg_table_is_visible(c.oid);
+    """  # noqa: E501
+
     SQL_FIELD_TYPE_DIFFER = lambda self, style, qn, args: (
         "%s %s\n\t%s %s %s %s;"
         % (
@@ -1393,6 +1852,218 @@ class PostgresqlSQLDiff(SQLDiff):
         super().load()
         self.check_constraints = {}
         self.load_constraints()
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        """
+        Load columns, constraints, indexes and array types of all tables with
+        a handful of catalog queries
+
+        The per-table diff then runs from these dictionaries instead of
+        querying the database for every table and field.
+        """
+        from django.db.backends.postgresql.introspection import FieldInfo
+
+        self.table_descriptions = {}
+        self.table_constraints = {}
+        self.column_types = {}
+        self.array_element_types = {}
+
+        stale_tables = list(self.stale_tables)
+        with connection.cursor() as cursor:
+            cursor.execute(self.SQL_LOAD_SNAPSHOT_COLUMNS, [stale_tables])
+            for row in cursor.fetchall():
+                table_name, column_name = row[:2]
+                description = self.get_snapshot_description(row[1:10])
+                self.table_descriptions.setdefault(table_name, []).append(
+                    FieldInfo(*(description.get(name) for name in FieldInfo._fields))
+                )
+                self.column_types[(table_name, column_name)] = row[10]
+
+            for table_name in self.table_descriptions:
+                self.table_constraints[table_name] = {}
+
+            cursor.execute(self.SQL_LOAD_SNAPSHOT_CONSTRAINTS, [stale_tables])
+            for (
+                table_name,
+                constraint,
+                columns,
+                kind,
+                used_cols,
+                options,
+            ) in cursor.fetchall():
+                self.table_constraints.setdefault(table_name, {})[constraint] = {
+                    "columns": columns,
+                    "primary_key": kind == "p",
+                    "unique": kind in ["p", "u"],
+                    "foreign_key": tuple(used_cols.split(".", 1))
+                    if kind == "f"
+                    else None,
+                    "check": kind == "c",
+                    "index": False,
+                    "definition": None,
+                    "options": options,
+                }
+
+            cursor.execute(self.SQL_LOAD_SNAPSHOT_INDEXES, [stale_tables])
+            for (
+                table_name,
+                index,
+                columns,
+                unique,
+                primary,
+                orders,
+                type_,
+                definition,
+                options,
+            ) in cursor.fetchall():
+                constraints = self.table_constraints.setdefault(table_name, {})
+                if index in constraints:
+                    continue
+                basic_index = (
+                    type_ == "btree"
+                    # '_btree' references
+                    # django.contrib.postgres.indexes.BTreeIndex.suffix.
+                    and not index.endswith("_btree")
+                    and options is None
+                )
+                constraints[index] = {
+                    "columns": columns if columns != [None] else [],
+                    "orders": orders if orders != [None] else [],
+                    "primary_key": primary,
+                    "unique": unique,
+                    "foreign_key": None,
+                    "check": False,
+                    "index": True,
+                    "type": models.Index.suffix if basic_index else type_,
+                    "definition": definition,
+                    "options": options,
+                }
+
+            cursor.execute(self.SQL_LOAD_SNAPSHOT_ARRAY_TYPES)
+            for typelem, typname in cursor.fetchall():
+                self.array_element_types.setdefault(typelem, typname)
+
+    def load_offline(self):
+        self.check_constraints = {}
+        self.table_descriptions = {}
+        self.table_constraints = {}
+        self.column_types = {}
+        self.array_element_types = {}
+        super().load_offline()
+
+    def get_table_signatures(self):
+        with connection.cursor() as cursor:
+            cursor.execute(self.SQL_LOAD_TABLE_SIGNATURES)
+            return dict(cursor.fetchall())
+
+    def dump_snapshot_extra(self):
+        return {"array_element_types": self.array_element_types}
+
+    def load_snapshot_extra(self, extra):
+        for typelem, typname in extra["array_element_types"].items():
+            self.array_element_types.setdefault(int(typelem), typname)
+
+    def dump_table_extras(self):
+        extras = {}
+        for key, dct in sorted(self.check_constraints.items()):
+            extra = extras.setdefault(key[1], {"check_constraints": []})
+            extra["check_constraints"].append(dct)
+        for (table_name, column), column_type in self.column_types.items():
+            extra = extras.setdefault(table_name, {})
+            extra.setdefault("column_types", {})[column] = column_type
+        return extras
+
+    def load_table_extra(self, table_name, extra):
+        for dct in extra.get("check_constraints", []):
+            key = (dct["nspname"], dct["relname"], dct["attname"])
+            self.check_constraints.setdefault(key, dct)
+        for column, column_type in extra.get("column_types", {}).items():
+            self.column_types.setdefault((table_name, column), column_type)
+
+    def is_psycopg3(self):
+        return connection.Database.__name__ == "psycopg"
+
+    def get_snapshot_description(self, row):
+        """
+        Map a catalog snapshot row to the values introspection.get_table_description()
+        derives from the cursor.description of the database driver in use
+        """
+        (
+            name,
+            type_code,
+            typlen,
+            typmod,
+            null_ok,
+            default,
+            collation,
+            is_autofield,
+            comment,
+        ) = row
+        display_size = precision = scale = None
+        if self.is_psycopg3():
+            # psycopg.Column
+            internal_size = typlen if typlen >= 0 else None
+            if type_code == 1043 and typmod >= 0:
+                # varchar
+                display_size = typmod - 4
+            elif type_code == 1700 and typmod >= 4:
+                # numeric
+                precision = (typmod - 4) >> 16
+                scale = (typmod - 4) & 0xFFFF
+            elif type_code in (1083, 1114, 1184, 1186, 1266) and typmod >= 0:
+                # time, timestamp, timestamptz, interval, timetz
+                precision = typmod & 0xFFFF
+        else:
+            # psycopg2.extensions.Column
+            fmod = typmod - 4 if typmod > 0 else typmod
+            if typlen != -1:
+                internal_size = typlen
+            elif type_code == 1700:
+                internal_size = (fmod >> 16) & 0xFFFF
+            else:
+                internal_size = fmod
+            if type_code == 1700:
+                precision = (fmod >> 16) & 0xFFFF
+                scale = fmod & 0xFFFF
+        return {
+            "name": name,
+            "type_code": type_code,
+            # display_size is always None on psycopg2.
+            "display_size": internal_size if display_size is None else display_size,
+            "internal_size": internal_size,
+            "precision": precision,
+            "scale": scale,
+            "null_ok": null_ok,
+            "default": default,
+            "collation": collation,
+            "is_autofield": is_autofield,
+            "comment": comment,
+        }
+
+    def introspect_table(self, cursor, table_name, introspection):
+        if table_name not in self.table_descriptions:
+            return super().introspect_table(cursor, table_name, introspection)
+        return (
+            self.table_constraints[table_name],
+            self.table_descriptions[table_name],
+            None,
+        )
+
+    def introspect_tables(self, table_names):
+        # Everything is served from the catalog snapshot, worker threads would
+        # only add overhead.
+        if (self.options.get("parallel") or 1) > 1:
+            self.stderr.write(
+                "--parallel has no effect on PostgreSQL, the tables are "
+                "introspected from the catalogs read up front.\n"
+            )
+        return {
+            table_name: self.introspect_table(
+                self.cursor, table_name, self.introspection
+            )
+            for table_name in table_names
+        }
 
     def load_null(self):
         for dct in self.sql_to_dict(self.SQL_LOAD_NULL, []):
@@ -1590,17 +2261,26 @@ class PostgresqlSQLDiff(SQLDiff):
                 #       to compare to whatever django spits out as the desired database
                 #       type ?
                 attname = field.db_column or field.attname
-                introspect_db_type = self.sql_to_dict(
-                    """SELECT attname, format_type(atttypid, atttypmod) AS type
-                        FROM   pg_attribute
-                        WHERE  attrelid = %s::regclass
-                        AND    attname = %s
-                        AND    attnum > 0
-                        AND    NOT attisdropped
-                        ORDER  BY attnum;
-                    """,
-                    (table_name, attname),
-                )[0]["type"]
+                introspect_db_type = self.column_types.get((table_name, attname))
+                if introspect_db_type is None and self.offline:
+                    self.add_difference(
+                        "comment",
+                        "Type of array field '%s' missing from schema snapshot"
+                        % attname,
+                    )
+                    return None
+                if introspect_db_type is None:
+                    introspect_db_type = self.sql_to_dict(
+                        """SELECT attname, format_type(atttypid, atttypmod) AS type
+                            FROM   pg_attribute
+                            WHERE  attrelid = %s::regclass
+                            AND    attname = %s
+                            AND    attnum > 0
+                            AND    NOT attisdropped
+                            ORDER  BY attnum;
+                        """,
+                        (table_name, attname),
+                    )[0]["type"]
                 if introspect_db_type.startswith("character varying"):
                     introspect_db_type = introspect_db_type.replace(
                         "character varying", "varchar"
@@ -1639,6 +2319,9 @@ class PostgresqlSQLDiff(SQLDiff):
         return db_type
 
     def get_field_db_type_lookup(self, type_code):
+        if type_code in self.array_element_types:
+            name = self.array_element_types[type_code]
+            return self.DATA_TYPES_REVERSE_NAME.get(name.strip("_"))
         try:
             name = self.sql_to_dict(
                 "SELECT typname FROM pg_type WHERE typelem=%s;", [type_code]
@@ -1732,6 +2415,34 @@ to check/debug ur models compared to the real database tables and columns."""  #
             default=False,
             help="Include default values in SQL output (beta feature)",
         )
+        add_parallel_argument(parser, "Introspect tables")
+        parser.add_argument(
+            "--snapshot",
+            dest="snapshot",
+            default=None,
+            metavar="FILE",
+            help="Write the introspected database schema to a snapshot FILE.",
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            dest="offline",
+            default=False,
+            help=(
+                "Compare the models against the schema snapshot FILE instead of "
+                "the database."
+            ),
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            dest="incremental",
+            default=False,
+            help=(
+                "Reuse the schema snapshot FILE and only introspect tables which "
+                "changed since it was written."
+            ),
+        )
         parser.add_argument(
             "--migrate-for-tests",
             action="store_true",
@@ -1782,6 +2493,9 @@ to check/debug ur models compared to the real database tables and columns."""  #
         if not app_models:
             raise CommandError("Unable to execute sqldiff no models founds.")
 
+        if (options["offline"] or options["incremental"]) and not options["snapshot"]:
+            raise CommandError("--offline and --incremental require --snapshot.")
+
         migrate_for_tests = options["migrate_for_tests"]
         if migrate_for_tests:
             from django.core.management import call_command
@@ -1798,8 +2512,13 @@ to check/debug ur models compared to the real database tables and columns."""  #
         sqldiff_instance = cls(
             app_models, options, stdout=self.stdout, stderr=self.stderr
         )
-        sqldiff_instance.load()
+        if options["offline"]:
+            sqldiff_instance.load_offline()
+        else:
+            sqldiff_instance.load()
         sqldiff_instance.find_differences()
+        if options["snapshot"] and not options["offline"]:
+            sqldiff_instance.write_schema_snapshot()
         if not sqldiff_instance.has_differences:
             self.exit_code = 0
         sqldiff_instance.print_diff(self.style)
@@ -16,15 +16,25 @@ from django.core import serializers
 from django.core.management.base import BaseCommand, CommandError
 from django.core.management.color import no_style
 from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.constants import OnConflict
 from django.template.defaultfilters import pluralize
 
 from django_extensions.management.utils import signalcommand
 
 
+DEFAULT_BATCH_SIZE = 1000
+
+
 def humanize(dirname):
     return "'%s'" % dirname if dirname else "absolute path"
 
 
+def iter_chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
 class SyncDataError(Exception):
     pass
 
@@ -59,6 +69,16 @@ class Command(BaseCommand):
                 'Defaults to the "default" database.'
             ),
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            dest="batch_size",
+            help=(
+                "Number of objects to write or delete per query. "
+                "Defaults to %d." % DEFAULT_BATCH_SIZE
+            ),
+        )
         parser.add_argument(
             "fixture_labels",
             nargs="?",
@@ -70,23 +90,35 @@ class Command(BaseCommand):
         """
         Delete all the objects in the database that are not in objects_to_keep.
         - objects_to_keep: A map where the keys are classes, and the values are a
-         set of the objects of that class we should keep.
+         set of the primary keys of the objects of that class we should keep.
         """
-        for class_ in objects_to_keep.keys():
-            current = class_.objects.all()
-            current_ids = set(x.pk for x in current)
-            keep_ids = set(x.pk for x in objects_to_keep[class_])
-
-            remove_these_ones = current_ids.difference(keep_ids)
-            if remove_these_ones:
-                for obj in current:
-                    if obj.pk in remove_these_ones:
-                        obj.delete()
-                        if verbosity >= 2:
-                            print("Deleted object: %s" % str(obj))
-
-            if verbosity > 0 and remove_these_ones:
-                num_deleted = len(remove_these_ones)
+        for class_, keep_ids in objects_to_keep.items():
+            queryset = class_._default_manager.using(self.using)
+            if len(keep_ids) <= self.batch_size:
+                remove_these_ones = [queryset.exclude(pk__in=keep_ids)]
+            else:
+                # Too many primary keys to keep for a single query, find the
+                # ones to delete instead.
+                remove_ids = [
+                    pk
+                    for pk in queryset.values_list("pk", flat=True).iterator()
+                    if pk not in keep_ids
+                ]
+                remove_these_ones = [
+                    queryset.filter(pk__in=chunk)
+                    for chunk in iter_chunks(remove_ids, self.batch_size)
+                ]
+
+            num_deleted = 0
+            for to_delete in remove_these_ones:
+                if verbosity >= 2:
+                    for obj in to_delete:
+                        print("Deleted object: %s" % str(obj))
+                _, deleted_per_model = to_delete.delete()
+                num_deleted += deleted_per_model.get(class_._meta.label, 0)
+            self.counts["deleted"] += num_deleted
+
+            if verbosity > 0 and num_deleted:
                 if num_deleted > 1:
                     type_deleted = str(class_._meta.verbose_name_plural)
                 else:
@@ -94,10 +126,195 @@ class Command(BaseCommand):
 
                 print("Deleted %s %s" % (str(num_deleted), type_deleted))
 
+    def can_bulk_save(self, model):
+        features = connections[self.using].features
+        return features.supports_update_conflicts or (
+            features.supports_ignore_conflicts and not self.get_update_fields(model)
+        )
+
+    def get_insert_fields(self, model):
+        return [
+            field
+            for field in model._meta.local_concrete_fields
+            if not getattr(field, "generated", False)
+        ]
+
+    def get_update_fields(self, model):
+        return [
+            field for field in self.get_insert_fields(model) if not field.primary_key
+        ]
+
+    def save_objects(self, objects, objects_to_keep):
+        """
+        Save the deserialized objects in batches of batch_size, recording the
+        primary key of every object in objects_to_keep.
+        Return the number of objects saved.
+        """
+        batches = {}
+        count = 0
+        for obj in objects:
+            class_ = obj.object.__class__
+            objects_to_keep.setdefault(class_, set()).add(obj.object.pk)
+            batches.setdefault(class_, []).append(obj)
+            count += 1
+            if count % self.batch_size == 0:
+                self.flush_batches(batches)
+        self.flush_batches(batches)
+        return count
+
+    def get_changed_objects(self, model, batch):
+        """
+        Return the deserialized objects of batch that are missing from the
+        database or differ from their stored row, fetching the stored rows and
+        many-to-many relations of the whole batch at once.
+        """
+        fields = self.get_insert_fields(model)
+        queryset = model._base_manager.using(self.using)
+        pks = [obj.object.pk for obj in batch]
+        pk_index = [field.primary_key for field in fields].index(True)
+
+        existing = {}
+        for chunk in iter_chunks(pks, self.batch_size):
+            rows = queryset.filter(pk__in=chunk).values_list(
+                *[field.attname for field in fields]
+            )
+            for row in rows:
+                existing[row[pk_index]] = row
+
+        existing_m2m = {}
+        names = {name for obj in batch for name in (obj.m2m_data or {})}
+        for name in names:
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            relations = existing_m2m[name] = {}
+            manager = through._base_manager.using(self.using)
+            for chunk in iter_chunks(pks, self.batch_size):
+                rows = manager.filter(**{"%s__in" % source: chunk}).values_list(
+                    source, target
+                )
+                for pk, value in rows:
+                    relations.setdefault(pk, set()).add(value)
+
+        changed = []
+        for obj in batch:
+            row = existing.get(obj.object.pk)
+            if row is None:
+                self.counts["inserted"] += 1
+                changed.append(obj)
+            elif any(
+                field.get_prep_value(getattr(obj.object, field.attname))
+                != field.get_prep_value(value)
+                for field, value in zip(fields, row)
+            ) or any(
+                set(values) != existing_m2m[name].get(obj.object.pk, set())
+                for name, values in (obj.m2m_data or {}).items()
+            ):
+                self.counts["updated"] += 1
+                changed.append(obj)
+            else:
+                self.counts["unchanged"] += 1
+        return changed
+
+    def flush_batches(self, batches):
+        # Models are flushed in the order they appear in the fixture, so
+        # objects referenced by later ones are written first.
+        for class_, batch in batches.items():
+            batch = self.get_changed_objects(class_._meta.concrete_model, batch)
+            if not batch:
+                continue
+            if self.can_bulk_save(class_):
+                self.bulk_save(class_._meta.concrete_model, batch)
+            else:
+                for obj in batch:
+                    obj.save(using=self.using)
+        batches.clear()
+
+    def bulk_save(self, model, batch):
+        """
+        Insert or update a batch of deserialized objects of model.
+
+        Like DeserializedObject.save() the rows are written raw: only the
+        model's own table is written, pre_save() hooks such as auto_now are
+        not applied and no signals are sent.
+        """
+        connection = connections[self.using]
+        features = connection.features
+        fields = self.get_insert_fields(model)
+        update_fields = self.get_update_fields(model)
+        if update_fields:
+            on_conflict = OnConflict.UPDATE
+            unique_fields = (
+                [model._meta.pk]
+                if features.supports_update_conflicts_with_target
+                else []
+            )
+        else:
+            on_conflict = OnConflict.IGNORE
+            unique_fields = None
+            update_fields = None
+
+        instances = [obj.object for obj in batch]
+        max_batch_size = max(connection.ops.bulk_batch_size(fields, instances), 1)
+        queryset = model._base_manager.using(self.using)
+        for chunk in iter_chunks(instances, min(self.batch_size, max_batch_size)):
+            queryset._insert(
+                chunk,
+                fields=fields,
+                raw=True,
+                using=self.using,
+                on_conflict=on_conflict,
+                update_fields=update_fields,
+                unique_fields=unique_fields,
+            )
+
+        self.bulk_save_many_to_many(model, batch)
+
+    def bulk_save_many_to_many(self, model, batch):
+        """
+        Replace the many-to-many relations of a batch of deserialized objects,
+        with one DELETE and a bulk INSERT per relation.
+        """
+        relations = {}
+        for obj in batch:
+            for name, values in (obj.m2m_data or {}).items():
+                relations.setdefault(name, []).append((obj.object.pk, values))
+
+        for name, items in relations.items():
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            symmetrical = (
+                field.remote_field.symmetrical and field.related_model is model
+            )
+            pks = [pk for pk, _ in items]
+
+            manager = through._base_manager.using(self.using)
+            for chunk in iter_chunks(pks, self.batch_size):
+                manager.filter(**{"%s__in" % source: chunk}).delete()
+                if symmetrical:
+                    manager.filter(**{"%s__in" % target: chunk}).delete()
+
+            rows = []
+            for pk, values in items:
+                for value in values:
+                    rows.append(through(**{source: pk, target: value}))
+                    if symmetrical and value != pk:
+                        rows.append(through(**{source: value, target: pk}))
+            manager.bulk_create(
+                rows, batch_size=self.batch_size, ignore_conflicts=symmetrical
+            )
+
     @signalcommand
     def handle(self, *args, **options):
         self.style = no_style()
         self.using = options["database"]
+        self.batch_size = options["batch_size"]
+        if self.batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer")
+        self.counts = dict.fromkeys(("inserted", "updated", "unchanged", "deleted"), 0)
         fixture_labels = (
             options["fixture_labels"].split(",") if options["fixture_labels"] else ()
         )
@@ -195,25 +412,28 @@ class Command(BaseCommand):
                                 )
                             try:
                                 objects_to_keep = {}
-                                objects = list(
-                                    serializers.deserialize(format_, fixture)
-                                )
-                                for obj in objects:
-                                    class_ = obj.object.__class__
-                                    if class_ not in objects_to_keep:
-                                        objects_to_keep[class_] = set()
-                                    objects_to_keep[class_].add(obj.object)
-
                                 if options["remove"] and options["remove_before"]:
+                                    # Only the primary keys are needed to
+                                    # remove objects upfront, the fixture is
+                                    # read a second time to save them.
+                                    for obj in serializers.deserialize(
+                                        format_, fixture
+                                    ):
+                                        objects_to_keep.setdefault(
+                                            obj.object.__class__, set()
+                                        ).add(obj.object.pk)
                                     self.remove_objects_not_in(
                                         objects_to_keep, verbosity
                                     )
+                                    fixture.seek(0)
 
-                                for obj in objects:
-                                    object_count += 1
-                                    objects_per_fixture[-1] += 1
-                                    models.add(obj.object.__class__)
-                                    obj.save()
+                                count = self.save_objects(
+                                    serializers.deserialize(format_, fixture),
+                                    objects_to_keep,
+                                )
+                                object_count += count
+                                objects_per_fixture[-1] += count
+                                models.update(objects_to_keep)
 
                                 if options["remove"] and not options["remove_before"]:
                                     self.remove_objects_not_in(
@@ -278,3 +498,7 @@ class Command(BaseCommand):
                         pluralize(fixture_count),
                     )
                 )
+                print(
+                    "%(inserted)d inserted, %(updated)d updated, "
+                    "%(unchanged)d unchanged, %(deleted)d deleted" % self.counts
+                )
@@ -1,47 +1,377 @@
 import os
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, reduce
+from operator import or_
 
 from django.apps import apps
 from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage, InMemoryStorage, storages
 from django.core.management.base import BaseCommand, CommandError
 from django.db import models
+from django.utils.functional import LazyObject, empty
 
 from django_extensions.management.utils import signalcommand
 
+DEFAULT_BATCH_SIZE = 100
+
+
+def scan_directory(path):
+    """Return the sorted (name, size) files and sorted subdirectories of path."""
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                else:
+                    try:
+                        size = entry.stat().st_size
+                    except OSError:
+                        size = 0
+                    files.append((entry.name, size))
+    except OSError:
+        pass
+    return sorted(files), sorted(dirs)
+
+
+def join_name(path, name):
+    """Join storage names, which always use forward slashes."""
+    return "%s/%s" % (path, name) if path else name
+
+
+def walk_files(root, executor, scan=scan_directory, join=os.path.join):
+    """
+    Yield (path, size) for every file under root, sorted by path.
+
+    Directories are listed with scan() by the executor's worker threads ahead
+    of the walk, while files are yielded in order from the main thread.
+    """
+
+    def walk(path, future):
+        files, dirs = future.result()
+        # Start listing the subdirectories before walking the first one.
+        futures = [executor.submit(scan, join(path, name)) for name in dirs]
+        entries = sorted(
+            [(name, size, None) for name, size in files]
+            + [(name, None, future) for name, future in zip(dirs, futures)],
+            key=lambda entry: entry[0],
+        )
+        for name, size, subdir_future in entries:
+            if subdir_future is None:
+                yield join(path, name), size
+            else:
+                yield from walk(join(path, name), subdir_future)
+
+    yield from walk(root, executor.submit(scan, root))
+
+
+def get_storage(storage):
+    """Return the storage wrapped by a lazy storage such as default_storage."""
+    if isinstance(storage, LazyObject):
+        if storage._wrapped is empty:
+            storage._setup()
+        return storage._wrapped
+    return storage
+
+
+def get_name_mapper(field_storage, storage):
+    """
+    Return a function mapping the names of files in field_storage to their
+    names in storage, or None for a name storage does not hold. Return None
+    when the two storages cannot share any file and raise ValueError when
+    that cannot be told.
+    """
+    field_storage = get_storage(field_storage)
+    if field_storage is storage:
+        return lambda name: name
+    if isinstance(field_storage, InMemoryStorage) or isinstance(
+        storage, InMemoryStorage
+    ):
+        # in memory storages never share files with another instance
+        return None
+    if isinstance(field_storage, FileSystemStorage) and isinstance(
+        storage, FileSystemStorage
+    ):
+        root = os.path.join(os.path.abspath(storage.location), "")
+
+        def map_name(name):
+            try:
+                path = os.path.abspath(field_storage.path(name))
+            except SuspiciousFileOperation:
+                return None
+            if not path.startswith(root):
+                return None
+            return path[len(root) :].replace(os.sep, "/")
+
+        return map_name
+    bucket = getattr(field_storage, "bucket_name", None)
+    if bucket is not None and type(field_storage) is type(storage):
+        if bucket != getattr(storage, "bucket_name", None):
+            return None
+        if getattr(field_storage, "location", "") == getattr(storage, "location", ""):
+            return lambda name: name
+    raise ValueError("cannot compare %r and %r" % (field_storage, storage))
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            break
+        size /= 1024.0
+    return ("%d %s" if unit == "B" else "%.1f %s") % (size, unit)
+
 
 class Command(BaseCommand):
     help = "Prints a list of all files in MEDIA_ROOT that are not referenced in the database."  # noqa: E501
 
-    @signalcommand
-    def handle(self, *args, **options):
-        if not getattr(settings, "MEDIA_ROOT"):
-            raise CommandError("MEDIA_ROOT is not set, nothing to do")
-
-        # Get a list of all files under MEDIA_ROOT
-        media = set()
-        for root, dirs, files in os.walk(settings.MEDIA_ROOT):
-            for f in files:
-                media.add(os.path.abspath(os.path.join(root, f)))
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--parallel",
+            "-j",
+            type=int,
+            dest="parallel",
+            default=None,
+            help=(
+                "Number of worker threads listing directories. Defaults to the "
+                "number of processors plus four, at most 32."
+            ),
+        )
+        parser.add_argument(
+            "--sizes",
+            action="store_true",
+            dest="sizes",
+            default=False,
+            help="Print the size in bytes before each file",
+        )
+        parser.add_argument(
+            "--storage",
+            dest="storage",
+            default=None,
+            help=(
+                "List the files of this storage (an alias of the STORAGES "
+                "setting) instead of MEDIA_ROOT, printing storage names."
+            ),
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            dest="delete",
+            default=False,
+            help="Delete the unreferenced files (from the default storage "
+            "unless --storage is given).",
+        )
+        parser.add_argument(
+            "--move-to",
+            dest="move_to",
+            default=None,
+            help=(
+                "Move the unreferenced files under this directory of the storage "
+                "(the default storage unless --storage is given)."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch_size",
+            default=DEFAULT_BATCH_SIZE,
+            help=(
+                "Number of files deleted or moved per worker task. "
+                "Defaults to %d." % DEFAULT_BATCH_SIZE
+            ),
+        )
 
-        # Get list of all fields (value) for each model (key)
-        # that is a FileField or subclass of a FileField
+    def get_file_fields(self):
+        """
+        Return a dict mapping every model to its fields that are a FileField
+        or subclass of a FileField.
+        """
         model_dict = defaultdict(list)
         for model in apps.get_models():
             for field in model._meta.fields:
                 if issubclass(field.__class__, models.FileField):
                     model_dict[model].append(field)
+        return model_dict
 
-        # Get a list of all files referenced in the database
+    def get_referenced_files(self, storage=None):
+        """
+        Return the absolute paths of all files referenced in the database, or
+        their names when storage is given, only considering the fields whose
+        storage may hold files of that storage.
+        Only the file names are fetched, NULL and empty values are filtered
+        out by the database.
+        """
         referenced = set()
-        for model in model_dict:
-            all = model.objects.all().iterator()
-            for object in all:
-                for field in model_dict[model]:
-                    target_file = getattr(object, field.name)
-                    if target_file:
-                        referenced.add(os.path.abspath(target_file.path))
+        mappers = {}
+        if storage is not None:
+            unknown = []
+            for fields in self.get_file_fields().values():
+                for field in fields:
+                    try:
+                        mappers[field] = get_name_mapper(field.storage, storage)
+                    except ValueError:
+                        unknown.append(str(field))
+            if unknown:
+                raise CommandError(
+                    "Cannot tell whether the files of %s are stored in the "
+                    "storage, refusing to continue." % ", ".join(unknown)
+                )
+
+        for model, fields in self.get_file_fields().items():
+            if storage is not None:
+                fields = [f for f in fields if mappers[f] is not None]
+                if not fields:
+                    continue
+            names = [field.attname for field in fields]
+            non_empty = reduce(
+                or_,
+                (
+                    models.Q(**{"%s__isnull" % name: False}) & ~models.Q(**{name: ""})
+                    for name in names
+                ),
+            )
+            rows = (
+                model._base_manager.filter(non_empty)
+                .values_list(*names)
+                .order_by()
+                .iterator()
+            )
+            for row in rows:
+                for field, value in zip(fields, row):
+                    if not value:
+                        continue
+                    if storage is not None:
+                        name = mappers[field](value)
+                        if name is not None:
+                            referenced.add(name)
+                    else:
+                        referenced.add(os.path.abspath(field.storage.path(value)))
+        return referenced
+
+    def scan_storage(self, storage, referenced, path):
+        """
+        Return the sorted (name, size) files and sorted subdirectories of path
+        in storage. Sizes are only requested for unreferenced files.
+        """
+        dirs, names = storage.listdir(path)
+        if self.move_to:
+            # never walk (and move again) the files already moved
+            dirs = [name for name in dirs if join_name(path, name) != self.move_to]
+        files = []
+        for name in names:
+            size = 0
+            if join_name(path, name) not in referenced:
+                try:
+                    size = storage.size(join_name(path, name))
+                except (OSError, NotImplementedError):
+                    pass
+            files.append((name, size))
+        return sorted(files), sorted(dirs)
+
+    def process_files(self, storage, names):
+        """Delete or move names in storage, return (count, size, errors)."""
+        count = 0
+        errors = []
+        for name in names:
+            try:
+                if self.move_to:
+                    with storage.open(name) as f:
+                        storage.save(join_name(self.move_to, name), f)
+                storage.delete(name)
+                count += 1
+            except Exception as e:
+                errors.append("%s: %s" % (name, e))
+        return count, errors
+
+    @signalcommand
+    def handle(self, *args, **options):
+        if options["parallel"] is not None and options["parallel"] < 1:
+            raise CommandError("--parallel must be a positive integer")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive integer")
+        if options["delete"] and options["move_to"]:
+            raise CommandError("--delete and --move-to are mutually exclusive")
+        self.move_to = (options["move_to"] or "").strip("/")
+        if options["move_to"] is not None and not self.move_to:
+            raise CommandError("--move-to requires a directory name")
+
+        if options["storage"] or options["delete"] or self.move_to:
+            alias = options["storage"] or "default"
+            try:
+                storage = storages[alias]
+            except Exception as e:
+                raise CommandError("Could not load storage '%s': %s" % (alias, e))
+            self.handle_storage(storage, options)
+            return
+
+        if not getattr(settings, "MEDIA_ROOT"):
+            raise CommandError("MEDIA_ROOT is not set, nothing to do")
+
+        referenced = self.get_referenced_files()
 
         # Print each file in MEDIA_ROOT that is not referenced in the database
-        not_referenced = media - referenced
-        for f in not_referenced:
-            print(f)
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        with ThreadPoolExecutor(max_workers=options["parallel"]) as executor:
+            files = walk_files(media_root, executor)
+            self.print_unreferenced(files, referenced, options)
+
+    def print_unreferenced(self, files, referenced, options, on_file=None):
+        count = 0
+        total_size = 0
+        for path, size in files:
+            if path in referenced:
+                continue
+            count += 1
+            total_size += size
+            if options["sizes"]:
+                print("%d\t%s" % (size, path))
+            else:
+                print(path)
+            if on_file is not None:
+                on_file(path)
+
+        if count and options["verbosity"] > 0:
+            self.stderr.write(
+                "%d unreferenced files, %s" % (count, format_size(total_size))
+            )
+
+    def handle_storage(self, storage, options):
+        referenced = self.get_referenced_files(storage)
+        batch_size = options["batch_size"]
+        acting = options["delete"] or self.move_to
+        batch = []
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=options["parallel"]) as executor:
+
+            def on_file(name):
+                batch.append(name)
+                if len(batch) == batch_size:
+                    futures.append(
+                        executor.submit(self.process_files, storage, list(batch))
+                    )
+                    batch.clear()
+
+            scan = partial(self.scan_storage, storage, referenced)
+            files = walk_files("", executor, scan=scan, join=join_name)
+            self.print_unreferenced(
+                files, referenced, options, on_file=on_file if acting else None
+            )
+            if batch:
+                futures.append(executor.submit(self.process_files, storage, batch))
+
+            count = 0
+            for future in futures:
+                processed, errors = future.result()
+                count += processed
+                for error in errors:
+                    self.stderr.write("Could not process %s" % error)
+
+        if acting and options["verbosity"] > 0:
+            if self.move_to:
+                self.stderr.write("Moved %d files to %s" % (count, self.move_to))
+            else:
+                self.stderr.write("Deleted %d files" % count)
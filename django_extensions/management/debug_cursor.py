@@ -1,12 +1,298 @@
+import random
+import re
+import threading
 import time
 import traceback
+from collections import OrderedDict, deque, namedtuple
 from contextlib import contextmanager
+from functools import lru_cache
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.db.backends import utils
+from django.utils.encoding import force_str
 
-from django_extensions.settings import DEFAULT_PRINT_SQL_TRUNCATE_CHARS
+from django_extensions.settings import (
+    DEFAULT_PRINT_SQL_BUFFER_SIZE,
+    DEFAULT_PRINT_SQL_FLUSH_INTERVAL,
+    DEFAULT_PRINT_SQL_TRUNCATE_CHARS,
+)
+
+PRINT_SQL_MODES = ("inline", "capture", "summary")
+
+QueryRecord = namedtuple(
+    "QueryRecord", ["alias", "sql", "params", "duration_ns", "stack_hash", "many"]
+)
+
+_FINGERPRINT_SUBS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%s|%\(\w+\)s"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"(?:\(\.\.\.\)\s*,\s*)+\(\.\.\.\)"), "(...)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def sql_fingerprint(sql):
+    """
+    Normalize sql so that queries differing only in their literal values or
+    number of parameters share the same fingerprint.
+
+    >>> sql_fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'x'")
+    'SELECT * FROM t WHERE id IN (...) AND name = ?'
+    """
+    fingerprint = force_str(sql).strip()
+    for pattern, replacement in _FINGERPRINT_SUBS:
+        fingerprint = pattern.sub(replacement, fingerprint)
+    return fingerprint
+
+
+def interpolate_sql(sql, params):
+    """
+    Best effort rendering of sql with its params, used when the query is
+    formatted long after the cursor which executed it has moved on.
+    """
+    if not params:
+        return force_str(sql)
+    try:
+        if isinstance(params, dict):
+            return force_str(sql) % {k: repr(v) for k, v in params.items()}
+        return force_str(sql) % tuple(repr(v) for v in params)
+    except (TypeError, ValueError, KeyError):
+        return "%s -- params: %r" % (force_str(sql), params)
+
+
+def _percentile(values, percent):
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class QueryCapture:
+    """
+    Record executed queries with as little overhead as possible.
+
+    In capture mode queries are kept in a ring buffer holding the last maxlen
+    queries until they are drained. In summary mode only the count and total
+    duration per alias and SQL fingerprint are kept, together with a sample
+    of at most reservoir_size durations for the percentiles of summary().
+    Formatting is left to the consumer.
+    """
+
+    def __init__(
+        self,
+        maxlen=DEFAULT_PRINT_SQL_BUFFER_SIZE,
+        capture_stack=False,
+        mode="capture",
+        reservoir_size=1000,
+        max_stacks=1000,
+    ):
+        self.records = deque(maxlen=maxlen)
+        self.capture_stack = capture_stack
+        self.mode = mode
+        self.reservoir_size = reservoir_size
+        self.max_stacks = max_stacks
+        self.stacks = OrderedDict()
+        self.aggregates = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.fingerprint = lru_cache(maxsize=1024)(sql_fingerprint)
+
+    def record(self, alias, sql, params, duration_ns, many=False):
+        if self.mode == "summary":
+            self.aggregate(alias, sql, duration_ns)
+            return
+        stack_hash = None
+        if self.capture_stack:
+            stack_hash = self.get_stack_hash()
+        with self.lock:
+            if len(self.records) == self.records.maxlen:
+                self.dropped += 1
+            self.records.append(
+                QueryRecord(alias, sql, params, duration_ns, stack_hash, many)
+            )
+
+    def aggregate(self, alias, sql, duration_ns):
+        key = (alias, self.fingerprint(force_str(sql)))
+        with self.lock:
+            aggregate = self.aggregates.get(key)
+            if aggregate is None:
+                aggregate = self.aggregates[key] = [0, 0, []]
+            aggregate[0] += 1
+            aggregate[1] += duration_ns
+            reservoir = aggregate[2]
+            if len(reservoir) < self.reservoir_size:
+                reservoir.append(duration_ns)
+            else:
+                index = random.randrange(aggregate[0])
+                if index < self.reservoir_size:
+                    reservoir[index] = duration_ns
+
+    def get_stack_hash(self):
+        # skip this method and record()
+        stack = traceback.extract_stack()[:-2]
+        stack_hash = hash(tuple((f.filename, f.lineno, f.name) for f in stack))
+        with self.lock:
+            if stack_hash in self.stacks:
+                self.stacks.move_to_end(stack_hash)
+            else:
+                self.stacks[stack_hash] = "".join(traceback.format_list(stack))
+                if len(self.stacks) > self.max_stacks:
+                    self.stacks.popitem(last=False)
+        return stack_hash
+
+    def take_dropped(self):
+        """Return and reset the number of queries dropped from the buffer."""
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def drain(self):
+        """Remove and return all buffered queries, oldest first."""
+        records = []
+        while True:
+            try:
+                records.append(self.records.popleft())
+            except IndexError:
+                return records
+
+    def summary(self):
+        """
+        Return the queries aggregated by alias and SQL fingerprint in summary
+        mode, slowest total time first, as a list of dicts with count,
+        total_ns, p50_ns and p95_ns.
+        """
+        with self.lock:
+            aggregates = [
+                (key, count, total_ns, sorted(reservoir))
+                for key, (count, total_ns, reservoir) in self.aggregates.items()
+            ]
+
+        rows = []
+        for (alias, fingerprint), count, total_ns, durations in aggregates:
+            rows.append(
+                {
+                    "alias": alias,
+                    "fingerprint": fingerprint,
+                    "count": count,
+                    "total_ns": total_ns,
+                    "p50_ns": _percentile(durations, 50),
+                    "p95_ns": _percentile(durations, 95),
+                }
+            )
+        rows.sort(key=lambda row: row["total_ns"], reverse=True)
+        return rows
+
+    def reset(self):
+        with self.lock:
+            self.records.clear()
+            self.stacks.clear()
+            self.aggregates.clear()
+            self.dropped = 0
+
+
+class QueryCaptureFlusher(threading.Thread):
+    """
+    Background thread printing the queries of a QueryCapture every interval
+    seconds, keeping sqlparse and pygments out of the request thread.
+    """
+
+    def __init__(self, flush, interval):
+        super().__init__(name="django-extensions-sql-flusher", daemon=True)
+        self.flush = flush
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.flush()
+
+
+def get_sql_formatter(confprefix="DJANGO_EXTENSIONS"):
+    """
+    Return a function reformatting and highlighting raw SQL according to the
+    sqlparse and pygments settings for confprefix.
+    """
+    sqlparse = None
+    if getattr(settings, "%s_SQLPARSE_ENABLED" % confprefix, True):
+        try:
+            import sqlparse
+
+            sqlparse_format_kwargs_defaults = dict(
+                reindent_aligned=True,
+                truncate_strings=500,
+            )
+            sqlparse_format_kwargs = getattr(
+                settings,
+                "%s_SQLPARSE_FORMAT_KWARGS" % confprefix,
+                sqlparse_format_kwargs_defaults,
+            )
+        except ImportError:
+            sqlparse = None
+
+    pygments = None
+    if getattr(settings, "%s_PYGMENTS_ENABLED" % confprefix, True):
+        try:
+            import pygments.lexers
+            import pygments.formatters
+
+            pygments_formatter = getattr(
+                settings,
+                "%s_PYGMENTS_FORMATTER" % confprefix,
+                pygments.formatters.TerminalFormatter,
+            )
+            pygments_formatter_kwargs = getattr(
+                settings, "%s_PYGMENTS_FORMATTER_KWARGS" % confprefix, {}
+            )
+        except ImportError:
+            pass
+
+    def format_sql(raw_sql):
+        if sqlparse:
+            raw_sql = sqlparse.format(raw_sql, **sqlparse_format_kwargs)
+
+        if pygments:
+            raw_sql = pygments.highlight(
+                raw_sql,
+                pygments.lexers.get_lexer_by_name("sql"),
+                pygments_formatter(**pygments_formatter_kwargs),
+            )
+        return raw_sql
+
+    return format_sql
+
+
+def print_query_summary(capture, logger=print):
+    rows = capture.summary()
+    total_count = sum(row["count"] for row in rows)
+    total_ns = sum(row["total_ns"] for row in rows)
+    logger(
+        "SQL summary: %d queries, %d distinct, %.3fms total"
+        % (total_count, len(rows), total_ns / 1e6)
+    )
+    if not rows:
+        return
+    logger(
+        "%8s %12s %10s %10s  %-10s %s"
+        % ("count", "total ms", "p50 ms", "p95 ms", "database", "query")
+    )
+    for row in rows:
+        logger(
+            "%8d %12.3f %10.3f %10.3f  %-10s %s"
+            % (
+                row["count"],
+                row["total_ns"] / 1e6,
+                row["p50_ns"] / 1e6,
+                row["p95_ns"] / 1e6,
+                row["alias"],
+                row["fingerprint"],
+            )
+        )
 
 
 @contextmanager
@@ -16,7 +302,28 @@ def monkey_patch_cursordebugwrapper(
     truncate=None,
     logger=print,
     confprefix="DJANGO_EXTENSIONS",
+    print_sql_mode=None,
+    detect_n_plus_one=None,
 ):
+    """
+    Patch the debug cursors of all connections to report executed queries.
+
+    print_sql_mode selects how queries are reported:
+
+    inline
+        format and print every query as soon as it is executed (default)
+    capture
+        only record queries in a ring buffer, a background thread formats and
+        prints them
+    summary
+        only record queries and print a per fingerprint summary (count,
+        total/p50/p95 time) on exit
+
+    In capture and summary mode the QueryCapture is yielded.
+
+    With detect_n_plus_one queries repeated from the same call site within a
+    request or shell statement are reported as potential N+1 queries.
+    """
     if not print_sql:
         yield
     else:
@@ -26,70 +333,131 @@ def monkey_patch_cursordebugwrapper(
                 "%s_PRINT_SQL_TRUNCATE" % confprefix,
                 DEFAULT_PRINT_SQL_TRUNCATE_CHARS,
             )
+        if print_sql_mode is None:
+            print_sql_mode = getattr(
+                settings, "%s_PRINT_SQL_MODE" % confprefix, "inline"
+            )
+        if print_sql_mode not in PRINT_SQL_MODES:
+            raise ImproperlyConfigured(
+                "Unknown print sql mode %r, choose from %s"
+                % (print_sql_mode, ", ".join(PRINT_SQL_MODES))
+            )
 
-        sqlparse = None
-        if getattr(settings, "%s_SQLPARSE_ENABLED" % confprefix, True):
-            try:
-                import sqlparse
+        if detect_n_plus_one is None:
+            detect_n_plus_one = getattr(
+                settings, "%s_DETECT_N_PLUS_ONE" % confprefix, False
+            )
 
-                sqlparse_format_kwargs_defaults = dict(
-                    reindent_aligned=True,
-                    truncate_strings=500,
-                )
-                sqlparse_format_kwargs = getattr(
+        format_sql = get_sql_formatter(confprefix)
+
+        detector = None
+        if detect_n_plus_one:
+            from django.core.signals import request_finished, request_started
+
+            from django_extensions.management.n_plus_one import (
+                DEFAULT_N_PLUS_ONE_THRESHOLD,
+                NPlusOneDetector,
+            )
+
+            detector = NPlusOneDetector(
+                threshold=getattr(
                     settings,
-                    "%s_SQLPARSE_FORMAT_KWARGS" % confprefix,
-                    sqlparse_format_kwargs_defaults,
-                )
-            except ImportError:
-                sqlparse = None
+                    "%s_N_PLUS_ONE_THRESHOLD" % confprefix,
+                    DEFAULT_N_PLUS_ONE_THRESHOLD,
+                ),
+                logger=logger,
+            )
 
-        pygments = None
-        if getattr(settings, "%s_PYGMENTS_ENABLED" % confprefix, True):
-            try:
-                import pygments.lexers
-                import pygments.formatters
+            def start_unit(**kwargs):
+                detector.start_unit()
+
+            def end_unit(**kwargs):
+                detector.end_unit()
 
-                pygments_formatter = getattr(
+            request_started.connect(start_unit, weak=False)
+            request_finished.connect(end_unit, weak=False)
+
+        capture = None
+        flusher = None
+        if print_sql_mode != "inline":
+            capture = QueryCapture(
+                maxlen=getattr(
                     settings,
-                    "%s_PYGMENTS_FORMATTER" % confprefix,
-                    pygments.formatters.TerminalFormatter,
-                )
-                pygments_formatter_kwargs = getattr(
-                    settings, "%s_PYGMENTS_FORMATTER_KWARGS" % confprefix, {}
+                    "%s_PRINT_SQL_BUFFER_SIZE" % confprefix,
+                    DEFAULT_PRINT_SQL_BUFFER_SIZE,
+                ),
+                capture_stack=print_sql_location,
+                mode=print_sql_mode,
+            )
+
+        def log_query(raw_sql, execution_time, alias, stack):
+            if truncate:
+                raw_sql = raw_sql[:truncate]
+            logger(format_sql(raw_sql))
+            logger("Execution time: %.6fs [Database: %s]" % (execution_time, alias))
+            if stack is not None:
+                logger("Location of SQL Call:")
+                logger(stack)
+
+        def flush_capture():
+            dropped = capture.take_dropped()
+            if dropped:
+                logger("%d queries dropped, SQL buffer full" % dropped)
+            for record in capture.drain():
+                log_query(
+                    interpolate_sql(record.sql, record.params),
+                    record.duration_ns / 1e9,
+                    record.alias,
+                    capture.stacks.get(record.stack_hash),
                 )
-            except ImportError:
-                pass
 
         class PrintQueryWrapperMixin:
-            def execute(self, sql, params=()):
-                starttime = time.time()
+            def _print_sql(self, method, sql, params, many=False):
+                starttime = time.perf_counter_ns()
                 try:
-                    return utils.CursorWrapper.execute(self, sql, params)
+                    return method(self, sql, params)
                 finally:
-                    execution_time = time.time() - starttime
-                    raw_sql = self.db.ops.last_executed_query(self.cursor, sql, params)
-                    if truncate:
-                        raw_sql = raw_sql[:truncate]
-
-                    if sqlparse:
-                        raw_sql = sqlparse.format(raw_sql, **sqlparse_format_kwargs)
-
-                    if pygments:
-                        raw_sql = pygments.highlight(
-                            raw_sql,
-                            pygments.lexers.get_lexer_by_name("sql"),
-                            pygments_formatter(**pygments_formatter_kwargs),
-                        )
+                    duration_ns = time.perf_counter_ns() - starttime
+                    if detector is not None and not many:
+                        detector.record(self.db.alias, sql)
+                    if capture is not None:
+                        capture.record(self.db.alias, sql, params, duration_ns, many)
+                    else:
+                        if many:
+                            raw_sql = interpolate_sql(sql, None)
+                        else:
+                            raw_sql = self.db.ops.last_executed_query(
+                                self.cursor, sql, params
+                            )
+                        stack = None
+                        if print_sql_location:
+                            stack = "".join(traceback.format_stack())
+                        log_query(raw_sql, duration_ns / 1e9, self.db.alias, stack)
+
+            def execute(self, sql, params=None):
+                return self._print_sql(utils.CursorWrapper.execute, sql, params)
 
-                    logger(raw_sql)
-                    logger(
-                        "Execution time: %.6fs [Database: %s]"
-                        % (execution_time, self.db.alias)
-                    )
-                    if print_sql_location:
-                        logger("Location of SQL Call:")
-                        logger("".join(traceback.format_stack()))
+            def executemany(self, sql, param_list):
+                return self._print_sql(
+                    utils.CursorWrapper.executemany, sql, param_list, many=True
+                )
+
+            def callproc(self, procname, params=None, kparams=None):
+                starttime = time.perf_counter_ns()
+                try:
+                    return utils.CursorWrapper.callproc(self, procname, params, kparams)
+                finally:
+                    duration_ns = time.perf_counter_ns() - starttime
+                    sql = "CALL %s" % procname
+                    if capture is not None:
+                        capture.record(self.db.alias, sql, params, duration_ns)
+                    else:
+                        log_query(
+                            interpolate_sql(sql, None),
+                            duration_ns / 1e9,
+                            self.db.alias,
+                            None,
+                        )
 
         _CursorDebugWrapper = utils.CursorDebugWrapper
 
@@ -129,15 +497,36 @@ def monkey_patch_cursordebugwrapper(
             for connection_name in connections:
                 connections[connection_name].force_debug_cursor = True
 
-        yield
+        if print_sql_mode == "capture":
+            flusher = QueryCaptureFlusher(
+                flush_capture,
+                getattr(
+                    settings,
+                    "%s_PRINT_SQL_FLUSH_INTERVAL" % confprefix,
+                    DEFAULT_PRINT_SQL_FLUSH_INTERVAL,
+                ),
+            )
+            flusher.start()
 
-        utils.CursorDebugWrapper = _CursorDebugWrapper
+        try:
+            yield capture
+        finally:
+            if flusher is not None:
+                flusher.stop()
+            if detector is not None:
+                detector.end_unit()
+                request_started.disconnect(start_unit)
+                request_finished.disconnect(end_unit)
+            if print_sql_mode == "summary":
+                print_query_summary(capture, logger=logger)
 
-        if postgresql_base:
-            postgresql_base.CursorDebugWrapper = _PostgreSQLCursorDebugWrapper
+            utils.CursorDebugWrapper = _CursorDebugWrapper
 
-        if connections:
-            for connection_name in connections:
-                connections[connection_name].force_debug_cursor = _force_debug_cursor[
-                    connection_name
-                ]
+            if postgresql_base:
+                postgresql_base.CursorDebugWrapper = _PostgreSQLCursorDebugWrapper
+
+            if connections:
+                for connection_name in connections:
+                    connections[
+                        connection_name
+                    ].force_debug_cursor = _force_debug_cursor[connection_name]
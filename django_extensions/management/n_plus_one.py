@@ -0,0 +1,210 @@
+import os
+import re
+import sys
+import threading
+from functools import lru_cache
+
+import django
+from django.apps import apps
+
+from django_extensions.management.debug_cursor import sql_fingerprint
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+
+_IDENT = r"[`\"\[]?(\w+)[`\"\]]?"
+FROM_RE = re.compile(r"\bFROM\s+" + _IDENT, re.IGNORECASE)
+WHERE_RE = re.compile(
+    r"\bWHERE\s+\(?" + _IDENT + r"\." + _IDENT + r"\s*(?:=|IN\b)", re.IGNORECASE
+)
+
+_SKIP_PATHS = (
+    os.path.dirname(django.__file__) + os.sep,
+    os.path.dirname(os.path.abspath(__file__)) + os.sep,
+)
+
+
+def get_call_site():
+    """
+    Return (filename, lineno, function) of the innermost frame outside of
+    Django and the SQL debugging code, i.e. the code triggering the query.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(_SKIP_PATHS):
+            return (filename, frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+def get_statement():
+    """
+    Return the code object of the outermost interactive statement (shell
+    input, --command or notebook cell) on the stack, or None.
+    """
+    statement = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith("<") and not filename.startswith("<frozen"):
+            statement = frame.f_code
+        frame = frame.f_back
+    return statement
+
+
+def _get_model_by_table(table):
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def _get_field_by_column(model, column):
+    for field in model._meta.concrete_fields:
+        if field.column == column:
+            return field
+    return None
+
+
+def _get_m2m_lookup(through, fk):
+    """Return the model and prefetch_related() lookup for an M2M through FK."""
+    for model in apps.get_models():
+        for field in model._meta.local_many_to_many:
+            if field.remote_field.through is not through:
+                continue
+            if field.model is fk.related_model:
+                return field.model, field.name
+            if field.related_model is fk.related_model:
+                return field.related_model, field.remote_field.get_accessor_name()
+    return None, None
+
+
+def suggest_related(sql, parent_sql=None):
+    """
+    Return a select_related() or prefetch_related() suggestion avoiding sql
+    being executed once per row of parent_sql, or None.
+    """
+    match = WHERE_RE.search(sql)
+    if not match:
+        return None
+    model = _get_model_by_table(match.group(1))
+    if model is None:
+        return None
+    field = _get_field_by_column(model, match.group(2))
+    if field is None:
+        return None
+
+    if field.primary_key:
+        # forward ForeignKey / OneToOneField access: obj.fk
+        parent_match = FROM_RE.search(parent_sql or "")
+        parent_model = parent_match and _get_model_by_table(parent_match.group(1))
+        if parent_model:
+            for parent_field in parent_model._meta.concrete_fields:
+                if parent_field.is_relation and parent_field.related_model is model:
+                    return "%s.objects.select_related(%r)" % (
+                        parent_model.__name__,
+                        parent_field.name,
+                    )
+        return "select_related() on the relation to %s" % model.__name__
+
+    if not field.is_relation or not field.many_to_one:
+        return None
+
+    # ManyToManyField access: obj.m2m.all()
+    owner, lookup = _get_m2m_lookup(model, field)
+    if owner is not None:
+        return "%s.objects.prefetch_related(%r)" % (owner.__name__, lookup)
+
+    # reverse ForeignKey access: obj.related_set.all()
+    return "%s.objects.prefetch_related(%r)" % (
+        field.related_model.__name__,
+        field.remote_field.get_accessor_name(),
+    )
+
+
+class NPlusOneDetector:
+    """
+    Detect the same query being executed over and over from a single call
+    site within one unit of work, a request or a shell statement.
+
+    Queries are grouped by SQL fingerprint and call site, groups repeated at
+    least threshold times are reported together with a select_related() or
+    prefetch_related() suggestion when end_unit() is called.
+    """
+
+    def __init__(self, threshold=DEFAULT_N_PLUS_ONE_THRESHOLD, logger=print):
+        self.threshold = threshold
+        self.logger = logger
+        self.local = threading.local()
+        self.fingerprint = lru_cache(maxsize=1024)(sql_fingerprint)
+
+    def _get_unit(self):
+        unit = getattr(self.local, "unit", None)
+        if unit is None:
+            unit = self.local.unit = {
+                "statement": None,
+                "groups": {},
+                "last_sql": None,
+            }
+        return unit
+
+    def start_unit(self):
+        self.end_unit()
+        self.local.request = True
+
+    def end_unit(self):
+        """Report N+1 patterns of the current unit and start a new one."""
+        unit = getattr(self.local, "unit", None)
+        self.local.unit = None
+        self.local.request = False
+        if unit is None:
+            return []
+        problems = [
+            group
+            for group in unit["groups"].values()
+            if group["count"] >= self.threshold
+        ]
+        for problem in problems:
+            self.report(problem)
+        return problems
+
+    def record(self, alias, sql):
+        fingerprint = self.fingerprint(sql)
+
+        if not getattr(self.local, "request", False):
+            # outside of a request every interactive statement is a unit
+            statement = get_statement()
+            unit = self._get_unit()
+            if unit["statement"] is not statement and unit["groups"]:
+                self.end_unit()
+                unit = self._get_unit()
+            unit["statement"] = statement
+        else:
+            unit = self._get_unit()
+
+        call_site = get_call_site()
+        key = (alias, fingerprint, call_site)
+        group = unit["groups"].get(key)
+        if group is None:
+            group = unit["groups"][key] = {
+                "alias": alias,
+                "fingerprint": fingerprint,
+                "call_site": call_site,
+                "sql": sql,
+                "parent_sql": unit["last_sql"],
+                "count": 0,
+            }
+        group["count"] += 1
+        unit["last_sql"] = sql
+
+    def report(self, problem):
+        self.logger(
+            "Potential N+1 query: %d similar queries [Database: %s]"
+            % (problem["count"], problem["alias"])
+        )
+        if problem["call_site"]:
+            self.logger('  File "%s", line %d, in %s' % problem["call_site"])
+        self.logger("  %s" % problem["fingerprint"])
+        suggestion = suggest_related(problem["sql"], problem["parent_sql"])
+        if suggestion:
+            self.logger("  Suggestion: use %s" % suggestion)
@@ -1,6 +1,12 @@
 import logging
 import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Concat
 
 from django_extensions.management.signals import post_command, pre_command
 
@@ -43,6 +49,32 @@ def setup_logger(logger, stream, filename=None, fmt=None):
             logger.addHandler(outfile)
 
 
+PLACEHOLDER_RE = re.compile(r"%\((\w+)\)s")
+
+
+def compile_template(template, field_names):
+    """
+    Compile a %(field_name)s template into a database expression, or return
+    None when it uses formatting that cannot be expressed in SQL or fields
+    other than field_names.
+    """
+    parts = []
+    for index, part in enumerate(PLACEHOLDER_RE.split(template)):
+        if index % 2:
+            if part not in field_names:
+                return None
+            parts.append(F(part))
+        elif part:
+            if "%" in part.replace("%%", ""):
+                return None
+            parts.append(Value(part.replace("%%", "%")))
+    if not parts:
+        return Value("")
+    if len(parts) == 1:
+        return parts[0]
+    return Concat(*parts, output_field=CharField())
+
+
 class RedirectHandler(logging.Handler):
     """Redirect logging sent to one logger (name) to another."""
 
@@ -80,3 +112,39 @@ def has_ipdb():
         return True
     except ImportError:
         return False
+
+
+def add_parallel_argument(parser, help):
+    """Add the --parallel/-j option used by map_in_threads()."""
+    parser.add_argument(
+        "--parallel",
+        "-j",
+        type=int,
+        dest="parallel",
+        default=1,
+        help=(
+            "%s using this many worker threads, each with its own database "
+            "connection." % help
+        ),
+    )
+
+
+def map_in_threads(func, iterable, workers, using=DEFAULT_DB_ALIAS):
+    """
+    Return the results of func for each item of iterable, spread over that
+    many worker threads when workers is more than one.
+
+    Django hands out one connection per thread, a worker closes its
+    connection to the using database once it is done with an item.
+    """
+    if workers <= 1:
+        return [func(item) for item in iterable]
+
+    def run(item):
+        try:
+            return func(item)
+        finally:
+            connections[using].close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, iterable))
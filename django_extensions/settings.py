@@ -42,5 +42,7 @@ POSTGRESQL_ENGINES = getattr(
 )
 
 DEFAULT_PRINT_SQL_TRUNCATE_CHARS = 1000
+DEFAULT_PRINT_SQL_BUFFER_SIZE = 10000
+DEFAULT_PRINT_SQL_FLUSH_INTERVAL = 1.0
 
 RUNSERVER_PLUS_EXCLUDE_PATTERNS = ["**/__pycache__/*"]
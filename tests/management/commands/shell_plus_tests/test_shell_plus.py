@@ -95,6 +95,31 @@ def test_shell_plus_print_sql_truncate(capsys):
     assert not re.search(r"SELEC", out)
 
 
+@pytest.mark.django_db()
+def test_shell_plus_print_sql_summary(capsys):
+    try:
+        from django.db import connection
+        from django.db.backends import utils
+
+        CursorDebugWrapper = utils.CursorDebugWrapper
+        force_debug_cursor = True if connection.force_debug_cursor else False
+        call_command(
+            "shell_plus",
+            "--plain",
+            "--print-sql",
+            "--print-sql-mode=summary",
+            "--command=User.objects.all().exists(); User.objects.all().exists()",
+        )
+    finally:
+        utils.CursorDebugWrapper = CursorDebugWrapper
+        connection.force_debug_cursor = force_debug_cursor
+
+    out, err = capsys.readouterr()
+
+    assert re.search(r"SQL summary: 2 queries, 1 distinct", out)
+    assert re.search(r"\s+2\s+.+SELECT .+ FROM .auth_user. LIMIT \?", out)
+
+
 def test_shell_plus_plain_startup():
     command = shell_plus.Command()
     command.tests_mode = True
@@ -0,0 +1,188 @@
+import hashlib
+import threading
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.crypto import salted_hmac
+
+from django_extensions.management.commands.anonymize_data import ModelAnonymizer
+
+
+@pytest.fixture(scope="module")
+def django_db_setup(django_db_setup, django_db_blocker):
+    """Load to database a set of users to anonymize"""
+    with django_db_blocker.unblock():
+        call_command("loaddata", "group.json")
+        call_command("loaddata", "user.json")
+
+
+ANONYMIZE_DATA = {
+    "auth.User": {
+        "email": ("template", "user%(pk)s@example.com"),
+        "first_name": ("constant", "John"),
+        "last_name": "shuffle",
+        "password": "hash",
+        "username": ("template", "user-%(id)04d"),
+    },
+}
+
+
+@pytest.mark.django_db()
+def test_anonymize_data(capsys, settings):
+    settings.DEBUG = True
+    settings.ANONYMIZE_DATA = ANONYMIZE_DATA
+    originals = {user.pk: user for user in User.objects.all()}
+
+    call_command("anonymize_data", "--salt=pepper")
+    out, err = capsys.readouterr()
+    assert "Anonymized 3 rows of auth.User" in out
+
+    users = User.objects.order_by("pk")
+    for user in users:
+        original = originals[user.pk]
+        assert user.email == "user%s@example.com" % user.pk
+        assert user.first_name == "John"
+        assert user.username == "user-%04d" % user.pk
+        assert (
+            user.password
+            == hashlib.sha256(("pepper" + original.password).encode()).hexdigest()
+        )
+    assert sorted(user.last_name for user in users) == sorted(
+        user.last_name for user in originals.values()
+    )
+
+
+@pytest.mark.django_db()
+def test_anonymize_data_in_chunks(capsys, settings):
+    settings.DEBUG = True
+    settings.ANONYMIZE_DATA = {
+        "auth.User": {"email": ("template", "%(username)s@example.com")},
+    }
+
+    with CaptureQueriesContext(connection) as queries:
+        call_command("anonymize_data", "auth.User", "--chunk-size=2", verbosity=2)
+    out, err = capsys.readouterr()
+    assert "auth.User: anonymized 2 rows" in out
+    assert "auth.User: anonymized 3 rows" in out
+
+    updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+    assert len(updates) == 2
+    assert User.objects.get(username="Gabriel").email == "Gabriel@example.com"
+
+
+@pytest.mark.django_db()
+def test_anonymize_data_shuffles_across_chunks(settings):
+    settings.DEBUG = True
+    settings.ANONYMIZE_DATA = {"auth.User": {"last_name": "shuffle"}}
+    originals = list(User.objects.order_by("pk").values_list("last_name", flat=True))
+
+    with patch("random.shuffle", lambda values: values.reverse()):
+        call_command("anonymize_data", "--chunk-size=1", verbosity=0)
+
+    shuffled = User.objects.order_by("pk").values_list("last_name", flat=True)
+    assert list(shuffled) == originals[::-1]
+
+
+@pytest.mark.django_db()
+def test_anonymize_data_default_salt(settings):
+    settings.DEBUG = True
+    settings.ANONYMIZE_DATA = {"auth.User": {"password": "hash"}}
+    original = User.objects.order_by("pk")[0]
+
+    with CaptureQueriesContext(connection) as queries:
+        call_command("anonymize_data", verbosity=0)
+
+    assert not any(settings.SECRET_KEY in query["sql"] for query in queries)
+    salt = salted_hmac("django_extensions.anonymize_data", "salt").hexdigest()
+    assert (
+        User.objects.get(pk=original.pk).password
+        == hashlib.sha256((salt + original.password).encode()).hexdigest()
+    )
+
+
+@pytest.mark.django_db()
+def test_anonymize_data_null(settings):
+    settings.DEBUG = True
+    settings.ANONYMIZE_DATA = {"auth.User": {"last_login": "null"}}
+    User.objects.update(last_login="2020-01-01T00:00:00Z")
+
+    call_command("anonymize_data", verbosity=0)
+
+    assert not User.objects.filter(last_login__isnull=False).exists()
+
+
+@pytest.mark.django_db()
+def test_anonymize_data_parallel(capsys, settings):
+    settings.DEBUG = True
+    settings.ANONYMIZE_DATA = {
+        "auth.User": {"first_name": ("constant", "John")},
+        "auth.Group": {"name": ("template", "group-%(pk)s")},
+    }
+    threads = {}
+
+    def anonymize(self, using, chunk_size, verbosity=1):
+        threads[self.label] = threading.current_thread()
+        return 1
+
+    with patch.object(ModelAnonymizer, "anonymize", anonymize):
+        call_command("anonymize_data", "--parallel=2")
+    out, err = capsys.readouterr()
+
+    assert "Anonymized 1 rows of auth.User" in out
+    assert "Anonymized 1 rows of auth.Group" in out
+    assert set(threads) == {"auth.User", "auth.Group"}
+    assert threading.main_thread() not in threads.values()
+
+
+@pytest.mark.parametrize(
+    "config,message",
+    [
+        ({"auth.User": {"nickname": "null"}}, "auth.User has no field named"),
+        ({"auth.User": {"email": "scramble"}}, "Unknown strategy for auth.User.email"),
+        ({"auth.User": {"email": "null"}}, "auth.User.email is not nullable"),
+        ({"auth.User": {"is_staff": "hash"}}, "only text fields can be hashed"),
+        (
+            {"auth.User": {"email": ("template", "%(nickname)s")}},
+            "unknown template fields: nickname",
+        ),
+        (
+            {
+                "auth.User": {
+                    "email": ("template", "%(username)s@example.com"),
+                    "username": ("constant", "user"),
+                }
+            },
+            "auth.User.email: template uses anonymized fields: username",
+        ),
+        (
+            {"auth.User": {"email": ("template", "%(nickname)05d")}},
+            "unknown template fields: nickname",
+        ),
+        (
+            {
+                "auth.User": {
+                    "email": ("template", "%(username)r@example.com"),
+                    "username": ("constant", "user"),
+                }
+            },
+            "auth.User.email: template uses anonymized fields: username",
+        ),
+    ],
+)
+def test_anonymize_data_invalid_config(settings, config, message):
+    settings.DEBUG = True
+    settings.ANONYMIZE_DATA = config
+
+    with pytest.raises(CommandError, match=message):
+        call_command("anonymize_data")
+
+
+def test_without_debug(settings):
+    settings.DEBUG = False
+
+    with pytest.raises(CommandError, match="Only available in debug mode"):
+        call_command("anonymize_data")
@@ -1,4 +1,11 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
 from django.core.management import call_command
+from django.db.models.query import QuerySet
 
 from django_extensions.management.commands.export_emails import full_name
 
@@ -15,6 +22,15 @@ def custom_djsettings(settings):
     return settings
 
 
+@pytest.fixture
+def output_dir():
+    """Temporary directory for output files, outside of pytest's basetemp
+    which other tests use as a template directory"""
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
 @pytest.fixture(scope="module")
 def django_db_setup():
     """Select default database for testing"""
@@ -107,6 +123,47 @@ def test_do_export_emails_format_vcard_start(capsys):
     assert out.startswith("BEGIN:VCARD")
 
 
+@pytest.mark.django_db()
+def test_do_export_emails_to_file(capsys, output_dir):
+    """Testing python manage.py export_emails -f linkedin users.csv"""
+    call_command("export_emails", "--format=linkedin")
+    expected, err = capsys.readouterr()
+
+    filename = os.path.join(output_dir, "users.csv")
+    call_command("export_emails", "--format=linkedin", filename)
+
+    out, err = capsys.readouterr()
+    assert out == ""
+    with open(filename, encoding="utf-8", newline="") as f:
+        assert f.read() == expected
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("name,args", [("users.txt", ["--gzip"]), ("users.gz", [])])
+def test_do_export_emails_gzip(capsys, output_dir, name, args):
+    """Testing python manage.py export_emails --gzip users.txt"""
+    call_command("export_emails")
+    expected, err = capsys.readouterr()
+
+    filename = os.path.join(output_dir, name)
+    call_command("export_emails", filename, *args)
+
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        assert f.read() == expected
+
+
+@pytest.mark.django_db()
+def test_do_export_emails_streams_rows(capsys):
+    """Testing that users are streamed from the database in chunks"""
+    with patch.object(QuerySet, "iterator", autospec=True) as iterator:
+        iterator.return_value = iter([{"email": "a@example.com"}])
+        call_command("export_emails", "--format=emails", "--chunk-size=50")
+
+    out, err = capsys.readouterr()
+    assert out == "a@example.com\n\n"
+    assert iterator.call_args.kwargs == {"chunk_size": 50}
+
+
 @pytest.mark.django_db()
 def test_full_name():
     """Test, getting full name / username"""
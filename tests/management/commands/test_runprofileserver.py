@@ -0,0 +1,475 @@
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import partial
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.urls import path
+
+from django_extensions.management.commands.runprofileserver import (
+    UNRESOLVED_PATTERN,
+    LatencyHistogram,
+    ProfileAggregator,
+    ProfileDumper,
+    ProfilerHandler,
+    ProfileWriter,
+    RequestMetrics,
+    StackSampler,
+    atomic_write,
+    get_url_pattern,
+    pattern_filename,
+)
+
+
+def order_view(request, pk):
+    return HttpResponse("OK")
+
+
+urlpatterns = [
+    path("orders/<int:pk>/", order_view, name="order"),
+]
+
+
+@pytest.fixture()
+def prof_path():
+    prof_path = tempfile.mkdtemp()
+    yield prof_path
+    shutil.rmtree(prof_path)
+
+
+@pytest.fixture()
+def urlconf(settings):
+    settings.ROOT_URLCONF = __name__
+
+
+def application(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"OK"]
+
+
+def make_environ(path_info):
+    return {"PATH_INFO": path_info, "REQUEST_METHOD": "GET"}
+
+
+def test_get_url_pattern(urlconf):
+    assert get_url_pattern("/orders/1/") == "/orders/<int:pk>/"
+    assert get_url_pattern("/orders/2/") == "/orders/<int:pk>/"
+    assert get_url_pattern("/customers/") == UNRESOLVED_PATTERN
+
+
+def test_profiler_handler_writes_profile_per_request(prof_path):
+    handler = ProfilerHandler(application, prof_path)
+
+    assert handler(make_environ("/orders/1/"), lambda *args: None) == [b"OK"]
+
+    (filename,) = os.listdir(prof_path)
+    assert filename.startswith("orders.1.")
+    assert filename.endswith(".prof")
+    pstats.Stats(os.path.join(prof_path, filename))
+
+
+def test_profiler_handler_excludes_media(prof_path, settings):
+    settings.MEDIA_URL = "/media/"
+    handler = ProfilerHandler(application, prof_path, no_media=True)
+
+    handler(make_environ("/media/logo.png"), lambda *args: None)
+
+    assert os.listdir(prof_path) == []
+
+
+def sampled_application(sampler):
+    def application(environ, start_response):
+        sampler.sample()
+        sampler.sample()
+        start_response("200 OK", [])
+        return [b"OK"]
+
+    return application
+
+
+def test_profiler_handler_sampling(prof_path, urlconf):
+    sampler = StackSampler(hz=50)
+    handler = ProfilerHandler(sampled_application(sampler), prof_path, sampler=sampler)
+
+    handler(make_environ("/orders/1/"), lambda *args: None)
+    handler(make_environ("/orders/2/"), lambda *args: None)
+    sampler.sample()
+
+    assert os.listdir(prof_path) == []
+    samples = sampler.get_samples()
+    assert list(samples) == ["/orders/<int:pk>/"]
+    ((stack, count),) = samples["/orders/<int:pk>/"].items()
+    assert count == 4
+    # sampled from the request thread itself, so sample() is on the stack
+    assert [code.co_name for code in stack] == ["application", "sample"]
+
+    out = StringIO()
+    sampler.write_collapsed(out)
+    line = out.getvalue()
+    assert line.startswith("/orders/<int:pk>/;application (")
+    assert line.endswith(" 4\n")
+
+
+def test_stack_sampler_speedscope(prof_path, urlconf):
+    sampler = StackSampler(hz=50)
+    handler = ProfilerHandler(sampled_application(sampler), prof_path, sampler=sampler)
+    handler(make_environ("/orders/1/"), lambda *args: None)
+
+    filename = os.path.join(prof_path, "profile.speedscope.json")
+    sampler.dump(filename, "speedscope")
+
+    with open(filename) as f:
+        data = json.load(f)
+    frames = data["shared"]["frames"]
+    assert [frame["name"] for frame in frames] == ["application", "sample"]
+    (profile,) = data["profiles"]
+    assert profile["name"] == "/orders/<int:pk>/"
+    assert profile["samples"] == [[0, 1]]
+    assert profile["weights"] == [0.04]
+    assert os.listdir(prof_path) == ["profile.speedscope.json"]
+
+
+def test_stack_sampler_thread(urlconf):
+    sampler = StackSampler(hz=1000)
+    sampler.start()
+    try:
+        sampler.begin("busy")
+        deadline = time.monotonic() + 5
+        while not sampler.get_samples() and time.monotonic() < deadline:
+            sum(range(1000))
+        sampler.end()
+    finally:
+        sampler.stop()
+
+    assert "busy" in sampler.get_samples()
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    for duration in range(1, 101):
+        histogram.add(duration)
+
+    assert histogram.count == 100
+    assert histogram.percentile(50) == pytest.approx(50, rel=0.05)
+    assert histogram.percentile(95) == pytest.approx(95, rel=0.05)
+    assert histogram.percentile(99) == pytest.approx(99, rel=0.05)
+    assert histogram.percentile(100) == 100
+    assert LatencyHistogram().percentile(50) == 0
+
+
+def test_atomic_write(prof_path):
+    path = os.path.join(prof_path, "summary.txt")
+    with atomic_write(path) as first, atomic_write(path) as second:
+        assert first.name != second.name
+        first.write("first")
+        second.write("second")
+    with open(path) as f:
+        assert f.read() == "first"
+
+    with pytest.raises(ValueError):
+        with atomic_write(path) as f:
+            f.write("partial")
+            raise ValueError
+    assert os.listdir(prof_path) == ["summary.txt"]
+
+
+def test_profile_dumper():
+    dumped = threading.Event()
+    dumper = ProfileDumper(dumped.set)
+    dumper.start()
+    dumper.request()
+    assert dumped.wait(5)
+
+    dumped.clear()
+    dumper.stop()
+    assert not dumper.is_alive()
+    assert not dumped.is_set()
+
+
+def test_pattern_filename():
+    assert pattern_filename("/orders/<int:pk>/") == "orders.int.pk.86f6d6c9.prof"
+    assert pattern_filename("/") == "root.42099b4a.prof"
+
+
+def test_pattern_filename_collisions():
+    patterns = ["/a/<b>/", "/a/b/", "/a.b", UNRESOLVED_PATTERN, "/unresolved/"]
+    assert len({pattern_filename(pattern) for pattern in patterns}) == len(patterns)
+
+
+def test_profiler_handler_aggregate(prof_path, urlconf):
+    aggregator = ProfileAggregator()
+    handler = ProfilerHandler(application, prof_path, aggregator=aggregator)
+
+    for pk in range(3):
+        handler(make_environ("/orders/%d/" % pk), lambda *args: None)
+    handler(make_environ("/customers/"), lambda *args: None)
+
+    assert os.listdir(prof_path) == []
+    assert aggregator.latencies["/orders/<int:pk>/"].count == 3
+    assert aggregator.latencies[UNRESOLVED_PATTERN].count == 1
+    stats = aggregator.stats["/orders/<int:pk>/"]
+    ((func, (cc, nc, tt, ct, callers)),) = [
+        item for item in stats.stats.items() if item[0][2] == "application"
+    ]
+    assert nc == 3
+
+    aggregator.dump_stats(prof_path)
+    assert sorted(os.listdir(prof_path)) == [
+        "orders.int.pk.86f6d6c9.prof",
+        "unresolved.6d432a95.prof",
+    ]
+    dumped = pstats.Stats(os.path.join(prof_path, "orders.int.pk.86f6d6c9.prof"))
+    assert dumped.stats[func][1] == 3
+
+    out = StringIO()
+    aggregator.write_summary(out, top=2)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("URL pattern")
+    assert lines[0].split()[-2:] == ["max", "ms"]
+    assert lines[1].split()[:2] == ["/orders/<int:pk>/", "3"]
+    assert lines[2].split()[:2] == [UNRESOLVED_PATTERN, "1"]
+    header = lines.index("/orders/<int:pk>/: 3 requests, 3 profiled")
+    assert lines[header + 1].split() == ["ncalls", "tottime", "cumtime", "function"]
+    assert lines[header + 4] == ""
+
+
+def test_sampling_records_latencies(prof_path, urlconf):
+    sampler = StackSampler(hz=50)
+    aggregator = ProfileAggregator()
+    handler = ProfilerHandler(
+        sampled_application(sampler), prof_path, sampler=sampler, aggregator=aggregator
+    )
+    handler(make_environ("/orders/1/"), lambda *args: None)
+
+    assert aggregator.latencies["/orders/<int:pk>/"].count == 1
+    assert aggregator.stats == {}
+
+
+@pytest.mark.parametrize(
+    "drop_policy,kept",
+    [("newest", ["a", "b"]), ("oldest", ["b", "c"])],
+)
+def test_profile_writer_drop_policy(drop_policy, kept):
+    writer = ProfileWriter(queue_size=2, drop_policy=drop_policy)
+    done = []
+
+    assert writer.submit(partial(done.append, "a"))
+    assert writer.submit(partial(done.append, "b"))
+    assert writer.submit(partial(done.append, "c")) == (drop_policy == "oldest")
+    writer.start()
+    writer.flush()
+
+    assert done == kept
+    assert writer.submitted == 3
+    assert writer.dropped == 1
+
+
+def test_profiler_handler_writer(prof_path, urlconf):
+    writer = ProfileWriter()
+    aggregator = ProfileAggregator()
+    threads = set()
+
+    def save_profile(self, *args):
+        threads.add(threading.current_thread())
+        return original_save_profile(self, *args)
+
+    original_save_profile = ProfilerHandler.save_profile
+    handler = ProfilerHandler(application, prof_path, writer=writer)
+    aggregate_handler = ProfilerHandler(
+        application, prof_path, aggregator=aggregator, writer=writer
+    )
+    with patch.object(ProfilerHandler, "save_profile", save_profile):
+        handler(make_environ("/orders/1/"), lambda *args: None)
+        aggregate_handler(make_environ("/orders/1/"), lambda *args: None)
+        # nothing is written until the writer runs
+        assert os.listdir(prof_path) == []
+        assert aggregator.latencies["/orders/<int:pk>/"].count == 1
+        assert aggregator.stats == {}
+        writer.start()
+        writer.flush()
+
+    assert threads == {writer}
+    (filename,) = os.listdir(prof_path)
+    assert filename.startswith("orders.1.")
+    assert aggregator.profiled["/orders/<int:pk>/"] == 1
+
+
+def test_profiler_handler_exclude_paths(settings):
+    settings.MEDIA_URL = "/media/"
+    settings.STATIC_URL = "/static/"
+
+    handler = ProfilerHandler(application, "/tmp", no_media=True)
+    assert handler.exclude_paths == ("/media/", "/static/")
+    assert not handler.should_profile("/static/app.css", {})
+    assert handler.should_profile("/orders/1/", {})
+    assert ProfilerHandler(application, "/tmp").exclude_paths == ()
+
+    aggregator = ProfileAggregator()
+    handler = ProfilerHandler(application, "/tmp", no_media=True, aggregator=aggregator)
+    handler(make_environ("/static/app.css"), lambda *args: None)
+    assert aggregator.latencies == {}
+
+
+@pytest.mark.parametrize(
+    "kwargs,requests,profiled",
+    [
+        ({"every": 2}, [("/orders/1/", {})] * 5, 3),
+        (
+            {"path_re": re.compile(r"^/orders/\d+/$")},
+            [("/orders/1/", {}), ("/customers/", {})],
+            1,
+        ),
+        (
+            {"header": "X-Profile"},
+            [("/orders/1/", {"HTTP_X_PROFILE": "1"}), ("/orders/2/", {})],
+            1,
+        ),
+    ],
+)
+def test_profiler_handler_triggers(urlconf, kwargs, requests, profiled):
+    aggregator = ProfileAggregator()
+    handler = ProfilerHandler(application, "/tmp", aggregator=aggregator, **kwargs)
+
+    for path_info, headers in requests:
+        handler(dict(make_environ(path_info), **headers), lambda *args: None)
+
+    assert sum(aggregator.profiled.values()) == profiled
+    # the latency of every request is recorded, profiled or not
+    histograms = aggregator.latencies.values()
+    assert sum(histogram.count for histogram in histograms) == len(requests)
+
+
+def test_profiler_handler_min_duration(prof_path, urlconf):
+    aggregator = ProfileAggregator()
+    handler = ProfilerHandler(
+        application, prof_path, aggregator=aggregator, min_duration=60000
+    )
+    handler(make_environ("/orders/1/"), lambda *args: None)
+    ProfilerHandler(application, prof_path, min_duration=60000)(
+        make_environ("/orders/1/"), lambda *args: None
+    )
+
+    # the duration is measured, the profile discarded
+    assert aggregator.latencies["/orders/<int:pk>/"].count == 1
+    assert aggregator.profiled == {}
+    assert os.listdir(prof_path) == []
+
+
+@pytest.mark.parametrize(
+    "args,message",
+    [
+        (["--profile-every=0"], "--profile-every must be a positive integer"),
+        (["--only-path=orders/("], "Invalid --only-path regular expression"),
+        (["--sampling", "--min-duration=100"], "--min-duration cannot be used"),
+        (["--trace-memory"], "--trace-memory requires --nothreading"),
+    ],
+)
+def test_invalid_triggers(args, message):
+    with pytest.raises(CommandError, match=message):
+        call_command("runprofileserver", *args)
+
+
+def query_application(environ, start_response):
+    User.objects.count()
+    User.objects.exists()
+    start_response("200 OK", [])
+    return [b"OK"]
+
+
+@pytest.mark.django_db()
+def test_request_metrics_sql():
+    metrics = RequestMetrics(sql=True)
+
+    with metrics.record():
+        User.objects.count()
+        User.objects.exists()
+    User.objects.count()
+
+    assert metrics.queries == 2
+    assert metrics.sql_ms > 0
+    assert metrics.as_dict() == {
+        "sql": {"queries": 2, "time_ms": metrics.sql_ms},
+    }
+
+
+def test_request_metrics_memory():
+    metrics = RequestMetrics(sql=False, memory=True)
+    tracemalloc.start()
+    try:
+        with metrics.record():
+            data = [str(i) for i in range(10000)]
+    finally:
+        tracemalloc.stop()
+
+    assert len(data) == 10000
+    assert metrics.memory_peak > 100000
+    site, size = metrics.allocations[0]
+    assert site.startswith(__file__.rstrip("c"))
+    assert size > 100000
+    assert list(metrics.as_dict()) == ["memory"]
+
+
+def test_request_metrics_memory_not_tracing():
+    metrics = RequestMetrics(sql=False, memory=True)
+    with metrics.record():
+        pass
+
+    assert metrics.memory_peak is None
+    assert metrics.as_dict() == {}
+
+
+@pytest.mark.django_db()
+def test_profiler_handler_writes_metrics(prof_path):
+    handler = ProfilerHandler(query_application, prof_path, trace_sql=True)
+
+    handler(make_environ("/orders/1/"), lambda *args: None)
+
+    metrics, prof = sorted(os.listdir(prof_path))
+    assert prof.endswith(".prof")
+    assert metrics == prof[: -len(".prof")] + ".json"
+    with open(os.path.join(prof_path, metrics)) as f:
+        assert json.load(f)["sql"]["queries"] == 2
+
+
+@pytest.mark.django_db()
+def test_profiler_handler_aggregates_metrics(prof_path, urlconf):
+    aggregator = ProfileAggregator()
+    handler = ProfilerHandler(
+        query_application, prof_path, aggregator=aggregator, trace_sql=True
+    )
+
+    handler(make_environ("/orders/1/"), lambda *args: None)
+    handler(make_environ("/orders/2/"), lambda *args: None)
+
+    assert aggregator.measured["/orders/<int:pk>/"]["requests"] == 2
+    assert aggregator.measured["/orders/<int:pk>/"]["queries"] == 4
+    out = StringIO()
+    aggregator.write_summary(out)
+    lines = out.getvalue().splitlines()
+    header = lines.index(
+        "%-40s %8s %10s %10s %10s"
+        % ("URL pattern", "measured", "queries", "sql ms", "peak KB")
+    )
+    assert lines[header + 1].split()[:3] == ["/orders/<int:pk>/", "2", "2.0"]
+    assert lines[header + 1].split()[-1] == "-"
+
+
+def test_sampling_with_kcachegrind():
+    with pytest.raises(CommandError, match="--kcachegrind cannot be used"):
+        call_command("runprofileserver", "--sampling", "--kcachegrind")
+
+
+def test_aggregate_with_kcachegrind():
+    with pytest.raises(CommandError, match="--kcachegrind cannot be used"):
+        call_command("runprofileserver", "--aggregate", "--kcachegrind")
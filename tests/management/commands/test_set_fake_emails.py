@@ -2,6 +2,8 @@ from io import StringIO
 
 from django.core.management import call_command, CommandError
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from django_extensions.management.commands.set_fake_emails import Command
 
@@ -173,6 +175,86 @@ def test_exclude_regexp(capsys, settings):
     assert all(email.endswith("@example.com") for email in emails)
 
 
+@pytest.mark.django_db()
+def test_email_template_single_update(capsys, settings):
+    settings.DEBUG = True
+
+    with CaptureQueriesContext(connection) as queries:
+        call_command(
+            "set_fake_emails",
+            "--email=%(first_name)s.%(last_name)s+%(username)s%%1@example.com",
+        )
+    out, err = capsys.readouterr()
+    assert "Changed 3 emails" in out
+
+    updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+    assert len(updates) == 1
+    assert User.objects.get(username="Gabriel").email == (
+        "Gabriel Garcia.Marquéz+Gabriel%1@example.com"
+    )
+
+
+@pytest.mark.django_db()
+def test_email_template_single_update_with_groups(capsys, settings):
+    settings.DEBUG = True
+
+    with CaptureQueriesContext(connection) as queries:
+        call_command(
+            "set_fake_emails",
+            "--email=%(username)s@example.com",
+            "--include-groups=Attendees",
+        )
+    out, err = capsys.readouterr()
+    assert "Changed 2 emails" in out
+
+    (update,) = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+    # the subqueries read the membership table, never the updated one
+    assert 'FROM "auth_user"' not in update
+    assert "auth_user_groups" in update
+    assert set(
+        User.objects.filter(email__endswith="@example.com").values_list(
+            "is_superuser", flat=True
+        )
+    ) == {False}
+
+    call_command(
+        "set_fake_emails",
+        "--email=%(username)s@example.org",
+        "--exclude-groups=Attendees",
+    )
+    out, err = capsys.readouterr()
+    assert "Changed 1 emails" in out
+    assert set(
+        User.objects.filter(email__endswith="@example.org").values_list(
+            "is_superuser", flat=True
+        )
+    ) == {True}
+
+
+@pytest.mark.django_db()
+def test_email_template_fallback_in_chunks(capsys, settings):
+    settings.DEBUG = True
+
+    call_command(
+        "set_fake_emails",
+        "--email=%(username).3s@example.com",
+        "--exclude-groups=Attendees",
+        "--chunk-size=2",
+    )
+    out, err = capsys.readouterr()
+    assert "Changed 1/1 emails" in out
+    assert "Changed 1 emails" in out
+    assert User.objects.get(username="Mijail").email == "Mij@example.com"
+
+    call_command(
+        "set_fake_emails", "--email=%(username).3s@example.com", "--chunk-size=2"
+    )
+    out, err = capsys.readouterr()
+    assert "Changed 2/3 emails" in out
+    assert "Changed 3/3 emails" in out
+    assert User.objects.get(username="Gabriel").email == "Gab@example.com"
+
+
 def test_without_debug(settings):
     settings.DEBUG = False
 
@@ -1,9 +1,14 @@
+import json
 import os
+import shutil
+import tempfile
 
 import pytest
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
 from django.core.management import call_command, CommandError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.test.utils import override_settings
 from io import StringIO
 
@@ -61,6 +66,10 @@ class SyncDataExceptionsTests(TestCase):
 class SyncDataTests(TestCase):
     """Tests for syncdata command."""
 
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
     @patch("sys.stdout", new_callable=StringIO)
     def test_should_print_No_fixtures_found_if_fixture_labels_not_provided(
         self, m_stdout
@@ -99,3 +108,122 @@ class SyncDataTests(TestCase):
         self.assertTrue(User.objects.filter(username="jdoe").exists())
         self.assertEqual(User.objects.count(), 1)
         self.assertIn("Installed 1 object from 1 fixture", m_stdout.getvalue())
+
+    def write_users_fixture(self, users):
+        fixture = tempfile.NamedTemporaryFile(
+            "w", suffix=".json", delete=False, dir=self.tmpdir
+        )
+        with fixture:
+            json.dump(
+                [
+                    {
+                        "model": "auth.user",
+                        "pk": pk,
+                        "fields": {
+                            "username": username,
+                            "password": "",
+                            "date_joined": "2019-01-19T13:37:26Z",
+                            "groups": groups,
+                        },
+                    }
+                    for pk, username, groups in users
+                ],
+                fixture,
+            )
+        return fixture.name
+
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_should_update_existing_objects_in_batches(self, m_stdout):
+        User.objects.all().delete()
+        group = Group.objects.create(name="staff")
+        User.objects.create(pk=1, username="old")
+        User.objects.create(pk=5, username="extra").groups.add(group)
+        fixture = self.write_users_fixture(
+            [(1, "new", [group.pk]), (2, "bar", []), (3, "baz", [group.pk])]
+        )
+
+        call_command("syncdata", fixture, batch_size=2, verbosity=1)
+
+        self.assertEqual(
+            list(User.objects.order_by("pk").values_list("pk", "username")),
+            [(1, "new"), (2, "bar"), (3, "baz")],
+        )
+        self.assertEqual(sorted(group.user_set.values_list("pk", flat=True)), [1, 3])
+        self.assertIn("Deleted 1 user\n", m_stdout.getvalue())
+        self.assertIn("Installed 3 objects from 1 fixture", m_stdout.getvalue())
+
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_should_not_query_per_object(self, m_stdout):
+        User.objects.all().delete()
+        User.objects.bulk_create(
+            [User(pk=pk, username="old%d" % pk) for pk in range(1, 51)]
+        )
+        fixture = self.write_users_fixture(
+            [(pk, "user%d" % pk, []) for pk in range(26, 76)]
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command("syncdata", fixture, batch_size=1000, verbosity=1)
+
+        self.assertLess(len(queries), 20)
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(User.objects.get(pk=26).username, "user26")
+        self.assertIn("Deleted 25 users\n", m_stdout.getvalue())
+
+    def test_should_remove_objects_before_saving(self):
+        User.objects.all().delete()
+        User.objects.create(pk=7, username="jdoe")
+        fixture = self.write_users_fixture([(3, "jdoe", [])])
+
+        call_command("syncdata", fixture, remove_before=True, verbosity=0)
+
+        self.assertEqual(list(User.objects.values_list("pk", flat=True)), [3])
+
+    def test_should_raise_CommandError_when_batch_size_is_not_positive(self):
+        with pytest.raises(CommandError, match="--batch-size"):
+            call_command("syncdata", "users.json", batch_size=0, verbosity=0)
+
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_should_only_write_changed_objects(self, m_stdout):
+        User.objects.all().delete()
+        group = Group.objects.create(name="staff")
+        fixture = self.write_users_fixture(
+            [(1, "foo", []), (2, "bar", []), (3, "baz", [])]
+        )
+        call_command("syncdata", fixture, verbosity=0)
+        User.objects.create(pk=4, username="extra")
+        fixture = self.write_users_fixture(
+            [(1, "foo", []), (2, "renamed", []), (3, "baz", [group.pk]), (5, "new", [])]
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command("syncdata", fixture, verbosity=1)
+
+        self.assertIn(
+            "1 inserted, 2 updated, 1 unchanged, 1 deleted\n", m_stdout.getvalue()
+        )
+        self.assertFalse(
+            [
+                q
+                for q in queries
+                if q["sql"].startswith(("INSERT", "UPDATE")) and "'foo'" in q["sql"]
+            ]
+        )
+        self.assertEqual(User.objects.get(pk=2).username, "renamed")
+        self.assertEqual(list(group.user_set.values_list("pk", flat=True)), [3])
+
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_should_not_write_when_nothing_changed(self, m_stdout):
+        User.objects.all().delete()
+        fixture = self.write_users_fixture([(1, "foo", []), (2, "bar", [])])
+        call_command("syncdata", fixture, verbosity=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command("syncdata", fixture, verbosity=1)
+
+        self.assertIn(
+            "0 inserted, 0 updated, 2 unchanged, 0 deleted\n", m_stdout.getvalue()
+        )
+        self.assertFalse(
+            [q for q in queries if q["sql"].startswith(("INSERT", "UPDATE"))]
+        )
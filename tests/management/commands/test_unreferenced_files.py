@@ -3,6 +3,8 @@ import shutil
 from io import StringIO
 from tempfile import mkdtemp
 
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage, storages
 from django.core.management import CommandError, call_command
 from django.test import TestCase
 from django.test.utils import override_settings
@@ -57,3 +59,166 @@ class UnreferencedFilesTests(TestCase):
             call_command("unreferenced_files")
 
         self.assertNotIn(fn, m_stdout.getvalue())
+
+    def create_file(self, name, size=0):
+        path = os.path.join(self.media_root_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_should_print_unreferenced_files_sorted_with_sizes(self):
+        self.create_file("b/2.txt", 5)
+        self.create_file("a/c/3.txt", 1024)
+        self.create_file("a/1.txt", 10)
+        self.create_file("z.txt", 3)
+        self.create_file("b/image.jpg")
+        Photo.objects.create(photo="b/image.jpg")
+        Photo.objects.create(photo="")
+
+        out = StringIO()
+        err = StringIO()
+        with override_settings(MEDIA_ROOT=self.media_root_dir):
+            with patch("sys.stdout", out):
+                call_command("unreferenced_files", "--sizes", "-j", "3", stderr=err)
+
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "10\t%s" % os.path.join(self.media_root_dir, "a", "1.txt"),
+                "1024\t%s" % os.path.join(self.media_root_dir, "a", "c", "3.txt"),
+                "5\t%s" % os.path.join(self.media_root_dir, "b", "2.txt"),
+                "3\t%s" % os.path.join(self.media_root_dir, "z.txt"),
+            ],
+        )
+        self.assertEqual(err.getvalue(), "4 unreferenced files, 1.0 KB\n")
+
+
+class UnreferencedFilesStorageTests(TestCase):
+    def setUp(self):
+        # Enabled per test so every test gets empty storages.
+        settings_override = override_settings(
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+                "other": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = storages["default"]
+        for name in ["b/2.txt", "a/1.txt", "image.jpg", "a/c/3.txt"]:
+            self.storage.save(name, ContentFile(b"x" * 10))
+        Photo.objects.create(photo="image.jpg")
+
+    def call_command(self, *args):
+        out = StringIO()
+        err = StringIO()
+        with patch("sys.stdout", out):
+            call_command("unreferenced_files", *args, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_should_print_unreferenced_storage_names(self):
+        out, err = self.call_command("--storage=default", "--sizes")
+
+        self.assertEqual(
+            out.splitlines(), ["10\ta/1.txt", "10\ta/c/3.txt", "10\tb/2.txt"]
+        )
+        self.assertEqual(err, "3 unreferenced files, 30 B\n")
+
+    def test_should_only_consider_fields_using_the_storage(self):
+        storages["other"].save("image.jpg", ContentFile(b"x"))
+
+        out, err = self.call_command("--storage=other")
+
+        self.assertEqual(out.splitlines(), ["image.jpg"])
+
+    def test_should_delete_unreferenced_files_in_batches(self):
+        out, err = self.call_command("--delete", "--batch-size=2", "-j", "2")
+
+        self.assertIn("Deleted 3 files\n", err)
+        self.assertEqual(self.storage.listdir("")[1], ["image.jpg"])
+        self.assertEqual(self.storage.listdir("a")[1], [])
+        self.assertEqual(self.storage.listdir("b")[1], [])
+        self.assertFalse(self.storage.exists("a/c/3.txt"))
+
+    def test_should_move_unreferenced_files(self):
+        out, err = self.call_command("--move-to=quarantine")
+        self.assertIn("Moved 3 files to quarantine\n", err)
+        self.assertTrue(self.storage.exists("quarantine/a/c/3.txt"))
+        self.assertFalse(self.storage.exists("a/c/3.txt"))
+        self.assertTrue(self.storage.exists("image.jpg"))
+
+        out, err = self.call_command("--move-to=quarantine")
+        self.assertEqual(out, "")
+
+    def test_should_skip_nested_move_to_directory(self):
+        out, err = self.call_command("--move-to=trash/2024", "--batch-size=1")
+        self.assertIn("Moved 3 files to trash/2024\n", err)
+        self.assertTrue(self.storage.exists("trash/2024/a/c/3.txt"))
+        self.assertFalse(self.storage.exists("trash/2024/trash/2024/a/1.txt"))
+
+        out, err = self.call_command("--move-to=trash/2024")
+        self.assertEqual(out, "")
+        self.assertTrue(self.storage.exists("trash/2024/a/1.txt"))
+
+    def test_should_raise_CommandError_for_unknown_storage(self):
+        with self.assertRaisesRegex(CommandError, "Could not load storage 'foo'"):
+            call_command("unreferenced_files", "--storage=foo")
+
+
+class UnreferencedFilesFileSystemStorageTests(TestCase):
+    def setUp(self):
+        self.media_root_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root_dir)
+        settings_override = override_settings(
+            STORAGES={
+                "default": {
+                    "BACKEND": "django.core.files.storage.FileSystemStorage",
+                    "OPTIONS": {"location": self.media_root_dir},
+                },
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = storages["default"]
+        self.field = Photo._meta.get_field("photo")
+
+    def use_field_storage(self, storage):
+        storage_patch = patch.object(self.field, "storage", storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    def call_command(self, *args):
+        out = StringIO()
+        with patch("sys.stdout", out):
+            call_command("unreferenced_files", *args, stderr=StringIO())
+        return out.getvalue().splitlines()
+
+    def test_should_match_other_storage_instances_by_location(self):
+        self.use_field_storage(FileSystemStorage(location=self.media_root_dir))
+        self.storage.save("image.jpg", ContentFile(b"x"))
+        self.storage.save("unused.jpg", ContentFile(b"x"))
+        Photo.objects.create(photo="image.jpg")
+
+        self.assertEqual(self.call_command("--delete"), ["unused.jpg"])
+        self.assertTrue(self.storage.exists("image.jpg"))
+
+    def test_should_match_storages_in_subdirectories(self):
+        uploads = os.path.join(self.media_root_dir, "uploads")
+        self.use_field_storage(FileSystemStorage(location=uploads))
+        self.storage.save("uploads/image.jpg", ContentFile(b"x"))
+        self.storage.save("image.jpg", ContentFile(b"x"))
+        Photo.objects.create(photo="image.jpg")
+
+        self.assertEqual(self.call_command("--delete"), ["image.jpg"])
+        self.assertTrue(self.storage.exists("uploads/image.jpg"))
+
+    def test_should_refuse_unknown_storages(self):
+        self.use_field_storage(Storage())
+        self.storage.save("image.jpg", ContentFile(b"x"))
+
+        with self.assertRaisesRegex(
+            CommandError, "Cannot tell whether the files of testapp.Photo.photo"
+        ):
+            self.call_command("--delete")
+        self.assertTrue(self.storage.exists("image.jpg"))
@@ -0,0 +1,144 @@
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import override_settings
+
+from django_extensions.management.debug_cursor import (
+    QueryCapture,
+    interpolate_sql,
+    monkey_patch_cursordebugwrapper,
+    sql_fingerprint,
+)
+
+
+def test_sql_fingerprint_normalizes_literals_and_in_lists():
+    assert sql_fingerprint(
+        "SELECT  * FROM t1 WHERE id IN (1, 2, 3) AND name = 'it''s' LIMIT 21"
+    ) == sql_fingerprint("SELECT * FROM t1 WHERE id IN (%s, %s) AND name = %s LIMIT 1")
+
+
+def test_sql_fingerprint_collapses_multi_row_values():
+    assert (
+        sql_fingerprint("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)")
+        == "INSERT INTO t (a, b) VALUES (...)"
+    )
+
+
+def test_interpolate_sql():
+    assert interpolate_sql("SELECT %s, %s", (1, "a")) == "SELECT 1, 'a'"
+    assert interpolate_sql("SELECT 1", None) == "SELECT 1"
+    assert interpolate_sql("SELECT %s", ()) == "SELECT %s"
+    assert interpolate_sql("SELECT %s, %s", (1,)) == "SELECT %s, %s -- params: (1,)"
+
+
+def test_query_capture_ring_buffer():
+    capture = QueryCapture(maxlen=2)
+    capture.record("default", "SELECT 1", None, 1000)
+    capture.record("default", "SELECT %s", (2,), 3000)
+    capture.record("default", "SELECT %s", (3,), 5000)
+
+    assert capture.take_dropped() == 1
+    assert capture.dropped == 0
+    assert [record.params for record in capture.drain()] == [(2,), (3,)]
+    assert capture.drain() == []
+    assert capture.summary() == []
+
+
+def test_query_capture_summary():
+    capture = QueryCapture(mode="summary")
+    capture.record("default", "SELECT 1", None, 1000)
+    capture.record("default", "SELECT %s", (2,), 3000)
+    capture.record("default", "SELECT %s", (3,), 5000)
+
+    assert capture.drain() == []
+    assert capture.summary() == [
+        {
+            "alias": "default",
+            "fingerprint": "SELECT ?",
+            "count": 3,
+            "total_ns": 9000,
+            "p50_ns": 3000,
+            "p95_ns": 5000,
+        }
+    ]
+
+
+def test_query_capture_summary_reservoir_is_bounded():
+    capture = QueryCapture(mode="summary", reservoir_size=10)
+    for i in range(1000):
+        capture.record("default", "SELECT %s", (i,), i)
+
+    (row,) = capture.summary()
+    assert row["count"] == 1000
+    assert row["total_ns"] == sum(range(1000))
+    assert len(capture.aggregates[("default", "SELECT ?")][2]) == 10
+
+
+def test_query_capture_stack_hash():
+    capture = QueryCapture(capture_stack=True)
+    for i in range(2):
+        capture.record("default", "SELECT 1", None, 1000)
+    records = capture.drain()
+
+    assert records[0].stack_hash is not None
+    assert records[0].stack_hash == records[1].stack_hash
+    assert "test_query_capture_stack_hash" in capture.stacks[records[0].stack_hash]
+
+
+def test_query_capture_stacks_are_bounded():
+    capture = QueryCapture(capture_stack=True, max_stacks=2)
+    capture.record("default", "SELECT 1", None, 1000)
+    capture.record("default", "SELECT 2", None, 1000)
+    capture.record("default", "SELECT 3", None, 1000)
+    records = capture.drain()
+
+    assert len(capture.stacks) == 2
+    assert records[0].stack_hash not in capture.stacks
+    assert records[2].stack_hash in capture.stacks
+
+
+@pytest.mark.django_db()
+@override_settings(
+    DJANGO_EXTENSIONS_SQLPARSE_ENABLED=False, DJANGO_EXTENSIONS_PYGMENTS_ENABLED=False
+)
+def test_capture_mode_records_execute_and_executemany():
+    lines = []
+    with monkey_patch_cursordebugwrapper(
+        print_sql=True, print_sql_mode="capture", logger=lines.append
+    ) as capture:
+        User.objects.filter(username="foo").exists()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE auth_user SET first_name = %s WHERE id = %s",
+                [("a", 0), ("b", -1)],
+            )
+        aliases = [record.alias for record in capture.records]
+        many = [record.many for record in capture.records]
+
+    assert aliases == ["default", "default"]
+    assert many == [False, True]
+    output = "\n".join(lines)
+    assert "'foo'" in output
+    assert "[Database: default]" in output
+
+
+@pytest.mark.django_db()
+def test_summary_mode_prints_summary_on_exit():
+    lines = []
+    with monkey_patch_cursordebugwrapper(
+        print_sql=True, print_sql_mode="summary", logger=lines.append
+    ):
+        for i in range(3):
+            User.objects.filter(pk=i).exists()
+
+    assert lines[0].startswith("SQL summary: 3 queries, 1 distinct")
+    assert lines[2].split()[0] == "3"
+    assert "auth_user" in lines[2]
+
+
+def test_unknown_print_sql_mode():
+    with pytest.raises(ImproperlyConfigured):
+        with monkey_patch_cursordebugwrapper(print_sql=True, print_sql_mode="foo"):
+            pass
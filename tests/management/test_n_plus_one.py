@@ -0,0 +1,115 @@
+import pytest
+
+from django.db import connection
+
+from django_extensions.management.debug_cursor import monkey_patch_cursordebugwrapper
+from django_extensions.management.n_plus_one import NPlusOneDetector, suggest_related
+from tests.testapp.models import Club, Name, Note, Person
+
+
+@pytest.fixture
+def people():
+    club = Club.objects.create(name="club")
+    for i in range(5):
+        name = Name.objects.create(name="name %s" % i)
+        person = Person.objects.create(name=name, age=i)
+        person.notes.add(Note.objects.create(note="note %s" % i, club=club))
+    return Person.objects.all()
+
+
+def run_detector(func):
+    lines = []
+    with monkey_patch_cursordebugwrapper(
+        print_sql=True,
+        print_sql_mode="summary",
+        detect_n_plus_one=True,
+        logger=lines.append,
+    ):
+        func()
+    return [line for line in lines if not line.startswith(("SQL summary", " "))], [
+        line.strip() for line in lines if line.startswith("  ")
+    ]
+
+
+@pytest.mark.django_db()
+def test_detects_forward_foreign_key(people):
+    def access_names():
+        for person in Person.objects.all():
+            person.name.name
+
+    headers, details = run_detector(access_names)
+
+    assert "Potential N+1 query: 5 similar queries [Database: default]" in headers
+    assert "Suggestion: use Person.objects.select_related('name')" in details
+    assert any("in access_names" in detail for detail in details)
+
+
+@pytest.mark.django_db()
+def test_detects_many_to_many(people):
+    def access_notes():
+        for person in Person.objects.all():
+            list(person.notes.all())
+
+    headers, details = run_detector(access_notes)
+
+    assert "Suggestion: use Person.objects.prefetch_related('notes')" in details
+
+
+@pytest.mark.django_db()
+def test_detects_reverse_foreign_key(people):
+    def access_people():
+        for name in Name.objects.all():
+            list(name.person_set.all())
+
+    headers, details = run_detector(access_people)
+
+    assert "Suggestion: use Name.objects.prefetch_related('person_set')" in details
+
+
+@pytest.mark.django_db()
+def test_ignores_prefetched_access(people):
+    def access_names():
+        for person in Person.objects.select_related("name"):
+            person.name.name
+        for person in Person.objects.prefetch_related("notes"):
+            list(person.notes.all())
+
+    headers, details = run_detector(access_names)
+
+    assert not any(header.startswith("Potential N+1") for header in headers)
+
+
+def test_detector_groups_by_call_site():
+    lines = []
+    detector = NPlusOneDetector(threshold=3, logger=lines.append)
+    detector.start_unit()
+    for i in range(2):
+        detector.record("default", "SELECT 1 FROM t WHERE id = %s")
+    detector.record("default", "SELECT 1 FROM t WHERE id = %s")
+    assert detector.end_unit() == []
+
+    detector.start_unit()
+    for i in range(3):
+        detector.record("default", "SELECT 1 FROM t WHERE id = %s")
+    problems = detector.end_unit()
+    assert [problem["count"] for problem in problems] == [3]
+    assert lines[0] == "Potential N+1 query: 3 similar queries [Database: default]"
+
+
+def test_detector_fingerprint_cache_is_bounded():
+    detector = NPlusOneDetector(logger=lambda line: None)
+    for i in range(2000):
+        detector.record("default", "SELECT 1 FROM t WHERE id = %d" % i)
+    detector.end_unit()
+    assert detector.fingerprint.cache_info().currsize == 1024
+
+
+@pytest.mark.django_db()
+def test_suggest_related_unknown_table():
+    assert suggest_related("SELECT 1 FROM unknown WHERE unknown.id = %s") is None
+    assert suggest_related("SELECT 1") is None
+    table = connection.ops.quote_name(Name._meta.db_table)
+    assert (
+        suggest_related('SELECT * FROM %s WHERE %s."id" = %%s' % (table, table))
+        == "select_related() on the relation to Name"
+    )
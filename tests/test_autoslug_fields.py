@@ -1,6 +1,8 @@
 import pytest
 
-from django.db import migrations, models
+from unittest import mock
+
+from django.db import migrations, models, transaction
 from django.db.migrations.writer import MigrationWriter
 from django.test import TestCase
 from django.utils.encoding import force_bytes
@@ -260,6 +262,37 @@ class AutoSlugFieldTest(TestCase):
         m.save()
         self.assertEqual(m.slug, "foo-2")
 
+    def test_colliding_slugs_are_checked_with_a_single_query(self):
+        for i in range(49):
+            SluggedTestModel.objects.create(title="foo")
+
+        m = SluggedTestModel(title="foo")
+        with self.assertNumQueries(2):
+            m.save()
+        self.assertEqual(m.slug, "foo-50")
+
+    def test_colliding_slugs_without_batching(self):
+        slug_field = SluggedTestModel._meta.get_field("slug")
+        for i in range(4):
+            SluggedTestModel.objects.create(title="foo")
+
+        m = SluggedTestModel(title="foo")
+        with mock.patch.object(slug_field, "unique_query_batch_size", 1):
+            with self.assertNumQueries(6):
+                m.save()
+        self.assertEqual(m.slug, "foo-5")
+
+    def test_max_slug_attempts_exceeded_in_batches(self):
+        slug_field = SluggedTestModel._meta.get_field("slug")
+        for i in range(4):
+            SluggedTestModel.objects.create(title="foo")
+
+        m = SluggedTestModel(title="foo")
+        with mock.patch.object(slug_field, "max_unique_query_attempts", 5):
+            with mock.patch.object(slug_field, "unique_query_batch_size", 2):
+                with pytest.raises(RuntimeError), transaction.atomic():
+                    m.save()
+
 
 class MigrationTest(TestCase):
     def safe_exec(self, string, value=None):
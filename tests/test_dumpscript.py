@@ -6,7 +6,9 @@ from io import StringIO
 from pathlib import Path
 
 from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from .testapp.models import Name, Note, Person, Club
 
@@ -103,3 +105,154 @@ class DumpScriptTests(TestCase):
 
         # Check if Note is duplicated
         self.assertEqual(Note.objects.filter(note="Django Tips").count(), 2)
+
+    def test_stream(self):
+        n1 = Name.objects.create(name="John")
+        p1 = Person.objects.create(name=n1, age=40)
+        n2 = Name.objects.create(name="Jane")
+        p2 = Person.objects.create(name=n2, age=18)
+        p2.children.add(p1)
+        p1.children.add(p2)
+        p2.notes.add(
+            Note.objects.create(note="This is the first note."),
+            Note.objects.create(note="This is the second note."),
+        )
+        tmp_out = StringIO()
+        call_command("dumpscript", "django_extensions", stdout=tmp_out)
+        stream_out = StringIO()
+        call_command(
+            "dumpscript",
+            "django_extensions",
+            "--stream",
+            "--chunk-size",
+            "1",
+            stdout=stream_out,
+        )
+        self.assertEqual(tmp_out.getvalue(), stream_out.getvalue())
+        ast.parse(stream_out.getvalue())
+
+    def test_stream_extra_imports(self):
+        Note.objects.create(note="Django Tips", club=Club.objects.create(name="Club"))
+        tmp_out = StringIO()
+        call_command("dumpscript", "django_extensions.Note", "--stream", stdout=tmp_out)
+        script = tmp_out.getvalue()
+        ast.parse(script)
+        self.assertLess(
+            script.index("from tests.testapp.models import Club"),
+            script.index("importer.locate_object(Club"),
+        )
+
+    def test_stream_keeps_only_pending_instances(self):
+        from django_extensions.management.commands.dumpscript import ModelCode
+
+        n1 = Name.objects.create(name="John")
+        n2 = Name.objects.create(name="Jane")
+        p1 = Person.objects.create(name=n1, age=40)
+        p2 = Person.objects.create(name=n2, age=18)
+        # p1 refers to p2 which is only defined later on
+        p1.children.add(p2)
+        context = {
+            "__available_models": {Name, Person},
+            "__extra_imports": {},
+        }
+        for name in (n1, n2):
+            context["Name_%s" % name.pk] = "name_%s" % name.pk
+        model_code = ModelCode(
+            Person, context=context, options={"skip_autofield": True}
+        )
+        chunks = list(model_code.iter_lines(chunk_size=1))
+        self.assertEqual(len(chunks), 3)
+        # p2 has nothing left, it is only counted for its empty block
+        self.assertEqual(len(model_code.instances), 2)
+        self.assertEqual(model_code.instances[0].instance, p1)
+        self.assertEqual(model_code.instances[1], 1)
+
+    def test_stream_keeps_empty_blocks(self):
+        for name in ("John", "Jane", "Joe"):
+            Person.objects.create(name=Name.objects.create(name=name), age=40)
+        tmp_out = StringIO()
+        call_command("dumpscript", "django_extensions", stdout=tmp_out)
+        stream_out = StringIO()
+        call_command(
+            "dumpscript",
+            "django_extensions",
+            "--stream",
+            "--chunk-size",
+            "2",
+            stdout=stream_out,
+        )
+        self.assertEqual(tmp_out.getvalue(), stream_out.getvalue())
+        # one empty block for each person when re-processing Person
+        self.assertIn(
+            "    # Re-processing model: tests.testapp.models.Person\n\n\n\n\n",
+            stream_out.getvalue(),
+        )
+
+    def _count_dumpscript_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command("dumpscript", "django_extensions.Person", stdout=StringIO())
+        return len(queries)
+
+    def test_related_objects_fetched_in_bulk(self):
+        club = Club.objects.create(name="Club")
+
+        def create_people(count):
+            for i in range(count):
+                person = Person.objects.create(
+                    name=Name.objects.create(name="Person %d" % i), age=i
+                )
+                person.notes.add(Note.objects.create(note="Note %d" % i, club=club))
+
+        create_people(2)
+        num_queries = self._count_dumpscript_queries()
+        create_people(10)
+        self.assertEqual(num_queries, self._count_dumpscript_queries())
+
+    def test_bulk(self):
+        club = Club.objects.create(name="Club Django")
+        people = []
+        for i in range(3):
+            people.append(
+                Person.objects.create(name=Name.objects.create(name="P%d" % i), age=i)
+            )
+            people[-1].notes.add(Note.objects.create(note="Note %d" % i, club=club))
+        people[0].children.add(people[1], people[2])
+
+        dumpscript_path = Path(__file__).parent.parent / "django_extensions" / "scripts"
+        dumpscript_path.mkdir(parents=True, exist_ok=True)
+        self.addCleanup(shutil.rmtree, dumpscript_path)
+        with (dumpscript_path / "test_bulk.py").open("wt") as test:
+            call_command(
+                "dumpscript",
+                "django_extensions.Name",
+                "django_extensions.Note",
+                "django_extensions.Person",
+                "--bulk",
+                "--batch-size",
+                "2",
+                stdout=test,
+            )
+        script = (dumpscript_path / "test_bulk.py").read_text()
+        self.assertIn("importer.batch_size = 2", script)
+        self.assertIn("importer.queue_save(", script)
+        self.assertIn("importer.queue_many_to_many(", script)
+        self.assertNotIn("importer.save_or_locate(", script.split("def import_data")[1])
+
+        Person.objects.all().delete()
+        Note.objects.all().delete()
+        Name.objects.all().delete()
+        call_command("runscript", "test_bulk")
+
+        self.assertEqual(
+            sorted(Person.objects.values_list("name__name", "age")),
+            [("P0", 0), ("P1", 1), ("P2", 2)],
+        )
+        p0 = Person.objects.get(name__name="P0")
+        self.assertEqual(
+            sorted(p0.children.values_list("name__name", flat=True)), ["P1", "P2"]
+        )
+        p1 = Person.objects.get(name__name="P1")
+        self.assertEqual(list(p1.children.values_list("name__name", flat=True)), ["P0"])
+        self.assertEqual(
+            list(p1.notes.values_list("note", "club")), [("Note 1", club.pk)]
+        )
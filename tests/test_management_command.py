@@ -1,24 +1,35 @@
 import os
+import threading
 from unittest import mock
 import logging
 import importlib
 
 from django.core.management import (
+    CommandError,
     call_command,
     find_commands,
     load_command_class,
     BaseCommand,
 )
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Concat
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from io import StringIO
 
 from django_extensions.management.modelviz import use_model, generate_graph_data
 from django_extensions.management.commands.merge_model_instances import (
+    ModelMerger,
     get_model_to_deduplicate,
     get_field_names,
     keep_first_or_last_instance,
 )
-from django_extensions.management.utils import signalcommand
+from django_extensions.management.utils import (
+    compile_template,
+    map_in_threads,
+    signalcommand,
+)
 from . import force_color_support
 from .testapp.models import (
     Person,
@@ -155,6 +166,36 @@ class CommandSignalTests(TestCase):
         self.assertEqual(e_info.exception, CommandSignalTests.post["outcome"])
 
 
+class CompileTemplateTests(TestCase):
+    def test_compile_template(self):
+        fields = ("username", "email")
+        self.assertEqual(compile_template("%(username)s", fields), F("username"))
+        self.assertEqual(compile_template("100%%", fields), Value("100%"))
+        self.assertEqual(compile_template("", fields), Value(""))
+        self.assertIsInstance(compile_template("%(username)s@x", fields), Concat)
+        self.assertIsNone(compile_template("%(password)s", fields))
+        self.assertIsNone(compile_template("%(username)d", fields))
+
+
+class MapInThreadsTests(TestCase):
+    def test_map_in_threads_serial(self):
+        results = map_in_threads(lambda item: threading.current_thread(), [1, 2], 1)
+
+        self.assertEqual(results, [threading.main_thread()] * 2)
+
+    @mock.patch("django_extensions.management.utils.connections")
+    def test_map_in_threads_parallel(self, connections):
+        def double(item):
+            self.assertNotEqual(threading.current_thread(), threading.main_thread())
+            return item * 2
+
+        results = map_in_threads(double, [1, 2, 3], 2, using="other")
+
+        self.assertEqual(results, [2, 4, 6])
+        connections.__getitem__.assert_called_with("other")
+        self.assertEqual(connections.__getitem__.return_value.close.call_count, 3)
+
+
 class CommandClassTests(TestCase):
     def setUp(self):
         management_dir = os.path.join("django_extensions", "management")
@@ -572,6 +613,120 @@ class MergeModelInstancesTests(TestCase):
             lambda: Personality.objects.get(description="Second personality"),
         )
 
+    def test_merge_model_instances_in_bulk(self):
+        note = Note.objects.create(note="Shared note")
+        groups = []
+        for i in range(20):
+            name = Name.objects.create(name="Name %d" % i)
+            persons = [Person.objects.create(name=name, age=i) for _ in range(3)]
+            for person in persons:
+                person.notes.add(note)
+                Permission.objects.create(text="Permission", person=person)
+            groups.append(persons)
+
+        merger = ModelMerger(Person)
+        duplicates = list(merger.find_duplicates(["name"]))
+        self.assertEqual(len(duplicates), 20)
+
+        with CaptureQueriesContext(connection) as queries:
+            merged = merger.get_groups(duplicates, ["name"], "last")
+            deleted = merger.merge(merged)
+
+        self.assertLess(len(queries), 20)
+        self.assertEqual(deleted, 40)
+        for persons in groups:
+            primary = Person.objects.get(name=persons[0].name)
+            self.assertEqual(primary.pk, persons[-1].pk)
+            self.assertEqual(primary.permission_set.count(), 3)
+            self.assertEqual(list(primary.notes.all()), [note])
+
+    def create_duplicates(self):
+        name = Name.objects.create(name="Name")
+        persons = [Person.objects.create(name=name, age=50) for _ in range(3)]
+        for person in persons:
+            Permission.objects.create(text="Permission", person=person)
+        return persons
+
+    def test_merge_model_instances_arguments(self):
+        persons = self.create_duplicates()
+
+        out = StringIO()
+        call_command(
+            "merge_model_instances",
+            "--model=django_extensions.Person",
+            "--fields=name,age",
+            "--keep=last",
+            "--batch-size=1",
+            stdout=out,
+        )
+
+        self.assertEqual(
+            list(Person.objects.values_list("pk", flat=True)), [persons[-1].pk]
+        )
+        self.assertEqual(persons[-1].permission_set.count(), 3)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_merge_model_instances_dry_run(self, m_stdout):
+        self.create_duplicates()
+
+        call_command(
+            "merge_model_instances",
+            "--model=django_extensions.Person",
+            "--fields=name",
+            "--keep=first",
+            "--dry-run",
+        )
+
+        output = m_stdout.getvalue()
+        self.assertIn("Would rewrite 2 rows of testapp.Permission.person\n", output)
+        self.assertNotIn("rows of django_extensions.Person", output)
+        self.assertIn("Would delete 2 model instances.\n", output)
+        self.assertEqual(Person.objects.count(), 3)
+        self.assertEqual(Permission.objects.count(), 3)
+
+    @mock.patch(
+        "django_extensions.management.commands.merge_model_instances.Command.merge_batch"
+    )
+    def test_merge_model_instances_parallel(self, merge_batch):
+        self.create_duplicates()
+        Person.objects.create(name=Name.objects.create(name="Other"), age=50)
+        Person.objects.create(name=Name.objects.get(name="Other"), age=50)
+        threads = []
+
+        def merge(duplicates):
+            threads.append(threading.current_thread())
+            return len(duplicates)
+
+        merge_batch.side_effect = merge
+
+        call_command(
+            "merge_model_instances",
+            "--model=django_extensions.Person",
+            "--fields=name",
+            "--keep=first",
+            "--batch-size=1",
+            "--parallel=2",
+        )
+
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_merge_model_instances_invalid_arguments(self):
+        with self.assertRaisesRegex(CommandError, "has no field named 'nickname'"):
+            call_command(
+                "merge_model_instances",
+                "--model=django_extensions.Person",
+                "--fields=nickname",
+                "--keep=first",
+            )
+        with self.assertRaisesRegex(CommandError, "No installed app"):
+            call_command(
+                "merge_model_instances",
+                "--model=unknown.Person",
+                "--fields=name",
+                "--keep=first",
+            )
+
 
 class RunJobsTests(TestCase):
     """
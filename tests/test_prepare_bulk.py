@@ -0,0 +1,103 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from .testapp.models import (
+    PrepareBulkTestModel,
+    RandomCharTestModelUniqueTogether,
+    SluggedWithUniqueTogetherTestModel,
+)
+
+
+class PrepareBulkTest(TestCase):
+    def test_bulk_create_populates_generated_fields(self):
+        PrepareBulkTestModel.objects.bulk_create(
+            [PrepareBulkTestModel(title="foo") for i in range(5)]
+        )
+
+        objs = PrepareBulkTestModel.objects.order_by("pk")
+        self.assertEqual(
+            [obj.slug for obj in objs], ["foo", "foo-2", "foo-3", "foo-4", "foo-5"]
+        )
+        self.assertEqual(len({obj.random_char_field for obj in objs}), 5)
+        self.assertTrue(all(len(obj.random_char_field) == 8 for obj in objs))
+        self.assertEqual(len({obj.uuid_field for obj in objs}), 5)
+
+    def test_bulk_create_continues_existing_slugs(self):
+        PrepareBulkTestModel.objects.create(title="foo")
+        PrepareBulkTestModel.objects.create(title="foo")
+
+        PrepareBulkTestModel.objects.bulk_create(
+            [
+                PrepareBulkTestModel(title="foo"),
+                PrepareBulkTestModel(title="bar"),
+                PrepareBulkTestModel(title="foo"),
+            ]
+        )
+
+        self.assertEqual(
+            list(PrepareBulkTestModel.objects.order_by("pk").values_list("slug")),
+            [("foo",), ("foo-2",), ("foo-3",), ("bar",), ("foo-4",)],
+        )
+
+    def test_bulk_create_uses_constant_number_of_queries(self):
+        for i in range(20):
+            PrepareBulkTestModel.objects.create(title="foo")
+
+        objs = [PrepareBulkTestModel(title="foo") for i in range(50)]
+        objs += [PrepareBulkTestModel(title="bar %s" % i) for i in range(100)]
+        # slug: original slugs + one window of suffixes, random chars: one
+        # round, inserts: one query
+        with self.assertNumQueries(4):
+            PrepareBulkTestModel.objects.bulk_create(objs)
+
+        self.assertEqual(PrepareBulkTestModel.objects.count(), 170)
+        self.assertEqual(objs[49].slug, "foo-70")
+
+    def test_random_char_collisions_are_resolved(self):
+        existing = PrepareBulkTestModel.objects.create(title="foo")
+        values = iter([existing.random_char_field, "aaaaaaaa", "aaaaaaaa", "bbbbbbbb"])
+        with mock.patch(
+            "django_extensions.db.fields.get_random_string",
+            side_effect=lambda *args: next(values),
+        ):
+            objs = PrepareBulkTestModel.objects.prepare_bulk(
+                [PrepareBulkTestModel(title="foo"), PrepareBulkTestModel(title="foo")]
+            )
+
+        self.assertEqual(
+            [obj.random_char_field for obj in objs], ["bbbbbbbb", "aaaaaaaa"]
+        )
+
+    def test_prepared_values_are_kept_on_save(self):
+        obj = PrepareBulkTestModel.objects.prepare_bulk(
+            [PrepareBulkTestModel(title="foo")]
+        )[0]
+        obj.title = "bar"
+        random_char_field = obj.random_char_field
+        obj.save()
+
+        self.assertEqual(obj.slug, "foo")
+        self.assertEqual(obj.random_char_field, random_char_field)
+
+    def test_prepare_bulk_respects_unique_together(self):
+        SluggedWithUniqueTogetherTestModel.objects.create(title="foo", category="a")
+        objs = [
+            SluggedWithUniqueTogetherTestModel(title="foo", category="a"),
+            SluggedWithUniqueTogetherTestModel(title="foo", category="b"),
+            SluggedWithUniqueTogetherTestModel(title="foo", category="b"),
+        ]
+        SluggedWithUniqueTogetherTestModel._meta.get_field("slug").prepare_bulk(objs)
+        SluggedWithUniqueTogetherTestModel.objects.bulk_create(objs)
+
+        self.assertEqual([obj.slug for obj in objs], ["foo-2", "foo", "foo-2"])
+
+    def test_random_char_max_attempts_exceeded(self):
+        field = RandomCharTestModelUniqueTogether._meta.get_field("random_char_field")
+        objs = [RandomCharTestModelUniqueTogether(common_field="bbb")]
+        with mock.patch(
+            "django_extensions.db.fields.get_random_string", return_value="aaa"
+        ):
+            RandomCharTestModelUniqueTogether.objects.create(common_field="bbb")
+            with self.assertRaises(RuntimeError):
+                field.prepare_bulk(objs)
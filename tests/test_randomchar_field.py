@@ -1,4 +1,5 @@
 import string
+import time
 import pytest
 
 from django.test import TestCase
@@ -108,3 +109,108 @@ class RandomCharFieldTest(TestCase):
             m.common_field = "bbb"
             with pytest.raises(RuntimeError):
                 m.save()
+
+    def testRandomCharFieldChecksOneCandidateUntilCollision(self):
+        field = RandomCharTestModelUnique._meta.get_field("random_char_field")
+        with mock.patch.object(field, "_occupancy", {}):
+            m = RandomCharTestModelUnique()
+            with self.assertNumQueries(2):
+                m.save()
+            assert field._occupancy == {}
+
+    def testRandomCharFieldEstimatesOccupancyOnCollision(self):
+        field = RandomCharTestModelUnique._meta.get_field("random_char_field")
+        with mock.patch.object(field, "_occupancy", {}):
+            m = RandomCharTestModelUnique()
+            m.save()
+            with mock.patch(
+                "django_extensions.db.fields.RandomCharField.random_char_generator"
+            ) as func:
+                func.return_value = iter([m.random_char_field, "aaa"])
+                m = RandomCharTestModelUnique()
+                m.save()
+            assert m.random_char_field == "aaa"
+            ((timestamp, count),) = field._occupancy.values()
+            assert count == 1
+
+    def testRandomCharFieldBatchSizeScalesWithOccupancy(self):
+        field = RandomCharTestModelUnique._meta.get_field("random_char_field")
+        m = RandomCharTestModelUnique()
+        key = field.get_occupancy_scope(m)[1]
+        keyspace = 62**8
+        for rows, expected in ((0, 1), (keyspace // 2, 10), (keyspace, 100)):
+            occupancy = {key: (time.monotonic(), rows)}
+            with mock.patch.object(field, "_occupancy", occupancy):
+                assert field.get_unique_query_batch_size(m) == expected
+
+    def testRandomCharFieldEstimatesOccupancyPerUniqueScope(self):
+        field = RandomCharTestModelUniqueTogether._meta.get_field("random_char_field")
+        for common_field in ("aaa", "aaa", "bbb"):
+            RandomCharTestModelUniqueTogether.objects.create(common_field=common_field)
+        keyspace = 62**8
+        with mock.patch.object(field, "_occupancy", {}):
+            for common_field, rows in (("aaa", 2), ("bbb", 1), ("ccc", 0)):
+                m = RandomCharTestModelUniqueTogether(common_field=common_field)
+                assert field.estimate_occupancy(m) == rows / keyspace
+            assert len(field._occupancy) == 3
+            assert (
+                field.get_unique_query_batch_size(
+                    RandomCharTestModelUniqueTogether(common_field="ddd")
+                )
+                == 1
+            )
+
+            with mock.patch.object(field, "occupancy_cache_size", 2):
+                field.estimate_occupancy(
+                    RandomCharTestModelUniqueTogether(common_field="ddd")
+                )
+                assert len(field._occupancy) == 2
+
+    def testRandomCharFieldChecksCandidateBatchWithOneQuery(self):
+        field = RandomCharTestModelUnique._meta.get_field("random_char_field")
+        existing = [RandomCharTestModelUnique() for i in range(3)]
+        for m in existing:
+            m.save()
+        with mock.patch.object(field, "unique_query_batch_size", 5):
+            with mock.patch(
+                "django_extensions.db.fields.RandomCharField.random_char_generator"
+            ) as func:
+                func.return_value = iter(
+                    [m.random_char_field for m in existing] + ["aaa", "bbb"]
+                )
+                m = RandomCharTestModelUnique()
+                with self.assertNumQueries(2):
+                    m.save()
+        assert m.random_char_field == "aaa"
+
+    def testRandomCharFieldCaseDistinctCandidates(self):
+        field = RandomCharTestModelUnique._meta.get_field("random_char_field")
+        RandomCharTestModelUnique.objects.create()
+        RandomCharTestModelUnique.objects.update(random_char_field="aaaaaaaa")
+        with mock.patch.object(field, "is_unique_case_insensitive", return_value=False):
+            with mock.patch.object(field, "unique_query_batch_size", 5):
+                with mock.patch(
+                    "django_extensions.db.fields.RandomCharField.random_char_generator"
+                ) as func:
+                    func.return_value = iter(["aaaaaaaa", "AAAAAAAA"])
+                    m = RandomCharTestModelUnique()
+                    m.save()
+                    assert m.random_char_field == "AAAAAAAA"
+
+                    func.side_effect = lambda chars: iter(
+                        ["aaaaaaaa", "AAAAAAAA", "bbbbbbbb", "BBBBBBBB"]
+                    )
+                    instances = [RandomCharTestModelUnique() for i in range(2)]
+                    field.prepare_bulk(instances)
+        assert [i.random_char_field for i in instances] == ["bbbbbbbb", "BBBBBBBB"]
+
+    def testRandomCharFieldCaseInsensitiveCollation(self):
+        field = RandomCharTestModelUnique._meta.get_field("random_char_field")
+        with mock.patch.object(field, "db_collation", "utf8mb4_0900_ai_ci"):
+            assert field.is_unique_case_insensitive(
+                RandomCharTestModelUnique.objects.all()
+            )
+        with mock.patch.object(field, "db_collation", "C"):
+            assert not field.is_unique_case_insensitive(
+                RandomCharTestModelUnique.objects.all()
+            )
@@ -1,6 +1,9 @@
+import json
+import os
 from unittest import mock
 import pytest
 from io import StringIO
+from tempfile import TemporaryDirectory
 
 from django.conf import settings
 from django.apps import apps
@@ -66,6 +69,237 @@ class SqlDiffTests(TestCase):
     def test_sql_diff_with_proxy_models(self):
         self._include_proxy_models_testing(True)
 
+    def _sql_diff_output(self, *args):
+        options = self.parser.parse_args(args=self.args + list(args))
+        out = StringIO()
+        instance = SqliteSQLDiff(
+            apps.get_models(include_auto_created=True),
+            vars(options),
+            stdout=out,
+            stderr=self.tmp_err,
+        )
+        instance.load()
+        instance.find_differences()
+        instance.print_diff()
+        return instance, out.getvalue()
+
+    @pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3",
+        reason="Test can only run on sqlite3",
+    )
+    def test_sql_diff_parallel_same_as_serial(self):
+        serial, serial_output = self._sql_diff_output()
+        parallel, parallel_output = self._sql_diff_output("--parallel", "4")
+        self.assertEqual(serial.differences, parallel.differences)
+        self.assertEqual(serial_output, parallel_output)
+
+    @pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3",
+        reason="Test can only run on sqlite3",
+    )
+    def test_sql_diff_parallel_uses_worker_connections(self):
+        instance = SqliteSQLDiff(
+            apps.get_models(include_auto_created=True),
+            dict(vars(self.options), parallel=3),
+            stdout=self.tmp_out,
+            stderr=self.tmp_err,
+        )
+        instance.load()
+        with mock.patch.object(
+            instance, "introspect_partition", wraps=instance.introspect_partition
+        ) as introspect_partition:
+            introspected = instance.introspect_tables(instance.db_tables)
+        self.assertEqual(introspect_partition.call_count, 3)
+        self.assertEqual(set(introspected), set(instance.db_tables))
+
+    def _sql_diff_snapshot(self, path, *args):
+        return self._sql_diff_output("--snapshot", path, *args)
+
+    @pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3",
+        reason="Test can only run on sqlite3",
+    )
+    def test_sql_diff_offline_same_as_online(self):
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "schema.json")
+            online, online_output = self._sql_diff_snapshot(path)
+            online.write_schema_snapshot()
+            with open(path) as f:
+                snapshot = json.load(f)
+            self.assertIn(SqlDiff._meta.db_table, snapshot["tables"])
+            self.assertTrue(snapshot["tables"][SqlDiff._meta.db_table]["hash"])
+
+            options = self.parser.parse_args(
+                args=self.args + ["--snapshot", path, "--offline"]
+            )
+            out = StringIO()
+            offline = SqliteSQLDiff(
+                apps.get_models(include_auto_created=True),
+                vars(options),
+                stdout=out,
+                stderr=self.tmp_err,
+            )
+            with self.assertNumQueries(0):
+                offline.load_offline()
+                offline.find_differences()
+            offline.print_diff()
+        self.assertEqual(online.differences, offline.differences)
+        self.assertEqual(online_output, out.getvalue())
+
+    @pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3",
+        reason="Test can only run on sqlite3",
+    )
+    def test_sql_diff_incremental(self):
+        table_name = SqlDiff._meta.db_table
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "schema.json")
+            full, full_output = self._sql_diff_snapshot(path)
+            full.write_schema_snapshot()
+
+            with mock.patch.object(
+                SqliteSQLDiff, "introspect_table", autospec=True
+            ) as introspect_table:
+                unchanged, unchanged_output = self._sql_diff_snapshot(
+                    path, "--incremental"
+                )
+            introspect_table.assert_not_called()
+            self.assertEqual(unchanged.stale_tables, [])
+            self.assertEqual(full_output, unchanged_output)
+
+            # a changed catalog signature marks just that table as stale
+            with open(path) as f:
+                snapshot = json.load(f)
+            snapshot["signature"] = None
+            snapshot["tables"][table_name]["signature"] = "changed"
+            with open(path, "w") as f:
+                json.dump(snapshot, f)
+            with mock.patch.object(
+                SqliteSQLDiff,
+                "introspect_table",
+                autospec=True,
+                side_effect=SqliteSQLDiff.introspect_table,
+            ) as introspect_table:
+                changed, changed_output = self._sql_diff_snapshot(path, "--incremental")
+            self.assertEqual(changed.stale_tables, [table_name])
+            self.assertEqual(introspect_table.call_count, 1)
+            self.assertEqual(full.differences, changed.differences)
+
+    @pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3",
+        reason="Test can only run on sqlite3",
+    )
+    def test_sql_diff_snapshot_keeps_other_apps(self):
+        def write_snapshot(path, app_label):
+            options = self.parser.parse_args(args=[app_label, "--snapshot", path])
+            instance = SqliteSQLDiff(
+                apps.get_app_config(app_label).get_models(include_auto_created=True),
+                vars(options),
+                stdout=self.tmp_out,
+                stderr=self.tmp_err,
+            )
+            instance.load()
+            instance.find_differences()
+            instance.write_schema_snapshot()
+            with open(path) as f:
+                return json.load(f)["tables"]
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "schema.json")
+            write_snapshot(path, "auth")
+            tables = write_snapshot(path, "testapp")
+        self.assertIn(SqlDiff._meta.db_table, tables)
+        self.assertIn("auth_user", tables)
+
+    @pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3",
+        reason="Test can only run on sqlite3",
+    )
+    def test_sql_diff_snapshot_hash_mismatch(self):
+        table_name = SqlDiff._meta.db_table
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "schema.json")
+            full, full_output = self._sql_diff_snapshot(path)
+            full.write_schema_snapshot()
+            with open(path) as f:
+                snapshot = json.load(f)
+            snapshot["tables"][table_name]["description"]["rows"].pop()
+            with open(path, "w") as f:
+                json.dump(snapshot, f)
+
+            options = self.parser.parse_args(
+                args=self.args + ["--snapshot", path, "--offline"]
+            )
+            offline = SqliteSQLDiff(
+                apps.get_models(include_auto_created=True),
+                vars(options),
+                stdout=self.tmp_out,
+                stderr=self.tmp_err,
+            )
+            offline.load_offline()
+            offline.find_differences()
+            self.assertIn(
+                (
+                    "error",
+                    (
+                        "unable to introspect table: table does not match its "
+                        "schema snapshot hash",
+                    ),
+                ),
+                [
+                    (diff_type, tuple(str(arg) for arg in args))
+                    for app_label, model_name, diffs in offline.differences
+                    for diff_type, args in diffs
+                ],
+            )
+
+            incremental, incremental_output = self._sql_diff_snapshot(
+                path, "--incremental"
+            )
+            self.assertEqual(incremental.stale_tables, [table_name])
+            self.assertEqual(full.differences, incremental.differences)
+
+    def test_postgresql_offline_array_field_missing_from_snapshot(self):
+        instance = PostgresqlSQLDiff(
+            apps.get_models(include_auto_created=True),
+            vars(self.options),
+            stdout=self.tmp_out,
+            stderr=self.tmp_err,
+        )
+        instance.offline = True
+        instance.cursor = None
+        instance.column_types = {}
+        instance.add_app_model_marker("testapp", "SqlDiff")
+        field = mock.Mock(db_column=None, attname="tags")
+        with mock.patch(
+            "django_extensions.management.commands.sqldiff.SQLDiff.get_field_db_type",
+            return_value="integer[]",
+        ):
+            db_type = instance.get_field_db_type(
+                ("tags", 1007), field, SqlDiff._meta.db_table
+            )
+        self.assertIsNone(db_type)
+        self.assertEqual(
+            instance.differences[-1][-1],
+            [("comment", ("Type of array field 'tags' missing from schema snapshot",))],
+        )
+
+    def test_postgresql_parallel_warning(self):
+        options = dict(vars(self.options), parallel=2)
+        instance = PostgresqlSQLDiff(
+            apps.get_models(include_auto_created=True),
+            options,
+            stdout=self.tmp_out,
+            stderr=self.tmp_err,
+        )
+        instance.cursor = None
+        instance.table_descriptions = {"table": []}
+        instance.table_constraints = {"table": {}}
+        self.assertEqual(
+            instance.introspect_tables(["table"]), {"table": ({}, [], None)}
+        )
+        self.assertIn("--parallel has no effect on PostgreSQL", self.tmp_err.getvalue())
+
     def test_format_field_names(self):
         instance = MySQLDiff(
             apps.get_models(include_auto_created=True),
@@ -185,3 +419,77 @@ class SqlDiffTests(TestCase):
             """select 1 as "foo", 1 + 1 as "BAR";""", []
         )
         self.assertEqual(postgresql_dict, [{"BAR": 2, "foo": 1}])
+
+    def test_postgresql_snapshot_description(self):
+        instance = PostgresqlSQLDiff(
+            apps.get_models(include_auto_created=True),
+            vars(self.options),
+            stdout=self.tmp_out,
+            stderr=self.tmp_err,
+        )
+        rows = [
+            ("title", 1043, -1, 104, False, None, None, False, None),
+            ("body", 25, -1, -1, False, None, None, False, None),
+            ("price", 1700, -1, (10 << 16) + 2 + 4, True, None, None, False, None),
+            ("created", 1184, 8, 3, False, None, None, False, None),
+            ("id", 23, 4, -1, False, None, None, True, None),
+        ]
+        fields = ("display_size", "internal_size", "precision", "scale")
+
+        def describe(psycopg3):
+            with mock.patch.object(instance, "is_psycopg3", return_value=psycopg3):
+                descriptions = [instance.get_snapshot_description(row) for row in rows]
+            return [tuple(desc[field] for field in fields) for desc in descriptions]
+
+        self.assertEqual(
+            describe(psycopg3=True),
+            [
+                (100, None, None, None),
+                (None, None, None, None),
+                (None, None, 10, 2),
+                (8, 8, 3, None),
+                (4, 4, None, None),
+            ],
+        )
+        self.assertEqual(
+            describe(psycopg3=False),
+            [
+                (100, 100, None, None),
+                (-1, -1, None, None),
+                (10, 10, 10, 2),
+                (8, 8, None, None),
+                (4, 4, None, None),
+            ],
+        )
+        description = instance.get_snapshot_description(rows[-1])
+        self.assertTrue(description["is_autofield"])
+        self.assertFalse(description["null_ok"])
+
+    @pytest.mark.skipif(
+        settings.DATABASES["default"]["ENGINE"] != "django.db.backends.postgresql",
+        reason="Test can only run on postgresql",
+    )
+    def test_postgresql_snapshot_introspection(self):
+        from django.db import connection
+
+        instance = PostgresqlSQLDiff(
+            apps.get_models(include_auto_created=True),
+            vars(self.options),
+            stdout=self.tmp_out,
+            stderr=self.tmp_err,
+        )
+        instance.load()
+        table_name = SqlDiff._meta.db_table
+        with self.assertNumQueries(0):
+            introspected = instance.introspect_tables([table_name])
+        table_constraints, table_description, error = introspected[table_name]
+        self.assertIsNone(error)
+        with connection.cursor() as cursor:
+            self.assertEqual(
+                table_constraints,
+                connection.introspection.get_constraints(cursor, table_name),
+            )
+            self.assertEqual(
+                table_description,
+                connection.introspection.get_table_description(cursor, table_name),
+            )
@@ -10,7 +10,11 @@ from django_extensions.db.fields import (
     ShortUUIDField,
 )
 from django_extensions.db.fields.json import JSONField
-from django_extensions.db.models import ActivatorModel, TimeStampedModel
+from django_extensions.db.models import (
+    ActivatorModel,
+    PrepareBulkManager,
+    TimeStampedModel,
+)
 
 from .fields import UniqField
 
@@ -338,6 +342,18 @@ class FKSluggedTestModelCallable(models.Model):
         app_label = "django_extensions"
 
 
+class PrepareBulkTestModel(models.Model):
+    title = models.CharField(max_length=42)
+    slug = AutoSlugField(populate_from="title", unique=True)
+    random_char_field = RandomCharField(length=8, unique=True)
+    uuid_field = ShortUUIDField()
+
+    objects = PrepareBulkManager()
+
+    class Meta:
+        app_label = "django_extensions"
+
+
 class JSONFieldTestModel(models.Model):
     a = models.IntegerField()
     j_field = JSONField()